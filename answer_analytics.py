@@ -0,0 +1,121 @@
+"""Per-question answer analytics.
+
+Every submitted answer becomes one compact AnswerEvent, appended to
+answers.csv by a background BatchWriter. Events carry the exact inputs of
+their reward (response time, time limit, correctness and the question's
+base value), so past answers can be rescored under other rules (see
+rescoring.py). AnswerAnalytics folds the log into running per-question
+aggregates: accuracy, a fixed-bin response-time histogram (for quantiles)
+and how often each option was picked. Queries only fold in the rows
+appended since the last query, by any process, so the instructor page
+never rescans the whole log.
+"""
+import threading
+from collections import namedtuple
+
+from csv_log import append_rows, read_rows
+
+ANSWERS_FILE = "answers.csv"
+FIELDS = [
+    "player", "category", "question", "choice", "correct", "response_time", "reward", "timestamp",
+    "value", "max_time",
+]
+RT_BIN = 0.5  # seconds per response-time bin
+RT_BINS = 60  # bins cover 0-30 s; slower answers go in the last one
+
+# choice is the option index, or -1 when nothing was picked; value is the
+# question's base value and max_time the answer's time limit.
+# response_time is written unrounded.
+AnswerEvent = namedtuple("AnswerEvent", FIELDS)
+
+
+class AnswerLog:
+    """Append-only CSV of answer events."""
+
+    def __init__(self, path=ANSWERS_FILE):
+        self.path = path
+
+    def add_many(self, events):
+        append_rows(self.path, FIELDS, (
+            [e.player, e.category, e.question, e.choice, int(e.correct),
+             repr(float(e.response_time)), e.reward, f"{e.timestamp:.3f}", e.value, e.max_time]
+            for e in events
+        ))
+
+    def events(self, offset=0):
+        """Yield (end offset, AnswerEvent) for every complete row from offset on."""
+        for offset, fields in read_rows(self.path, offset):
+            if fields == FIELDS:
+                continue
+            player, category, question, choice, correct, rt, reward, ts, value, max_time = fields
+            yield offset, AnswerEvent(
+                player, category, int(question), int(choice), correct == "1",
+                float(rt), int(reward), float(ts), int(value), float(max_time),
+            )
+
+
+class QuestionStats:
+    """Running aggregates for one question."""
+
+    __slots__ = ("answered", "correct", "reward_total", "rt_bins", "choices")
+
+    def __init__(self):
+        self.answered = 0
+        self.correct = 0
+        self.reward_total = 0
+        self.rt_bins = [0] * RT_BINS
+        self.choices = {}  # option index (-1 = no answer) -> count
+
+    def add(self, event):
+        self.answered += 1
+        self.correct += event.correct
+        self.reward_total += event.reward
+        self.rt_bins[min(RT_BINS - 1, max(0, int(event.response_time / RT_BIN)))] += 1
+        self.choices[event.choice] = self.choices.get(event.choice, 0) + 1
+
+    @property
+    def accuracy(self):
+        return self.correct / self.answered if self.answered else 0.0
+
+    def rt_quantile(self, q):
+        """Response-time quantile, interpolated inside its histogram bin."""
+        if not self.answered:
+            return 0.0
+        rank = q * self.answered
+        seen = 0
+        for i, c in enumerate(self.rt_bins):
+            if c and seen + c >= rank:
+                return (i + (rank - seen) / c) * RT_BIN
+            seen += c
+        return RT_BINS * RT_BIN
+
+
+class AnswerAnalytics:
+    """Per-question aggregates over the answer log; safe to share between sessions."""
+
+    def __init__(self, log):
+        self.log = log
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._stats = {}  # (category, question position) -> QuestionStats
+
+    def _catch_up(self):
+        for offset, event in self.log.events(self._offset):
+            key = (event.category, event.question)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QuestionStats()
+            stats.add(event)
+            self._offset = offset
+
+    def question(self, category, index):
+        """QuestionStats for one question (empty if never answered)."""
+        with self._lock:
+            self._catch_up()
+            return self._stats.get((category, index)) or QuestionStats()
+
+    def answered(self, category):
+        """(question position, QuestionStats) for every answered question of a category."""
+        with self._lock:
+            self._catch_up()
+            return sorted((i, stats) for (cat, i), stats in self._stats.items() if cat == category)
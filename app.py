@@ -1,747 +1,947 @@
-import time
+import hmac
 import os
-import csv
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
-import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit_autorefresh import st_autorefresh
 
+import game_clock
+from answer_analytics import AnswerAnalytics, AnswerLog
+from capital_ledger import CapitalLedger
+from game_data import get_game_data
+from game_engine import MAX_TIME, WRONG_PENALTY_FACTOR, GameEngine, GameError
+from leaderboard_cache import LeaderboardCache
+from leaderboard_store import open_store
+from leaderboard_writer import BatchWriter, LeaderboardWriter
+from live_round import LiveRound
+from load_monitor import LoadMonitor
+from metrics import METRICS_FILE, METRICS_FLUSH_INTERVAL, METRICS_PORT, metrics
+from player_state import PlayerState
+from session_store import SessionStore
+from username_registry import UsernameRegistry
+from warmup import warm_up
+
 st.set_page_config(page_title="Entrepreneurial Finance Quiz", page_icon="💰")
+RERUN_STARTED = time.perf_counter()
 
 # -------------------------
 # CONSTANTS
 # -------------------------
-MAX_TIME = 20  # seconds per question
-WRONG_PENALTY_FACTOR = 0.3  # lose 30% of base value on wrong answer
-LEADERBOARD_FILE = "leaderboard.csv"
+# "client": the browser animates the countdown and the server is only woken
+# on submit or when the deadline passes. "server": the old 200 ms reruns.
+TIMER_MODE = os.environ.get("TIMER_MODE", "client")
+LEADERBOARD_SIZE = 100  # rows shown on the leaderboard page
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")  # unlocks admin-only panels
+INSTRUCTOR_MIN_ANSWERS = 20  # answers needed before a question is flagged
+TOO_EASY_ACCURACY = 0.9
+TOO_HARD_ACCURACY = 0.3
+# Refresh intervals in ms at normal load; they stretch up to the max under load
+SERVER_TIMER_INTERVAL, SERVER_TIMER_MAX = 200, 2000  # TIMER_MODE="server" countdown
+POLL_INTERVAL, POLL_MAX = 2000, 10000  # live/leaderboard fallback when sessions cannot be pushed
+HOST_INTERVAL, HOST_MAX = 1000, 5000  # live round host's answer tally
 
 
 # -------------------------
-# SESSION STATE INIT
+# SHARED RESOURCES
 # -------------------------
-if "inventory" not in st.session_state:
-    st.session_state.inventory = []
+@st.cache_resource
+def get_leaderboard_store():
+    """One leaderboard store per server process, shared by all sessions."""
+    return open_store()
+
+
+@st.cache_resource
+def get_leaderboard_cache():
+    """Versioned leaderboard views, rebuilt only after new scores are committed."""
+    return LeaderboardCache(get_leaderboard_store())
+
+
+@st.cache_resource
+def get_leaderboard_writer():
+    """Background thread that batches leaderboard writes for this process."""
+    # Writes go through the cache so each committed batch bumps its version
+    return LeaderboardWriter(get_leaderboard_cache())
+
+
+@st.cache_resource
+def get_answer_writer():
+    """Background thread appending answer events to the answer log."""
+    return BatchWriter(AnswerLog(), name="answer-writer")
+
+
+@st.cache_resource
+def get_answer_analytics():
+    """Per-question aggregates over the answer log, shared by all sessions."""
+    return AnswerAnalytics(AnswerLog())
+
+
+@st.cache_resource
+def get_capital_ledger():
+    """Player balances replayed from the capital ledger, shared by all sessions."""
+    return CapitalLedger()
+
+
+@st.cache_resource
+def get_ledger_writer():
+    """Background thread group-committing capital changes to the ledger."""
+    return BatchWriter(get_capital_ledger(), name="ledger-writer", retries=None)
+
 
-if "equipped" not in st.session_state:
-    st.session_state.equipped = None
+@st.cache_resource
+def get_session_store():
+    """Debounced player snapshots, shared by all sessions."""
+    return SessionStore()
 
-if "page" not in st.session_state:
-    st.session_state.page = "quiz"
 
-if "index" not in st.session_state:
-    st.session_state.index = 0
+@st.cache_resource
+def get_username_registry():
+    """Taken player names, loaded once per server process."""
+    return UsernameRegistry(get_leaderboard_store())
 
-if "money" not in st.session_state:
-    st.session_state.money = 0
 
-if "show_result" not in st.session_state:
-    st.session_state.show_result = False
+@st.cache_resource
+def get_live_round():
+    """The host-driven live round, shared by every session of this process."""
+    return LiveRound(MAX_TIME, WRONG_PENALTY_FACTOR)
 
-if "last_correct" not in st.session_state:
-    st.session_state.last_correct = False
 
-if "last_reward" not in st.session_state:
-    st.session_state.last_reward = 0
+@st.cache_resource
+def get_engine():
+    """The game rules over this process's shared resources."""
+    return GameEngine(
+        get_leaderboard_cache(),
+        get_leaderboard_writer(),
+        get_answer_writer(),
+        get_capital_ledger(),
+        get_ledger_writer(),
+        get_session_store(),
+        get_username_registry(),
+        get_live_round(),
+    )
+
+
+@st.cache_resource
+def get_load_monitor():
+    """Server-wide rerun latency and active sessions, for adaptive refresh."""
+    return LoadMonitor()
 
-if "question_start_time" not in st.session_state:
-    st.session_state.question_start_time = None
 
-if "has_answered" not in st.session_state:
-    st.session_state.has_answered = False
+@st.cache_resource
+def start_metrics_exporters():
+    """Start the metrics file flusher / HTTP endpoint once per process."""
+    metrics.start_exporters(METRICS_FILE, METRICS_FLUSH_INTERVAL, METRICS_PORT)
 
-if "category" not in st.session_state:
-    st.session_state.category = None  # quiz category
 
-if "username" not in st.session_state:
-    st.session_state.username = None
+@st.cache_resource
+def start_warm_up():
+    """Warm the shared caches on a background thread, once per process."""
+    thread = threading.Thread(
+        target=warm_up,
+        args=(get_leaderboard_store(), get_username_registry(), LEADERBOARD_SIZE,
+              get_capital_ledger(), get_leaderboard_cache().ranks),
+        name="warm-up",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
 
-if "saved_this_round" not in st.session_state:
-    st.session_state.saved_this_round = False
+start_metrics_exporters()
+start_warm_up()
 
 
 # -------------------------
-# SIDEBAR MENU
+# SESSION STATE INIT
 # -------------------------
-st.sidebar.title("Menu")
-st.session_state.page = st.sidebar.radio(
-    "Go to:",
-    ("quiz", "store", "avatar", "leaderboard"),
-    format_func=lambda x: x.capitalize()
-)
+with metrics.timer("session_init"):
+    if "player" not in st.session_state:
+        st.session_state.player = PlayerState()
 
-# ---------------------------
-# USERNAME LOGIN SCREEN
-# ---------------------------
-if st.session_state.username is None:
-    st.title("🎮 Welcome to Time is Money!")
-    st.subheader("Please enter your player name to begin")
-
-    name_input = st.text_input("Your player name:")
+    if "page" not in st.session_state:
+        st.session_state.page = "quiz"
 
-    if st.button("Continue"):
-        if name_input.strip() != "":
-            chosen_name = name_input.strip()
+    if "is_admin" not in st.session_state:
+        st.session_state.is_admin = False
 
-            # Ensure unique name by checking leaderboard.csv
-            if os.path.exists(LEADERBOARD_FILE):
-                df = pd.read_csv(LEADERBOARD_FILE)
-                existing = df["username"].tolist()
-            else:
-                existing = []
-
-            # Generate increment if necessary
-            base = chosen_name
-            suffix = 1
-            while chosen_name in existing:
-                chosen_name = f"{base} ({suffix})"
-                suffix += 1
-
-            st.session_state.username = chosen_name
-            st.success(f"Welcome, {chosen_name}!")
-            #st.experimental_rerun()
-            st.rerun()
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
+player = st.session_state.player
+metrics.count_rerun(st.session_state.session_id)
 
-    st.stop()
 
 # -------------------------
-# QUESTION CATEGORIES
+# SESSION PERSISTENCE
 # -------------------------
-question_categories = {
-    "Balance Sheet": [
-        {
-            "question": "What is the accounting equation?",
-            "options": [
-                "Assets = Revenue + Expenses",
-                "Assets = Liabilities + Equity",
-                "Liabilities = Assets + Equity",
-                "Equity = Assets * Liabilities",
-            ],
-            # Correct: Assets = Liabilities + Equity -> index 1
-            "answer": 1,
-            "value": 600,
-            "explanation": (
-                "The accounting equation is Assets = Liabilities + Equity. "
-                "Assets are what the business owns, funded by liabilities (what it owes) "
-                "and equity (the owners' claim on the assets)."
-            ),
-        },
-        {
-            "question": "What are the main sections of a balance sheet?",
-            "options": [
-                "Revenue, Expenses, Profit",
-                "Assets, Liabilities, Equity",
-                "Cash Flow, Income, Expenses",
-                "Investments, Dividends, Retained Earnings",
-            ],
-            # Correct: Assets, Liabilities, Equity -> index 1
-            "answer": 1,
-            "value": 500,
-            "explanation": (
-                "A balance sheet is split into Assets, Liabilities, and Equity, "
-                "reflecting the accounting equation."
-            ),
-        },
-        {
-            "question": "Given total assets of 500.000 and total liabilities of 350.000, what is owner's equity?",
-            "options": [
-                "850.000",
-                "350.000",
-                "150.000",
-                "500.000",
-            ],
-            # Equity = Assets - Liabilities = 150.000 -> index 2
-            "answer": 2,
-            "value": 500,
-            "explanation": (
-                "Using Assets = Liabilities + Equity, rearrange to Equity = Assets − Liabilities: "
-                "500.000 − 350.000 = 150.000."
-            ),
-        },
-        {
-            "question": "Which of the following is classified as a current asset on a balance sheet?",
-            "options": [
-                "Buildings",
-                "Accounts receivable",
-                "Long-term loans payable",
-                "Intangible assets",
-            ],
-            "answer": 1,
-            "value": 500,
-            "explanation": (
-                "Accounts receivable are expected to be converted to cash within the year."
-            ),
-        },
-    ],
-    "Cash Flow Management": [
-        {
-            "question": "What is the primary purpose of a cash flow statement?",
-            "options": [
-                "To determine employee productivity",
-                "To monitor the inflow and outflow of cash",
-                "To track inventory levels",
-                "To calculate net profit",
-            ],
-            # Correct: monitor inflow/outflow of cash -> index 1
-            "answer": 1,
-            "value": 700,
-            "explanation": "A cash flow statement tracks how cash moves in and out of the business.",
-        },
-        {
-            "question": "Which financial metric helps assess a startup’s ability to meet short-term obligations?",
-            "options": [
-                "Current Ratio",
-                "Debt-to-equity ratio",
-                "Gross margin",
-                "Return on investment (ROI)",
-            ],
-            # Correct: Current Ratio -> index 0
-            "answer": 0,
-            "value": 600,
-            "explanation": "The current ratio compares current assets to current liabilities.",
-        },
-        {
-            "question": "Operating cash flow differs from free cash flow because free cash flow:",
-            "options": [
-                "Excludes depreciation",
-                "Includes capital expenditures deducted",
-                "Does not account for working capital changes",
-                "Measures revenue only",
-            ],
-            # Correct: includes capex deducted -> index 1
-            "answer": 1,
-            "value": 600,
-            "explanation": (
-                "Free cash flow = Operating cash flow − Capital expenditures, "
-                "showing cash available to grow the business or return to investors."
-            ),
-        },
-        {
-            "question": "Which action is the most effective for improving a company’s short-term cash flow",
-            "options": [
-                "Increasing long-term capital investments",
-                "Negotiating longer payment terms with suppliers",
-                "Lowering product prices",
-                "Hiring additional staff",
-            ],
-            
-            "answer": 1,
-            "value": 600,
-            "explanation": (
-                "negotiating longer payment terms delays cash outflows and improves short term cash flow."
-                ),
-        },
-
-    ],
-    "Startup Finance": [
-        {
-            "question": "Which of the following is a common source of early-stage funding for startups?",
-            "options": [
-                "Corporate bonds",
-                "Angel investors",
-                "Initial Public Offering (IPO)",
-                "Venture capital",
-            ],
-            # Early stage: Angel investors -> index 1
-            "answer": 1,
-            "value": 800,
-            "explanation": "Angel investors often fund very early-stage startups before VCs enter.",
-        },
-        {
-            "question": "What is the role of equity financing in a startup?",
-            "options": [
-                "To repay existing loans",
-                "To reduce operating expenses",
-                "To raise capital in exchange for ownership",
-                "To increase product prices",
-            ],
-            # Correct: raise capital for ownership -> index 2
-            "answer": 2,
-            "value": 500,
-            "explanation": "Equity financing gives investors shares in exchange for capital.",
-        },
-        {
-            "question": "What does 'burn rate' typically refer to?",
-            "options": [
-                "Interest paid on bank loans",
-                "Monthly cash spent by the startup",
-                "Money raised from investors monthly",
-                "The percentage of profits reinvested into the business",
-            ],
-            # Correct: raise capital for ownership -> index 2
-            "answer": 1,
-            "value": 500,
-            "explanation": "Burn rate represents how quickly a startup spends money each month. It is key metric in deciding the need for future investments.",
-        },
-            {
-            "question": "Which of the following is a common reason a startup uses debt financing instead of equity?",
-            "options": [
-                "To avoid paying any interest",
-                "Because the company cannot yet generate revenue",
-                "To avoid giving up ownership",
-                "Because debt is always cheaper than ownership loss",
-            ],
-            
-            "answer": 2,
-            "value": 500,
-            "explanation": "Debt financing lets startups raise funds while keeping equity intact, though it must be repaid with interest.",
-        },
-    ],
-    "Venture Capital and Equity Dilution": [
-        {
-            "question": (
-                "A startup founder owns 100 pct. of 1,000,000 shares. They take a Series A investment that values "
-                "the company at 10 million post-money and gives the investor 20 pct. of the company. "
-                "How many new shares were issued in this round?"
-            ),
-            "options": [
-                "250.000 new shares",
-                "200.000 new shares",
-                "125.000 new shares",
-                "500.000 new shares",
-            ],
-            # Solve 0.2 = x / (1,000,000 + x) => x = 250,000 -> index 0
-            "answer": 0,
-            "value": 700,
-            "explanation": (
-                "0.2 = x / (1,000,000 + x) leads to x = 250,000 new shares, which is 20% post-money."
-            ),
-        },
-        {
-            "question": (
-                "A founder owns 60 pct. of the company before a funding round. "
-                "The new investor purchases 25 pct. of the company in the round. "
-                "What is the founder's ownership percentage immediately after this funding round?"
-            ),
-            "options": [
-                "48%",
-                "50%",
-                "35%",
-                "45%",
-            ],
-            # Founder keeps 60% of remaining 75%: 0.6 * 0.75 = 0.45 -> 45% -> index 3
-            "answer": 3,
-            "value": 800,
-            "explanation": "The founder owns 60 pct. of the remaining 75 pct., so 0.6 * 0.75 = 45 pct.",
-        },
-        {
-            "question": (
-                "A VC firm invests 10 million for 20 pct. of a company with a 2x Non-Participating "
-                "Liquidation Preference. If the company is acquired for 15 million, "
-                "how much does the investor receive?"
-            ),
-            "options": [
-                "$20 million",
-                "$3 million",
-                "$10 million",
-                "$15 million",
-            ],
-            # 2x preference is $20m but capped by exit value: $15m -> index 3
-            "answer": 3,
-            "value": 800,
-            "explanation": (
-                "The 2x non-participating preference entitles them to up to 20m, "
-                "but the exit is only 15m, so they get 15m."
-            ),
-        },
-        {
-            "question": (
-                "What is a “term sheet“ in a VC deal?"
-            ),
-            "options": [
-                "A full legally binding contract outlining investment terms",
-                "A description of the company’s financial history and equity standings",
-                "A list of employees and salaries including their stock options",
-                "A non-binding summary of key investment terms",
-            ],
-            
-            "answer": 3,
-            "value": 800,
-            "explanation": (
-                "A term sheet outlines the major terms of an investment before drafting the final legal agreements, it is not legally binding"
-            ),
-        },
-    ],
-    "Income Statement": [
-        {
-            "question": "What does the income statement primarily show?",
-            "options": [
-                "A company's cash inflows and outflows",
-                "A company’s financial position at a specific point in time",
-                "A company’s revenue, expenses, and profit over a period",
-                "How much equity owners have invested in the company"
-            ],
-            "answer": 2,
-            "value": 600,
-            "explanation": "The income statement summarizes revenues and expenses over a period, showing the company’s profit or loss."
-        },
-        {
-            "question": "Gross profit is calculated as:",
-            "options": [
-                "Revenue − Operating Expenses",
-                "Revenue − Cost of Goods Sold",
-                "Net Income − Taxes",
-                "Revenue − Depreciation"
-            ],
-            "answer": 1,
-            "value": 700,
-            "explanation": "Gross profit is revenue minus the direct costs of producing goods (COGS)."
-        },
-        {
-            "question": "Which of the following is considered an operating expense?",
-            "options": [
-                "Interest expense",
-                "Cost of raw materials",
-                "Marketing and administrative expenses",
-                "Income tax expense"
-            ],
-            "answer": 2,
-            "value": 700,
-            "explanation": "Operating expenses include marketing, admin, salaries, rent—costs needed to run daily operations."
-        },
-        {
-            "question": "Net income is best defined as:",
-            "options": [
-                "Revenue minus COGS",
-                "Gross profit minus taxes only",
-                "Revenue minus all expenses including taxes and interest",
-                "Cash received minus cash paid"
-            ],
-            "answer": 2,
-            "value": 800,
-            "explanation": "Net income is revenue minus ALL expenses: COGS, operating expenses, interest, and taxes."
-        }
-    ]
-}
+def resume_session(username, token):
+    """Restore a saved player into this session; returns None if nothing matched."""
+    restored = get_engine().resume(username, token)
+    if restored is None:
+        return None
+    st.session_state.player = restored
+    st.query_params.update(player=username, token=token)
+    return restored
+
+
+# A reconnecting browser keeps its URL, so it can pick up where it left off
+if (
+    player.username is None
+    and "player" in st.query_params
+    and "token" in st.query_params
+):
+    player = resume_session(st.query_params["player"], st.query_params["token"]) or player
+
 
 # -------------------------
-# STORE ITEMS (with Premium)
+# SIDEBAR MENU
 # -------------------------
-store_items = {
-    "Outfits": [
-        {"name": "Classic Suit", "price": 800, "emoji": "🤵"},
-        {"name": "Blue Business Suit", "price": 1200, "emoji": "🕴️"},
-        {"name": "Fancy Investor", "price": 2000, "emoji": "💼"},
-        {"name": "Silicon Valley Hoodie", "price": 500, "emoji": "🧑‍💻"},
-    ],
-    "Premium": [
-        {"name": "LinkedIn Premium Badge", "price": 5000, "emoji": "🔗"},
-        {"name": "Premium Investor Access", "price": 6000, "emoji": "🏛️"},
-    ],
-}
+with metrics.timer("sidebar"):
+    st.sidebar.title("Menu")
+    pages = ("quiz", "live", "store", "avatar", "leaderboard")
+    if st.session_state.is_admin:
+        pages += ("instructor", "host")
+    st.session_state.page = st.sidebar.radio(
+        "Go to:",
+        pages,
+        format_func=lambda x: x.capitalize()
+    )
+
+    if ADMIN_PASSWORD and not st.session_state.is_admin:
+        with st.sidebar.expander("🔑 Admin"):
+            password = st.text_input("Admin password", type="password")
+            if password and hmac.compare_digest(password, ADMIN_PASSWORD):
+                st.session_state.is_admin = True
+                st.rerun()
+
+    if st.session_state.is_admin and metrics.enabled:
+        with st.sidebar.expander("🛠 Debug metrics"):
+            snapshot = metrics.snapshot()
+            st.write(
+                f"This session: {metrics.session_reruns(st.session_state.session_id)} reruns, "
+                f"{player.nbytes()} bytes of game state"
+            )
+            st.write(
+                f"All sessions: {snapshot['reruns']['total']} reruns, "
+                f"{snapshot['reruns']['sessions']} sessions"
+            )
+            load = get_load_monitor()
+            st.write(
+                f"Load: {load.latency * 1000:.0f} ms average rerun, "
+                f"{load.active_sessions()} active sessions, pressure {load.pressure(SERVER_TIMER_INTERVAL):.1f}"
+            )
+            st.dataframe(
+                [
+                    {"section": name, **{k: v for k, v in h.items() if k != "buckets"}}
+                    for name, h in snapshot["sections"].items()
+                ],
+                hide_index=True,
+            )
+
+    if player.resume_token:
+        st.sidebar.caption(f"Resume code: `{player.resume_token}`")
+
+    # Only the server-driven timer refreshes every session periodically
+    if get_load_monitor().degraded(SERVER_TIMER_INTERVAL if TIMER_MODE == "server" else None):
+        st.sidebar.warning(
+            "🐢 The server is busy, so timers and lists refresh less often. "
+            "Rewards still use the exact server time."
+        )
+
+# ---------------------------
+# USERNAME LOGIN SCREEN
+# ---------------------------
+with metrics.timer("page.login"):
+    if player.username is None:
+        st.title("🎮 Welcome to Time is Money!")
+        st.subheader("Please enter your player name to begin")
+
+        name_input = st.text_input("Your player name:")
+
+        if st.button("Continue"):
+            if name_input.strip() != "":
+                # Ensure unique name, adding a " (k)" increment if necessary
+                player = st.session_state.player = get_engine().login(name_input)
+                st.query_params.update(player=player.username, token=player.resume_token)
+                st.success(f"Welcome, {player.username}!")
+                #st.experimental_rerun()
+                st.rerun()
+
+        with st.expander("Continue a previous game"):
+            resume_name = st.text_input("Player name")
+            resume_code = st.text_input("Resume code")
+            if st.button("Resume"):
+                if resume_session(resume_name.strip(), resume_code.strip()):
+                    st.rerun()
+                st.error("No saved game matches that name and code.")
 
+        st.stop()
 
 # -------------------------
 # HELPERS
 # -------------------------
+@contextmanager
+def page(name):
+    """Time a page for the metrics, and the whole rerun for the load monitor."""
+    try:
+        with metrics.timer(f"page.{name}"):
+            yield
+    finally:
+        get_load_monitor().record(st.session_state.session_id, time.perf_counter() - RERUN_STARTED)
+
+
 def get_avatar_emoji():
     """Return the emoji representing the currently equipped outfit, or default avatar."""
-    if st.session_state.equipped:
-        for category_items in store_items.values():
-            for item in category_items:
-                if item["name"] == st.session_state.equipped:
-                    return item["emoji"]
-    return "🧍"
+    item = get_game_data().catalog.get(player.equipped)
+    return item.emoji if item else "🧍"
+
+
+def turn_store_page(step):
+    """Button callback: move the store listing by step pages."""
+    st.session_state.store_page = st.session_state.get("store_page", 1) + step
 
 
 def get_active_questions():
-    """Return the list of questions for the currently selected category."""
-    if st.session_state.category is None:
-        return []
-    return question_categories[st.session_state.category]
+    """Return the questions of the current round."""
+    return get_engine().round_questions(player)
 
 
-def save_to_leaderboard():
-    """Append current user result to leaderboard.csv once per category completion."""
-    if st.session_state.saved_this_round:
+def start_round(category, difficulty=None):
+    """Draw a round of the category's questions (within difficulty) and start it."""
+    try:
+        get_engine().start_round(player, category, difficulty)
+    except GameError as e:
+        st.error(str(e))
+
+
+def leaderboard_frame(rows):
+    """Table of leaderboard rows (already sorted), or None if there are none."""
+    if not rows:
+        return None
+    import pandas as pd  # deferred: only table pages need it
+    return pd.DataFrame(
+        [
+            {
+                "username": r["username"],
+                "capital": r["capital"],
+                "category": r["category"],
+                "played": datetime.fromtimestamp(r["timestamp"]) if r["timestamp"] else None,
+            }
+            for r in rows
+        ],
+        columns=["username", "capital", "category", "played"],
+    )
+
+
+def show_leaderboard(key, query, empty_message):
+    """Render a leaderboard view; query() only runs again after new scores land."""
+    frame = get_leaderboard_cache().get(key, lambda: leaderboard_frame(query()))
+    if frame is None:
+        st.info(empty_message)
         return
+    st.dataframe(frame, hide_index=True)
+
 
-    row = [
-        st.session_state.username,
-        st.session_state.money,
-    ]
+@metrics.timed()
+def save_to_leaderboard():
+    """Record current user result on the leaderboard once per category completion."""
+    get_engine().save_to_leaderboard(player)
 
-    file_exists = os.path.exists(LEADERBOARD_FILE)
 
-    with open(LEADERBOARD_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        # Write header if file is new/empty
-        if not file_exists:
-            writer.writerow(["username", "capital"])
-        writer.writerow(row)
+def show_standing():
+    """The player's rank among all players; a few binary searches, no store read."""
+    standing = get_engine().standing(player)
+    if standing is None:
+        st.caption("Finish a category to get on the leaderboard.")
+        return
+    st.write(
+        f"🏅 Rank **#{standing.rank}** of {standing.players} players "
+        f"(ahead of {standing.percentile:.0f}% of them) with your best of ${standing.capital}"
+    )
+    if standing.above:
+        st.caption(f"⬆️ Next up: {standing.above[0]} (${standing.above[1]})")
+    if standing.below:
+        st.caption(f"⬇️ Right behind you: {standing.below[0]} (${standing.below[1]})")
+
+
+def session_waker():
+    """Callback that pushes a rerun to this browser session; None if the server cannot."""
+    ctx = get_script_run_ctx()
+    if ctx is None or not Runtime.exists():
+        return None
+    runtime = Runtime.instance()
+    session_id = ctx.session_id
+    try:
+        loop = runtime._get_async_objs().eventloop
+    except Exception:
+        return None
+
+    def rerun():
+        info = runtime._session_mgr.get_active_session_info(session_id)
+        if info is not None:
+            info.session.request_rerun(None)
+
+    def wake():
+        if not runtime.is_active_session(session_id):
+            return False  # tab closed; drop the subscription
+        loop.call_soon_threadsafe(rerun)
+        return True
+
+    return wake
+
+
+def follow(subscribers, active, key):
+    """Keep this session subscribed to subscribers while active, else unsubscribe."""
+    if not active:
+        subscribers.discard(st.session_state.session_id)
+        return
+    wake = session_waker()
+    if wake is None:
+        st_autorefresh(interval=get_load_monitor().interval(POLL_INTERVAL, POLL_MAX), key=key)
+    else:
+        subscribers.add(st.session_state.session_id, wake)
 
-    st.session_state.saved_this_round = True
 
+def render_countdown(time_left, base_value, max_time=MAX_TIME):
+    """Draw the timer and reward preview in the browser; it ticks without reruns."""
+    # st.iframe replaces components.html in newer Streamlit releases
+    render = getattr(st, "iframe", components.html)
+    render(
+        f"""
+        <div style="font-family:sans-serif; font-size:16px;">
+            <div style="background:#eee; border-radius:4px; height:8px;">
+                <div id="bar" style="background:#ff4b4b; height:8px; border-radius:4px;"></div>
+            </div>
+            <p>⏱️ Time left: <span id="left"></span> seconds</p>
+            <p>💸 Current reward for a correct answer (if you answer now): <b>$<span id="reward"></span></b></p>
+        </div>
+        <script>
+            const end = Date.now() + {time_left * 1000};
+            function tick() {{
+                const left = Math.max(0, end - Date.now()) / 1000;
+                document.getElementById("bar").style.width = (100 * left / {max_time}) + "%";
+                document.getElementById("left").textContent = left.toFixed(1);
+                document.getElementById("reward").textContent = Math.floor({base_value} * left / {max_time});
+                if (left > 0) setTimeout(tick, 100);
+            }}
+            tick();
+        </script>
+        """,
+        height=110,
+    )
 
 
 # -------------------------
 # GAME LOGIC FUNCTIONS
 # -------------------------
+@metrics.timed()
 def check_answer(choice):
     """Evaluate the answer, update money, and show result."""
-    questions = get_active_questions()
-    q = questions[st.session_state.index]
-    options = q["options"]
+    get_engine().submit_answer(player, choice)
 
-    # Determine correctness safely
-    if choice is None or choice not in options:
-        correct = False
-    else:
-        correct = (options.index(choice) == q["answer"])
 
-    st.session_state.last_correct = correct
-
-    # Time-based reward
-    if st.session_state.question_start_time is None:
-        time_left = 0
-    else:
-        time_passed = time.time() - st.session_state.question_start_time
-        time_left = max(0, MAX_TIME - time_passed)
-
-    base_value = q["value"]
-    reward_if_correct = int(base_value * (time_left / MAX_TIME))
-
-    if correct:
-        # Gain time-scaled reward
-        st.session_state.money += reward_if_correct
-        st.session_state.last_reward = reward_if_correct
-    else:
-        # Lose money on wrong answer (fixed fraction of base value)
-        penalty = int(base_value * WRONG_PENALTY_FACTOR)
-        st.session_state.money -= penalty
-        st.session_state.last_reward = -penalty
-
-    st.session_state.show_result = True
-    st.session_state.has_answered = True
+@metrics.timed()
+def check_live_answer(state, choice):
+    """Score an answer to the live question against the round's shared start time."""
+    get_engine().submit_live_answer(player, state, choice)
 
 
 def next_question():
     """Move to the next question and reset per-question state."""
-    questions = get_active_questions()
-    st.session_state.index += 1
-    st.session_state.show_result = False
-    st.session_state.has_answered = False
-    st.session_state.question_start_time = None
-
-    if st.session_state.index >= len(questions):
-        st.session_state.index = len(questions)
-        st.session_state.show_result = True
+    get_engine().next_question(player)
 
 
 def reset_category():
     """Reset category selection and question progress."""
-    st.session_state.category = None
-    st.session_state.index = 0
-    st.session_state.show_result = False
-    st.session_state.question_start_time = None
-    st.session_state.has_answered = False
-    st.session_state.saved_this_round = False
+    get_engine().reset_category(player)
+
+
+follow(get_live_round().subscribers, st.session_state.page in ("live", "host"), "live_poll")
+follow(get_leaderboard_cache().subscribers, st.session_state.page == "leaderboard", "leaderboard_poll")
 
 
 # -------------------------
 # STORE PAGE
 # -------------------------
 if st.session_state.page == "store":
-    st.header("🛒 Store — Buy Items for Your Avatar")
-
-    st.write(f"Your capital: **${st.session_state.money}**")
-
-    for category, items in store_items.items():
-        st.subheader(f"📂 {category}")
-        for i, item in enumerate(items):
-            st.markdown(f"**{item['emoji']} {item['name']}**")
-            st.write(f"Price: ${item['price']}")
-
-            owned = item["name"] in st.session_state.inventory
+    with page("store"):
+        st.header("🛒 Store — Buy Items for Your Avatar")
+
+        st.write(f"Your capital: **${player.money}**")
+
+        catalog = get_game_data().catalog
+        search_col, category_col = st.columns([2, 1])
+        query = search_col.text_input("Search items", key="store_query").strip()
+        category = category_col.selectbox("Category", ("All", *catalog.categories), key="store_category")
+        price = catalog.price_range()
+        if price[0] < price[1]:
+            price = st.slider("Price", price[0], price[1], price, key="store_price")
+
+        # Only the visible page is rendered; the search itself is indexed and cached
+        filters = (query, None if category == "All" else category, *price)
+        if st.session_state.get("store_filters") != filters:
+            st.session_state.store_filters = filters
+            st.session_state.store_page = 1
+        shown = catalog.page(catalog.search(*filters), st.session_state.store_page)
+        if not shown.total:
+            st.info("No items match your search.")
+
+        shown_category = None
+        for item in shown.items:
+            if item.category != shown_category:
+                shown_category = item.category
+                st.subheader(f"📂 {item.category}")
+            st.markdown(f"**{item.emoji} {item.name}**")
+            st.write(f"Price: ${item.price}")
+
+            owned = player.owns(item.name)
 
             if owned:
                 st.success("Owned ✔")
-                if category == "Outfits":
-                    if st.button(f"Equip {item['name']}", key=f"equip_{category}_{i}"):
-                        st.session_state.equipped = item["name"]
-                        st.success(f"You equipped: {item['name']}")
+                if item.category == "Outfits":
+                    if st.button(f"Equip {item.name}", key=f"equip_{item.id}"):
+                        get_engine().equip(player, item.name)
+                        st.success(f"You equipped: {item.name}")
                 else:
                     st.info("Premium active ✅ (effect to be defined)")
             else:
-                if st.button(f"Buy {item['name']}", key=f"buy_{category}_{i}"):
-                    if st.session_state.money >= item["price"]:
-                        st.session_state.money -= item["price"]
-                        st.session_state.inventory.append(item["name"])
-                        st.success(f"Purchased {item['name']}!")
+                if st.button(f"Buy {item.name}", key=f"buy_{item.id}"):
+                    try:
+                        get_engine().purchase(player, item.name)
+                    except GameError as e:
+                        st.error(str(e))
                     else:
-                        st.error("Not enough capital to buy this.")
+                        st.success(f"Purchased {item.name}!")
 
-    st.stop()
+        if shown.pages > 1:
+            prev_col, info_col, next_col = st.columns(3)
+            prev_col.button("◀ Previous", disabled=shown.number == 1, on_click=turn_store_page, args=(-1,))
+            info_col.write(f"Page {shown.number} of {shown.pages} ({shown.total} items)")
+            next_col.button("Next ▶", disabled=shown.number == shown.pages, on_click=turn_store_page, args=(1,))
+
+        st.stop()
 
 
 # -------------------------
 # AVATAR PAGE
 # -------------------------
 if st.session_state.page == "avatar":
-    st.header("🧍 Your Avatar")
-
-    avatar_emoji = get_avatar_emoji()
-    st.markdown(
-        f"""
-        <h1 style="text-align:center; font-size:90px;">
-            {avatar_emoji}
-        </h1>
-        """,
-        unsafe_allow_html=True,
-    )
+    with page("avatar"):
+        st.header("🧍 Your Avatar")
+
+        avatar_emoji = get_avatar_emoji()
+        st.markdown(
+            f"""
+            <h1 style="text-align:center; font-size:90px;">
+                {avatar_emoji}
+            </h1>
+            """,
+            unsafe_allow_html=True,
+        )
+
+        st.subheader(f"Total capital: ${player.money}")
+
+        if player.equipped:
+            st.write(f"Currently wearing: **{player.equipped}**")
+        else:
+            st.write("Basic outfit equipped. Visit the store to buy hustler clothing!")
+
+        catalog = get_game_data().catalog
+        if any(getattr(catalog.get(name), "category", None) == "Premium" for name in player.inventory):
+            st.write("Premium status: ✅ (effects coming soon)")
+        else:
+            st.write("Premium status: ❌")
+
+        show_standing()
 
-    st.subheader(f"Total capital: ${st.session_state.money}")
-
-    if st.session_state.equipped:
-        st.write(f"Currently wearing: **{st.session_state.equipped}**")
-    else:
-        st.write("Basic outfit equipped. Visit the store to buy hustler clothing!")
-
-    premium_names = [p["name"] for p in store_items["Premium"]]
-    if any(item in st.session_state.inventory for item in premium_names):
-        st.write("Premium status: ✅ (effects coming soon)")
-    else:
-        st.write("Premium status: ❌")
-
-    st.stop()
+        st.stop()
 
 
 # -------------------------
 # LEADERBOARD PAGE
 # -------------------------
 if st.session_state.page == "leaderboard":
-    st.title("🏆 Leaderboard")
-
-    if os.path.exists(LEADERBOARD_FILE):
-        df = pd.read_csv(LEADERBOARD_FILE)
-        # Sort by highest capital
-        df = df.sort_values(by="capital", ascending=False)
-
-        st.write("### Top Players (All Time)")
-        st.dataframe(df)
-    else:
-        st.info("No leaderboard data yet. Complete a quiz category to add your score!")
+    with page("leaderboard"):
+        st.title("🏆 Leaderboard")
+
+        store = get_leaderboard_store()
+        categories = list(get_game_data().questions)
+
+        # Every view is kept sorted by the store; only the shown rows are read,
+        # and only when the cache version has moved since the last rerun
+        all_time_tab, players_tab, *category_tabs = st.tabs(
+            ["All Time", "Best per Player", *categories]
+        )
+        with all_time_tab:
+            st.write("### Top Players (All Time)")
+            show_leaderboard(
+                "all_time",
+                lambda: store.top(LEADERBOARD_SIZE),
+                "No leaderboard data yet. Complete a quiz category to add your score!",
+            )
+        with players_tab:
+            st.write("### Best Round of Each Player")
+            show_leaderboard(
+                "players",
+                lambda: store.top_players(LEADERBOARD_SIZE),
+                "No players yet.",
+            )
+        for category, tab in zip(categories, category_tabs):
+            with tab:
+                st.write(f"### {category}")
+                show_leaderboard(
+                    ("category", category),
+                    lambda: store.top_in_category(category, LEADERBOARD_SIZE),
+                    "No scores in this category yet.",
+                )
 
-    st.stop()
+        st.stop()
 
 
 # -------------------------
-# QUIZ PAGE
+# INSTRUCTOR PAGE (admin only)
 # -------------------------
-if st.session_state.page == "quiz":
-
-    # -------- CATEGORY SELECTION --------
-    if st.session_state.category is None:
-        st.title("💰 Entrepreneurial Finance Quiz")
-        st.subheader("📚 Choose a Category")
-
-        chosen = st.radio("Select a topic to begin:", list(question_categories.keys()))
-
-        if st.button("Start Category"):
-            st.session_state.category = chosen
-            st.session_state.index = 0
-            st.session_state.show_result = False
-            st.session_state.has_answered = False
-            st.session_state.question_start_time = None
-            st.session_state.saved_this_round = False
+if st.session_state.page == "instructor" and st.session_state.is_admin:
+    with page("instructor"):
+        import pandas as pd
+
+        st.title("📊 Question Analytics")
+
+        questions = get_game_data().questions
+        category = st.selectbox("Category", list(questions))
+        # Only answered questions are listed; a bank may hold thousands
+        answered = get_answer_analytics().answered(category)
+        st.caption(f"{len(answered)} of {len(questions[category])} questions answered at least once")
+        if not answered:
+            st.info("No answers in this category yet.")
+            st.stop()
+
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "#": i + 1,
+                        "question": questions[category][i].question,
+                        "value": questions[category].values[i],
+                        "answers": s.answered,
+                        "accuracy": s.accuracy,
+                        "median time (s)": s.rt_quantile(0.5),
+                        "p90 time (s)": s.rt_quantile(0.9),
+                        "avg reward": s.reward_total / s.answered if s.answered else 0,
+                        "flag": (
+                            "" if s.answered < INSTRUCTOR_MIN_ANSWERS
+                            else "too easy" if s.accuracy >= TOO_EASY_ACCURACY
+                            else "too hard" if s.accuracy <= TOO_HARD_ACCURACY
+                            else ""
+                        ),
+                    }
+                    for i, s in answered
+                ]
+            ),
+            column_config={"accuracy": st.column_config.ProgressColumn(min_value=0, max_value=1)},
+            hide_index=True,
+        )
+
+        st.subheader("Option choices")
+        index, s = st.selectbox(
+            "Question",
+            answered,
+            format_func=lambda item: f"{item[0] + 1}. {questions[category][item[0]].question}",
+        )
+        q = questions[category][index]
+        st.bar_chart(
+            pd.DataFrame(
+                {
+                    "answers": [s.choices.get(k, 0) for k in range(len(q.options))]
+                    + [s.choices.get(-1, 0)],
+                },
+                index=[
+                    ("✅ " if k == q.answer else "") + option
+                    for k, option in enumerate(q.options)
+                ] + ["(no answer)"],
+            ),
+            horizontal=True,
+        )
 
         st.stop()
 
-    # We have a category selected from here on
-    active_questions = get_active_questions()
-
-    # Auto-refresh for live countdown (only while a question is active and no result yet)
-    if st.session_state.index < len(active_questions) and not st.session_state.show_result:
-        st_autorefresh(interval=200, key="quiz_refresh")
 
-    st.title("💰 Entrepreneurial Finance Quiz")
-    st.write(f"Player: **{st.session_state.username}**")
-    st.write(f"Category: **{st.session_state.category}**")
-    st.write("Answer questions before time runs out. Correct answers earn money, wrong answers lose money!")
+# -------------------------
+# LIVE ROUND PAGE
+# -------------------------
+if st.session_state.page == "live":
+    with page("live"):
+        st.title("📡 Live Round")
+        st.write(f"Player: **{player.username}** · Capital: **${player.money}**")
+
+        live = get_live_round()
+        state = live.current()
+
+        if state.round_id is None:
+            st.info("Waiting for the host to start a question…")
+            st.stop()
+
+        q = state.question
+        st.subheader(f"{state.category} · Question {state.index + 1}")
+        st.write(q.question)
+
+        answered = player.live_round == state.round_id
+        time_left = max(0, state.deadline - game_clock.now())
+        choice_key = f"live_{state.round_id}"
+
+        if not answered and not state.closed and time_left > 0:
+            # The browser animates the shared deadline; the server pushes a rerun when it passes
+            render_countdown(time_left, q.value, state.duration)
+            st.write(f"❌ Wrong answer penalty: **-${int(q.value * WRONG_PENALTY_FACTOR)}**")
+            choice = st.radio("Choose an answer:", q.options, key=choice_key)
+            if st.button("Submit Answer"):
+                check_live_answer(state, choice)
+                st.rerun()
+            st.stop()
+
+        # Time is up: a player who saw the question is scored on what was selected
+        if not answered and choice_key in st.session_state:
+            check_live_answer(state, st.session_state[choice_key])
+            answered = player.live_round == state.round_id
+
+        answer = live.answer_of(player.username) if answered else None
+        if not state.closed:
+            st.info("Answer locked in. Waiting for the round to close…")
+        elif answer is None:
+            st.warning("You did not answer this question.")
+        elif answer.correct:
+            st.success(f"Correct! You earned ${answer.reward}.")
+        else:
+            st.error(f"Incorrect. You lost ${-answer.reward}.")
+
+        if state.closed:
+            st.info(f"📘 Explanation: {q.explanation}")
+            n, correct, _ = live.results()
+            st.caption(f"{correct} of {n} players answered correctly.")
 
-    # Status bar: avatar + capital
-    avatar_emoji = get_avatar_emoji()
-    st.markdown(
-        f"""
-        <div style="display:flex; align-items:center; gap:10px; margin-bottom:15px;">
-            <span style="font-size:40px;">{avatar_emoji}</span>
-            <span style="font-size:20px;">Capital: <b>${st.session_state.money}</b></span>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+        st.stop()
 
-    # Initialize timer storage (already in session init, but safe)
-    if "question_start_time" not in st.session_state:
-        st.session_state.question_start_time = None
 
-    if st.session_state.index < len(active_questions):
+# -------------------------
+# LIVE ROUND HOST PAGE (admin only)
+# -------------------------
+if st.session_state.page == "host" and st.session_state.is_admin:
+    with page("host"):
+        import pandas as pd
+
+        st.title("🎙️ Host a Live Round")
+
+        live = get_live_round()
+        state = live.current()
+        questions = get_game_data().questions
+
+        categories = list(questions)
+        category = st.selectbox(
+            "Category",
+            categories,
+            index=categories.index(state.category) if state.category in categories else 0,
+        )
+        next_index = state.index + 1 if state.category == category else 0
+        # A number rather than a list of every question, which may be thousands long
+        index = st.number_input(
+            f"Question number (1-{len(questions[category])})",
+            1,
+            len(questions[category]),
+            min(next_index, len(questions[category]) - 1) + 1,
+        ) - 1
+        st.caption(questions[category][index].question)
+        duration = st.number_input("Seconds to answer", 5, 120, MAX_TIME)
+
+        start_col, close_col, end_col = st.columns(3)
+        if start_col.button("Start question"):
+            live.start(category, index, questions[category][index], duration)
+            st.rerun()
+        if close_col.button("Close now", disabled=state.closed):
+            live.close()
+            st.rerun()
+        if end_col.button("End live round", disabled=state.round_id is None):
+            live.end()
+            st.rerun()
 
-        q = active_questions[st.session_state.index]
+        st.caption(f"{len(live.subscribers)} sessions following the live round")
+        if state.round_id is None:
+            st.info("No question running.")
+            st.stop()
+
+        q = state.question
+        n, correct, choices = live.results()
+        status = "closed" if state.closed else f"{max(0, state.deadline - game_clock.now()):.0f} s left"
+        st.subheader(f"{state.category} · Question {state.index + 1} ({status})")
+        st.write(q.question)
+        st.write(f"**{n}** answers, **{correct}** correct")
+        st.bar_chart(
+            pd.DataFrame(
+                {"answers": [choices.get(k, 0) for k in range(len(q.options))] + [choices.get(-1, 0)]},
+                index=[
+                    ("✅ " if k == q.answer else "") + option
+                    for k, option in enumerate(q.options)
+                ] + ["(no answer)"],
+            ),
+            horizontal=True,
+        )
 
-        # Start the timer ONLY when the question appears
-        if st.session_state.question_start_time is None:
-            st.session_state.question_start_time = time.time()
+        # Answers are not pushed one by one; the host alone refreshes the tally
+        if not state.closed:
+            st_autorefresh(interval=get_load_monitor().interval(HOST_INTERVAL, HOST_MAX), key="host_refresh")
 
-        st.subheader(f"Question {st.session_state.index + 1} / {len(active_questions)}")
-        st.write(q["question"])
+        st.stop()
 
-        # TIMER
-        time_passed = time.time() - st.session_state.question_start_time
-        time_left = max(0, MAX_TIME - time_passed)
 
-        st.progress(time_left / MAX_TIME)
-        st.write(f"⏱️ Time left: {time_left:.1f} seconds")
+# -------------------------
+# QUIZ PAGE
+# -------------------------
+if st.session_state.page == "quiz":
+    with page("quiz"):
+
+        # -------- CATEGORY SELECTION --------
+        if player.category is None:
+            st.title("💰 Entrepreneurial Finance Quiz")
+            st.subheader("📚 Choose a Category")
+
+            questions = get_game_data().questions
+            chosen = st.radio("Select a topic to begin:", list(questions))
+
+            difficulty = None
+            values = questions[chosen].difficulties
+            if len(values) > 1:
+                difficulty = st.select_slider(
+                    "Difficulty (question value)",
+                    options=values,
+                    value=(values[0], values[-1]),
+                    key=f"difficulty_{chosen}",
+                )
+
+            if st.button("Start Category"):
+                start_round(chosen, difficulty)
+
+            st.stop()
+
+        # A hot-reloaded question bank may have dropped the category or
+        # shrunk under the round; a session saved before rounds were drawn has none
+        if not get_engine().check_round(player):
+            st.rerun()
 
-        # Decreasing reward for *correct* answer (preview)
-        base_value = q["value"]
-        time_factor = time_left / MAX_TIME
-        current_value = int(base_value * time_factor)
-        st.write(f"💸 Current reward for a correct answer (if you answer now): **${current_value}**")
-        st.write(f"❌ Wrong answer penalty: **-${int(base_value * WRONG_PENALTY_FACTOR)}**")
+        # We have a category selected from here on
+        active_questions = get_active_questions()
+
+        # Under load the server-driven countdown refreshes less often and the
+        # browser animates the timer in between; rewards use server time either way
+        load = get_load_monitor()
+        server_timer = TIMER_MODE == "server" and not load.degraded(SERVER_TIMER_INTERVAL)
+
+        # Auto-refresh for live countdown (only while a question is active and no result yet)
+        if (
+            TIMER_MODE == "server"
+            and player.index < len(active_questions)
+            and not player.show_result
+        ):
+            st_autorefresh(
+                interval=load.interval(SERVER_TIMER_INTERVAL, SERVER_TIMER_MAX),
+                key="quiz_refresh",
+            )
 
-        # Answer options
-        choice_key = f"q_{st.session_state.category}_{st.session_state.index}"
-        choice = st.radio("Choose an answer:", q["options"], key=choice_key)
+        st.title("💰 Entrepreneurial Finance Quiz")
+        st.write(f"Player: **{player.username}**")
+        st.write(f"Category: **{player.category}**")
+        st.write("Answer questions before time runs out. Correct answers earn money, wrong answers lose money!")
+
+        # Status bar: avatar + capital
+        avatar_emoji = get_avatar_emoji()
+        st.markdown(
+            f"""
+            <div style="display:flex; align-items:center; gap:10px; margin-bottom:15px;">
+                <span style="font-size:40px;">{avatar_emoji}</span>
+                <span style="font-size:20px;">Capital: <b>${player.money}</b></span>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+        if player.index < len(active_questions):
+
+            q = active_questions[player.index]
+
+            # Start the timer ONLY when the question appears
+            get_engine().start_question(player)
+
+            st.subheader(f"Question {player.index + 1} / {len(active_questions)}")
+            st.write(q.question)
+
+            # TIMER
+            time_left = get_engine().time_left(player)
+
+            base_value = q.value
+
+            timer_slot = st.empty()
+            if server_timer:
+                st.progress(time_left / MAX_TIME)
+                st.write(f"⏱️ Time left: {time_left:.1f} seconds")
+
+                # Decreasing reward for *correct* answer (preview)
+                time_factor = time_left / MAX_TIME
+                current_value = int(base_value * time_factor)
+                st.write(f"💸 Current reward for a correct answer (if you answer now): **${current_value}**")
+            elif not player.show_result:
+                with timer_slot.container():
+                    render_countdown(time_left, base_value)
+                    # One wake-up at the deadline so the timeout auto-submit below runs
+                    st_autorefresh(
+                        interval=int(time_left * 1000) + 100,
+                        limit=2,
+                        key=f"deadline_{player.category}_{player.index}",
+                    )
+            st.write(f"❌ Wrong answer penalty: **-${int(base_value * WRONG_PENALTY_FACTOR)}**")
+
+            # Answer options
+            choice_key = f"q_{player.category}_{player.index}"
+            choice = st.radio("Choose an answer:", q.options, key=choice_key)
+
+            # Manual submit
+            if st.button("Submit Answer"):
+                if not player.has_answered:
+                    check_answer(choice)
+
+            # Auto-submit on timeout (Option A)
+            if time_left <= 0 and not player.has_answered:
+                current_choice = st.session_state.get(choice_key, None)
+                check_answer(current_choice)
+
+            # Show result
+            if player.show_result:
+                timer_slot.empty()
+                if player.last_correct:
+                    st.success(f"Correct! You earned ${player.last_reward}.")
+                else:
+                    st.error(f"Incorrect. You lost ${-player.last_reward}.")
 
-        # Manual submit
-        if st.button("Submit Answer"):
-            if not st.session_state.has_answered:
-                check_answer(choice)
+                st.info(f"📘 Explanation: {q.explanation}")
 
-        # Auto-submit on timeout (Option A)
-        if time_left <= 0 and not st.session_state.has_answered:
-            current_choice = st.session_state.get(choice_key, None)
-            check_answer(current_choice)
+                st.button("Next Question", on_click=next_question)
 
-        # Show result
-        if st.session_state.show_result:
-            if st.session_state.last_correct:
-                st.success(f"Correct! You earned ${st.session_state.last_reward}.")
-            else:
-                st.error(f"Incorrect. You lost ${-st.session_state.last_reward}.")
+        else:
+            # No more questions in this category
+            st.header("🎉 Category Complete!")
+            st.subheader(f"Category: **{player.category}**")
+            st.subheader(f"Total capital: **${player.money}**")
 
-            st.info(f"📘 Explanation: {q['explanation']}")
+            # Auto-save to leaderboard (only once per round)
+            save_to_leaderboard()
+            st.success("Your score has been saved to the leaderboard ✅")
+            show_standing()
 
-            st.button("Next Question", on_click=next_question)
+            if st.button("Play This Category Again"):
+                start_round(player.category, player.difficulty)
 
-    else:
-        # No more questions in this category
-        st.header("🎉 Category Complete!")
-        st.subheader(f"Category: **{st.session_state.category}**")
-        st.subheader(f"Total capital: **${st.session_state.money}**")
-
-        # Auto-save to leaderboard (only once per round)
-        save_to_leaderboard()
-        st.success("Your score has been saved to the leaderboard ✅")
-
-        if st.button("Play This Category Again"):
-            st.session_state.index = 0
-            st.session_state.show_result = False
-            st.session_state.question_start_time = None
-            st.session_state.has_answered = False
-            st.session_state.saved_this_round = False
-
-        if st.button("Choose Another Category"):
-            reset_category()
+            if st.button("Choose Another Category"):
+                reset_category()
@@ -0,0 +1,430 @@
+"""Benchmark suite: scoring, leaderboard I/O, name checks and page reruns at scale.
+
+Every run generates the same synthetic data from --seed: leaderboards of
+each --sizes row count (10k, 100k and 1M by default) in each --backends
+store, and JSON Lines question banks of each --bank-sizes. On that data it
+times the paths a change is most likely to slow down:
+
+- scoring.*       PlayerState.answer, the core of check_answer()
+- questions.*     loading a question bank, drawing a round, reading a question
+- leaderboard.*   save_to_leaderboard()'s store write, the top-N reads behind
+                  the leaderboard page, a player's rank, and opening the
+                  store cold
+- usernames.*     the login screen's name check: loading the taken names and
+                  allocating a colliding one
+- page.*          a full rerun of every page of app.py through AppTest, in a
+                  fresh process per leaderboard
+
+Results (median, p95 and min per benchmark, in ms) are written as JSON.
+Against a saved baseline every benchmark whose median got slower by more
+than --threshold is flagged, and the exit status is 1:
+
+    python benchmarks.py run --output baseline.json
+    python benchmarks.py run --sizes 10k,100k --baseline baseline.json
+    python benchmarks.py compare baseline.json current.json --threshold 0.2
+"""
+import argparse
+import datetime
+import fnmatch
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+SIZES = (10_000, 100_000, 1_000_000)  # leaderboard rows
+BANK_SIZES = (1_000, 10_000, 100_000)  # questions
+BACKENDS = ("sqlite",)
+REPEAT = 20  # samples per benchmark; slow ones take fewer
+THRESHOLD = 0.2  # a median this much slower than the baseline is a regression
+MIN_DELTA_MS = 0.05  # smaller slowdowns are noise, whatever their ratio
+PLAYERS_PER_ROW = 0.1  # distinct players per leaderboard row
+PAGES = ("live", "store", "avatar", "leaderboard", "instructor", "host")
+
+
+def parse_size(text):
+    """"10k" -> 10000, "1M" -> 1000000."""
+    text = text.strip()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:].lower(), 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def size_label(n):
+    for unit, scale in (("M", 1_000_000), ("k", 1_000)):
+        if n >= scale and n % scale == 0:
+            return f"{n // scale}{unit}"
+    return str(n)
+
+
+# -------------------------
+# TIMING
+# -------------------------
+def measure(fn, repeat=REPEAT, number=1, setup=None):
+    """Time repeat samples of number calls of fn(setup()) or fn(); per-call ms stats."""
+    samples = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn(*args)
+            samples.append((time.perf_counter() - start) / number * 1000)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[max(0, round(0.95 * len(samples)) - 1)],
+        "min_ms": samples[0],
+        "runs": len(samples),
+    }
+
+
+# -------------------------
+# SYNTHETIC DATA
+# -------------------------
+def synthetic_rows(n, seed, categories):
+    """n leaderboard rows (username, capital, category, timestamp), same for the same seed."""
+    rng = random.Random(seed)
+    players = max(1, int(n * PLAYERS_PER_ROW))
+    start = 1_700_000_000.0
+    for i in range(n):
+        yield (
+            f"player-{rng.randrange(players)}",
+            int(rng.gauss(2000, 1500)),
+            rng.choice(categories),
+            start + i * 0.5,
+        )
+
+
+def write_question_bank(path, n, seed, categories=10):
+    """A JSON Lines bank of n valid questions spread over the given number of categories."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({
+                "category": f"Category {i % categories}",
+                "question": f"Synthetic question {i}?",
+                "options": [f"Option {k}" for k in range(4)],
+                "answer": rng.randrange(4),
+                "value": rng.randrange(1, 11) * 100,
+                "explanation": "Generated for benchmarking.",
+            }) + "\n")
+
+
+def build_leaderboard(workdir, backend, n, seed):
+    """Fill a store of the given backend in workdir with n rows."""
+    from game_data import get_game_data
+    from leaderboard_store import open_store
+
+    categories = list(get_game_data().questions)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        store = open_store(backend)
+        store.bulk_load(synthetic_rows(n, seed, categories))
+    finally:
+        os.chdir(cwd)
+
+
+# -------------------------
+# LIBRARY BENCHMARKS
+# -------------------------
+def bench_scoring(repeat, seed):
+    from game_data import get_game_data
+    from player_state import PlayerState
+
+    rng = random.Random(seed)
+    questions = [q for category in get_game_data().questions.values() for q in category]
+    player = PlayerState(username="bench")
+    picks = [(q, rng.choice(q.options), rng.uniform(0, 25)) for q in rng.choices(questions, k=1000)]
+
+    def answer_all():
+        for q, choice, taken in picks:
+            player.question_start_time = 0.0
+            player.answer(q, choice, taken, 20, 0.3)
+
+    stats = measure(answer_all, repeat)
+    # per answer, not per batch of 1000
+    return {"scoring.answer": {k: v / 1000 if k.endswith("_ms") else v for k, v in stats.items()}}
+
+
+def bench_questions(sizes, repeat, seed, tmpdir):
+    from game_data import load_questions_jsonl
+
+    results = {}
+    for n in sizes:
+        label = size_label(n)
+        path = os.path.join(tmpdir, f"questions-{label}.jsonl")
+        write_question_bank(path, n, seed)
+        results[f"questions.load[{label}]"] = measure(lambda: load_questions_jsonl(path), max(3, repeat // 5))
+        bank = load_questions_jsonl(path)
+        rng = random.Random(seed)
+        category = bank["Category 0"]
+        results[f"questions.draw[{label}]"] = measure(
+            lambda: category.draw(10, rng, 300, 700), repeat, number=100
+        )
+        positions = [rng.randrange(len(category)) for _ in range(repeat)]
+        results[f"questions.read[{label}]"] = measure(
+            lambda i: category[i], repeat, setup=iter(positions).__next__
+        )
+    return results
+
+
+def bench_leaderboard(workdir, backend, n, repeat):
+    from leaderboard_store import open_store
+    from rank_index import RankIndex
+    from username_registry import UsernameRegistry
+
+    tag = f"[{backend},{size_label(n)}]"
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = {
+            f"leaderboard.open{tag}": measure(lambda: open_store(backend).top(10), max(3, repeat // 5)),
+        }
+        store = open_store(backend)
+        category = store.top(1)[0]["category"]
+        results[f"leaderboard.top{tag}"] = measure(lambda: store.top(100), repeat)
+        results[f"leaderboard.top_players{tag}"] = measure(lambda: store.top_players(100), repeat)
+        results[f"leaderboard.top_in_category{tag}"] = measure(
+            lambda: store.top_in_category(category, 100), repeat
+        )
+        ranks = RankIndex(store)
+        results[f"leaderboard.rank_load{tag}"] = measure(ranks.load, 1)
+        results[f"leaderboard.rank{tag}"] = measure(lambda: ranks.standing("player-1"), repeat, number=100)
+        results[f"leaderboard.save{tag}"] = measure(
+            lambda: store.add("bench", 1234, category, time.time()), repeat
+        )
+        batch = [("bench", 1234, category, time.time())] * 500
+        results[f"leaderboard.save_batch{tag}"] = measure(lambda: store.add_many(batch), max(3, repeat // 5))
+        results[f"usernames.load{tag}"] = measure(lambda: UsernameRegistry(store).load(), max(3, repeat // 5))
+        registry = UsernameRegistry(store)
+        registry.load()
+        results[f"usernames.allocate{tag}"] = measure(lambda: registry.allocate("player-1"), repeat)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+# -------------------------
+# PAGE RERUNS
+# -------------------------
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def page_child(repeat):
+    """Time reruns of every page; runs in the data directory, prints the stats as JSON."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=300)
+    at.session_state["is_admin"] = True
+    at.run()
+    for thread in threading.enumerate():
+        if thread.name == "warm-up":
+            thread.join()
+    results = {"page.login": measure(at.run, repeat)}
+
+    at.text_input[0].input("bench")
+    _button(at, "Continue").click().run()
+    results["page.quiz"] = measure(at.run, repeat)
+
+    _button(at, "Start Category").click().run()
+    at.run()  # the start button only takes effect on the next rerun
+    results["page.question"] = measure(at.run, repeat)
+
+    def click_submit():
+        if any(b.label == "Next Question" for b in at.button):
+            _button(at, "Next Question").click().run()
+        if not any(b.label == "Submit Answer" for b in at.button):
+            _button(at, "Play This Category Again").click().run()
+            at.run()
+        _button(at, "Submit Answer").click()
+
+    # The rerun that scores the answer: check_answer() and its queued writes
+    results["page.question.submit"] = measure(lambda _: at.run(), repeat, setup=click_submit)
+
+    for name in PAGES:
+        at.sidebar.radio[0].set_value(name).run()
+        results[f"page.{name}"] = measure(at.run, repeat)
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].message}")
+    print(json.dumps(results))
+
+
+def bench_pages(workdir, backend, n, repeat):
+    env = dict(os.environ, LEADERBOARD_BACKEND=backend)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "run", "--pages-child", "--repeat", str(repeat)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=False,
+    )
+    if out.returncode:
+        raise RuntimeError(f"page benchmark failed:\n{out.stderr}")
+    tag = f"[{backend},{size_label(n)}]"
+    return {f"{name}{tag}": stats for name, stats in json.loads(out.stdout.strip().splitlines()[-1]).items()}
+
+
+# -------------------------
+# RESULTS
+# -------------------------
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(baseline, current, threshold=THRESHOLD, min_delta_ms=MIN_DELTA_MS):
+    """(rows of (name, baseline ms, current ms, ratio, regressed)), names missing from current)."""
+    rows = []
+    for name, stats in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        regressed = ratio > 1 + threshold and stats["median_ms"] - base["median_ms"] > min_delta_ms
+        rows.append((name, base["median_ms"], stats["median_ms"], ratio, regressed))
+    missing = sorted(baseline["results"].keys() - current["results"].keys())
+    return rows, missing
+
+
+def print_comparison(rows, missing, threshold):
+    width = max([len(r[0]) for r in rows] + [9])
+    print(f"{'benchmark':<{width}}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, base, cur, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}{base:>10.3f}ms{cur:>10.3f}ms{(ratio - 1) * 100:>+8.0f}%{flag}")
+    if missing:
+        print(f"{len(missing)} benchmarks of the baseline were not run")
+    regressions = sum(r[4] for r in rows)
+    print(f"{regressions} of {len(rows)} benchmarks more than {threshold:.0%} slower than the baseline")
+    return regressions
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}}{'median':>12}{'p95':>12}{'runs':>6}")
+    for name, stats in sorted(results.items()):
+        print(f"{name:<{width}}{stats['median_ms']:>10.3f}ms{stats['p95_ms']:>10.3f}ms{stats['runs']:>6}")
+
+
+def _split_patterns(text):
+    """--only patterns; a comma inside [...] belongs to a group name, not between two patterns."""
+    return [p for p in re.split(r",(?![^\[]*\])", text) if p]
+
+
+def run(args):
+    sys.path.insert(0, APP_DIR)
+    patterns = _split_patterns(args.only) if args.only else []
+    # A name is compared as is first: fnmatch reads its [backend,size] as a character class
+    selected = lambda name: not patterns or any(name == p or fnmatch.fnmatch(name, p) for p in patterns)
+    results = {}
+
+    def add(group, fn, *fn_args):
+        if selected(group):
+            print(f"running {group} ...", file=sys.stderr)
+            results.update(fn(*fn_args))
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-", dir=args.tmpdir) as tmpdir:
+        add("scoring", bench_scoring, args.repeat, args.seed)
+        add("questions", bench_questions, args.bank_sizes, args.repeat, args.seed, tmpdir)
+        for backend in args.backends:
+            for n in args.sizes:
+                tag = f"[{backend},{size_label(n)}]"
+                if not (selected(f"leaderboard{tag}") or selected(f"pages{tag}")):
+                    continue
+                workdir = os.path.join(tmpdir, f"{backend}-{size_label(n)}")
+                os.makedirs(workdir)
+                print(f"generating {size_label(n)} {backend} rows ...", file=sys.stderr)
+                build_leaderboard(workdir, backend, n, args.seed)
+                add(f"leaderboard{tag}", bench_leaderboard, workdir, backend, n, args.repeat)
+                add(f"pages{tag}", bench_pages, workdir, backend, n, args.repeat)
+
+    if not results:
+        print(f"error: --only {args.only!r} matches no group; groups are scoring, questions, "
+              f"leaderboard[BACKEND,SIZE] and pages[BACKEND,SIZE] (e.g. 'leaderboard[sqlite,10k]'), "
+              f"or patterns of them such as 'leaderboard*'", file=sys.stderr)
+        return 2
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "bank_sizes": args.bank_sizes,
+            "backends": args.backends,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        return 1 if print_comparison(*compare(baseline, report, args.threshold), args.threshold) else 0
+    return 0
+
+
+def main(argv=None):
+    sizes = lambda text: [parse_size(s) for s in text.split(",")]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("run", help="run the benchmarks")
+    bench.add_argument("--sizes", type=sizes, default=list(SIZES), help="leaderboard rows, e.g. 10k,100k,1M")
+    bench.add_argument("--bank-sizes", type=sizes, default=list(BANK_SIZES), help="questions per synthetic bank")
+    bench.add_argument("--backends", type=lambda s: s.split(","), default=list(BACKENDS))
+    bench.add_argument("--repeat", type=int, default=REPEAT, help="samples per benchmark")
+    bench.add_argument("--only", help="comma-separated groups or patterns of them to run, e.g. 'scoring,pages*,leaderboard[csv,10k]'")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--tmpdir", help="where the synthetic data goes (default: system temp)")
+    bench.add_argument("--output", help="write the results to this JSON file")
+    bench.add_argument("--baseline", help="compare with the results in this JSON file")
+    bench.add_argument("--threshold", type=float, default=THRESHOLD)
+    bench.add_argument("--pages-child", action="store_true", help=argparse.SUPPRESS)
+    check = commands.add_parser("compare", help="compare two result files")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=THRESHOLD)
+    check.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS,
+                       help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        rows, missing = compare(baseline, current, args.threshold, args.min_delta_ms)
+        return 1 if print_comparison(rows, missing, args.threshold) else 0
+    if args.pages_child:
+        sys.path.insert(0, APP_DIR)
+        page_child(args.repeat)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Append-only ledger of every change to a player's capital.
+
+Rewards and penalties of answered questions, live-round rewards and store
+purchases are each recorded as one LedgerEvent and appended to ledger.csv
+by a background BatchWriter, so the answer path only pays for a queue put
+and a burst of answers costs one write and one fsync. The writer retries a
+batch it could not write until it is written, instead of dropping it. The
+ledger is never rewritten: disputes are settled by reading a player's
+history, and a player's balance and inventory are whatever replaying their
+events gives.
+
+Replaying starts from ledger.snap.json, a periodic snapshot of every
+balance together with the ledger offset it covers, so only events appended
+since are parsed. Run from the app directory:
+
+    python capital_ledger.py history Alice
+    python capital_ledger.py snapshot
+    python capital_ledger.py verify --sessions sessions.db
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+
+from csv_log import append_rows, read_rows
+
+LEDGER_FILE = "ledger.csv"
+LEDGER_SNAPSHOT = "ledger.snap.json"
+SNAPSHOT_EVERY = 10_000  # events folded in before a new snapshot is written
+FIELDS = ["timestamp", "player", "kind", "amount", "detail"]
+KINDS = ("opening", "answer", "live", "purchase")
+ITEM_SEPARATOR = "|"
+
+logger = logging.getLogger(__name__)
+
+# amount is the signed change of capital; detail says what it was for:
+# "category#question" for answers, the round id for live answers, the item
+# name for purchases. An opening event carries over the capital and the
+# "|"-joined items of a player saved before the ledger existed.
+LedgerEvent = namedtuple("LedgerEvent", FIELDS)
+
+
+class Balance:
+    """A player's capital and owned items, as replayed from the ledger."""
+
+    __slots__ = ("money", "inventory")
+
+    def __init__(self, money=0, inventory=()):
+        self.money = money
+        self.inventory = set(inventory)
+
+    def apply(self, event):
+        self.money += event.amount
+        if event.kind == "purchase":
+            self.inventory.add(event.detail)
+        elif event.kind == "opening" and event.detail:
+            self.inventory.update(event.detail.split(ITEM_SEPARATOR))
+
+    def __eq__(self, other):
+        return isinstance(other, Balance) and (self.money, self.inventory) == (other.money, other.inventory)
+
+    def __repr__(self):
+        return f"Balance({self.money}, {sorted(self.inventory)})"
+
+
+class CapitalLedger:
+    """The ledger file and the balances replayed from it; safe to share between sessions.
+
+    add_many() makes it a sink for BatchWriter. Balances fold in the events
+    appended by any process since the last call.
+    """
+
+    def __init__(self, path=LEDGER_FILE, snapshot_path=LEDGER_SNAPSHOT, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._balances = None  # player -> Balance, loaded on first use
+        self._offset = 0
+        self._since_snapshot = 0
+
+    def add_many(self, events):
+        append_rows(
+            self.path, FIELDS, ([f"{e.timestamp:.3f}", e.player, e.kind, e.amount, e.detail] for e in events)
+        )
+        # Snapshots are written here, on the writer thread, never by a session.
+        # The events are logged by now, so a failure must not have them retried.
+        try:
+            with self._lock:
+                self._catch_up()
+                if self._since_snapshot >= self.snapshot_every:
+                    self._write_snapshot()
+        except Exception:
+            logger.exception("Could not fold new ledger events into the balances")
+
+    def events(self, offset=0):
+        """Yield (end offset, LedgerEvent) for every complete row from offset on."""
+        for offset, fields in read_rows(self.path, offset):
+            if fields != FIELDS:
+                ts, player, kind, amount, detail = fields
+                yield offset, LedgerEvent(float(ts), player, kind, int(amount), detail)
+
+    def balance(self, player):
+        """Player's Balance, or None if the ledger has no events for them."""
+        with self._lock:
+            self._catch_up()
+            balance = self._balances.get(player)
+            return Balance(balance.money, balance.inventory) if balance else None
+
+    def balances(self):
+        """Copy of every player's Balance."""
+        with self._lock:
+            self._catch_up()
+            return {p: Balance(b.money, b.inventory) for p, b in self._balances.items()}
+
+    def snapshot(self):
+        """Write a snapshot of the balances up to the end of the ledger now."""
+        with self._lock:
+            self._catch_up()
+            self._write_snapshot()
+            return self._offset
+
+    def _catch_up(self):
+        if self._balances is None:
+            self._balances, self._offset = read_snapshot(self.snapshot_path, self.path)
+        for offset, event in self.events(self._offset):
+            balance = self._balances.get(event.player)
+            if balance is None:
+                balance = self._balances[event.player] = Balance()
+            balance.apply(event)
+            self._offset = offset
+            self._since_snapshot += 1
+
+    def _write_snapshot(self):
+        snapshot = {
+            "offset": self._offset,
+            "balances": {p: [b.money, sorted(b.inventory)] for p, b in self._balances.items()},
+        }
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        self._since_snapshot = 0
+
+
+def read_snapshot(snapshot_path, ledger_path):
+    """(player -> Balance, ledger offset) from a snapshot; empty if there is none or it does not fit."""
+    if not os.path.exists(snapshot_path):
+        return {}, 0
+    with open(snapshot_path, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    # A snapshot past the end of the ledger belongs to some other ledger
+    size = os.path.getsize(ledger_path) if os.path.exists(ledger_path) else 0
+    if snapshot["offset"] > size:
+        return {}, 0
+    return {p: Balance(m, items) for p, (m, items) in snapshot["balances"].items()}, snapshot["offset"]
+
+
+# -------------------------
+# JOBS
+# -------------------------
+def verify(path=LEDGER_FILE, snapshot_path=LEDGER_SNAPSHOT, sessions_path=None):
+    """Replay the whole ledger and cross-check it; returns (balances, list of problems).
+
+    Checks that every event is well-formed, that no purchase was made
+    without the capital for it or bought an owned item twice, that the
+    snapshot agrees with a full replay, and (with sessions_path) that saved
+    sessions hold the replayed balances.
+    """
+    problems = []
+    balances = {}
+    try:
+        for n, (_, event) in enumerate(CapitalLedger(path).events(), 1):
+            if event.kind not in KINDS:
+                problems.append(f"event {n}: unknown kind {event.kind!r}")
+            balance = balances.get(event.player)
+            if balance is None:
+                balance = balances[event.player] = Balance()
+            elif event.kind == "opening":
+                problems.append(f"event {n}: opening balance of {event.player} after other events")
+            if event.kind == "purchase":
+                if event.amount > 0:
+                    problems.append(f"event {n}: purchase of {event.detail!r} adds capital")
+                if event.detail in balance.inventory:
+                    problems.append(f"event {n}: {event.player} bought {event.detail!r} twice")
+                if balance.money + event.amount < 0:
+                    problems.append(f"event {n}: {event.player} bought {event.detail!r} without the capital")
+            balance.apply(event)
+    except ValueError as e:
+        return balances, problems + [f"ledger {path} does not parse: {e}"]
+
+    if os.path.exists(snapshot_path):
+        try:
+            replayed = CapitalLedger(path, snapshot_path).balances()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            problems.append(f"cannot read snapshot {snapshot_path}: {e}")
+        else:
+            bad = sorted(p for p in balances.keys() | replayed.keys() if balances.get(p) != replayed.get(p))
+            if bad:
+                problems.append(f"snapshot replay disagrees for {len(bad)} players, e.g. {bad[0]!r}")
+
+    if sessions_path:
+        conn = sqlite3.connect(sessions_path)
+        try:
+            for player, state in conn.execute("SELECT username, state FROM sessions"):
+                state = json.loads(state)
+                saved = Balance(state.get("money", 0), state.get("inventory", ()))
+                if saved != balances.get(player, Balance()):
+                    problems.append(f"session of {player!r} holds {saved}, the ledger {balances.get(player)}")
+        finally:
+            conn.close()
+    return balances, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ledger", default=LEDGER_FILE)
+    parser.add_argument("--snapshot", default=LEDGER_SNAPSHOT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    history = commands.add_parser("history", help="list a player's events and balance")
+    history.add_argument("player")
+    commands.add_parser("snapshot", help="snapshot every balance at the end of the ledger")
+    check = commands.add_parser("verify", help="replay the whole ledger and check it")
+    check.add_argument("--sessions", help="sessions.db to compare saved balances with")
+    args = parser.parse_args(argv)
+
+    if args.command == "history":
+        balance = Balance()
+        for _, event in CapitalLedger(args.ledger).events():
+            if event.player == args.player:
+                balance.apply(event)
+                print(f"{event.timestamp:.3f}  {event.kind:<9}{event.amount:>+8}  "
+                      f"{balance.money:>8}  {event.detail}")
+        print(f"{args.player}: {balance}")
+    elif args.command == "snapshot":
+        offset = CapitalLedger(args.ledger, args.snapshot).snapshot()
+        print(f"wrote {args.snapshot} at ledger offset {offset}")
+    else:
+        balances, problems = verify(args.ledger, args.snapshot, args.sessions)
+        for p in problems:
+            print(f"error: {p}")
+        print(f"{len(balances)} players, {sum(b.money for b in balances.values())} capital in total")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""Consistency checks: the fast and shared paths against simple reference ones.
+
+Each check generates random data from --seed, runs it through the code the
+app uses and through a straightforward reference, and lists every place
+where they disagree:
+
+- redis     two RedisLeaderboardStore instances sharing one in-process
+            Redis-compatible server (fakeredis) against the CSV backend:
+            every view, the row count, the arrival order of all rows,
+            change messages and concurrent username allocation
+- ranks     RankIndex standings, as loaded from the CSV and SQLite
+            backends' player_scores() and then offered new rounds, against
+            a brute-force ranking of every player's best score
+- catalog   store Catalog lookups, searches (text, category and price
+            filters) and pages over a generated catalog, against scanning
+            every item
+
+A check whose optional dependency is missing is skipped. The exit status
+is 1 if any check found a problem:
+
+    python checks.py
+    python checks.py --only ranks,catalog --seed 3
+"""
+import argparse
+import fnmatch
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ROWS = 2_000  # leaderboard rows a check writes
+PLAYERS = 200
+CATEGORIES = ("Balance Sheet", "Income Statement", None)
+WAIT = 5.0  # seconds to wait for a change message from the other store
+OFFERS = 3_000  # rounds offered to the rank index after it is loaded
+COMPARE_EVERY = 250  # offers between two comparisons of every standing
+CATALOG_ITEMS = 200  # store items per category
+SEARCHES = 2_000
+MAX_PROBLEMS = 20  # problems listed per check
+WORDS = ("classic", "suit", "hoodie", "badge", "investor", "gold", "silver", "blue", "startup", "tie")
+
+
+class Skipped(Exception):
+    """The check cannot run here, e.g. an optional package is missing."""
+
+
+# -------------------------
+# CHECKS
+# -------------------------
+def check_redis(seed, workdir):
+    """Problems of the Redis backend against the CSV one, both fed the same rows."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise Skipped("needs the fakeredis package (pip install fakeredis redis)") from None
+    from leaderboard_store import VIEW_SIZE, CsvLeaderboardStore, RedisLeaderboardStore
+    from username_registry import UsernameRegistry
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    url = "redis://%s:%d/0" % server.server_address
+    a, b = RedisLeaderboardStore(url), RedisLeaderboardStore(url)
+    problems = []
+    try:
+        reference = CsvLeaderboardStore(
+            os.path.join(workdir, "leaderboard.csv"),
+            os.path.join(workdir, "usernames.csv"),
+            os.path.join(workdir, "leaderboard.snap"),
+        )
+        changes = threading.Event()
+        b.watch(changes.set)
+
+        # Two replicas write alternate batches, as behind a load balancer
+        rng = random.Random(seed)
+        for batch in range(ROWS // 100):
+            rows = [
+                (f"player-{rng.randrange(PLAYERS)}", rng.randrange(-500, 2000),
+                 rng.choice(CATEGORIES), rng.choice([None, 1.7e9 + batch]))
+                for _ in range(100)
+            ]
+            (a if batch % 2 else b).add_many(rows)
+            reference.add_many(rows)
+        if not changes.wait(WAIT):
+            problems.append(f"store b saw no change message within {WAIT:g}s")
+
+        expected = {
+            "top": reference.top(VIEW_SIZE),
+            "top_players": reference.top_players(PLAYERS),
+            "count": reference.count(),
+            "all_rows": list(reference.all_rows()),
+        }
+        expected.update(
+            (f"top_in_category({c!r})", reference.top_in_category(c, VIEW_SIZE)) for c in CATEGORIES if c
+        )
+        for name, store in (("a", a), ("b", b)):
+            got = {
+                "top": store.top(VIEW_SIZE),
+                "top_players": store.top_players(PLAYERS),
+                "count": store.count(),
+                "all_rows": list(store.all_rows()),
+            }
+            got.update(
+                (f"top_in_category({c!r})", store.top_in_category(c, VIEW_SIZE)) for c in CATEGORIES if c
+            )
+            problems += [f"store {name}: {view} differs from the CSV backend"
+                         for view in expected if got[view] != expected[view]]
+
+        # Both replicas allocate the same colliding name at once
+        allocated = []
+        registries = [UsernameRegistry(a), UsernameRegistry(b)] * 10
+        threads = [threading.Thread(target=lambda r=r: allocated.append(r.allocate("Sam"))) for r in registries]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if len(set(allocated)) != len(allocated):
+            problems.append(f"concurrent allocation handed out a name twice: {sorted(allocated)}")
+    finally:
+        a.close()
+        b.close()
+        server.shutdown()
+        server.server_close()
+    return problems
+
+
+def check_ranks(seed, workdir):
+    """Problems of RankIndex standings against a brute-force ranking of the same scores."""
+    from leaderboard_store import CsvLeaderboardStore, SqliteLeaderboardStore
+    from rank_index import RankIndex
+
+    rng = random.Random(seed)
+    # A narrow capital range, so many players tie
+    rows = [(f"player-{rng.randrange(PLAYERS)}", rng.randrange(-50, 50), rng.choice(CATEGORIES), None)
+            for _ in range(ROWS)]
+    best = {}
+    for username, capital, _, _ in rows:
+        best[username] = max(best.get(username, capital), capital)
+
+    problems = []
+    stores = {
+        "csv": CsvLeaderboardStore(
+            os.path.join(workdir, "leaderboard.csv"),
+            os.path.join(workdir, "usernames.csv"),
+            os.path.join(workdir, "leaderboard.snap"),
+        ),
+        "sqlite": SqliteLeaderboardStore(os.path.join(workdir, "leaderboard.db"), import_csv=None),
+    }
+    for name, store in stores.items():
+        store.add_many(rows)
+        if sorted(store.player_scores()) != sorted(best.items()):
+            problems.append(f"{name}: player_scores() is not every player's best capital")
+
+    for name, store in stores.items():
+        ranks = RankIndex(store)
+        ranks.load()
+        scores = dict(best)
+        # Rounds saved after the load, some by players new to the leaderboard
+        offers = random.Random(seed + 1)
+        for i in range(OFFERS + 1):
+            if i % COMPARE_EVERY == 0:
+                wrong = [u for u in scores if ranks.standing(u) != _brute_standing(scores, u)]
+                if wrong:
+                    problems.append(f"{name}: after {i} offers {len(wrong)} standings differ, e.g. {wrong[0]}: "
+                                    f"{ranks.standing(wrong[0])} != {_brute_standing(scores, wrong[0])}")
+                    break
+            username, capital = f"player-{offers.randrange(PLAYERS + 50)}", offers.randrange(-60, 60)
+            ranks.offer(username, capital)
+            scores[username] = max(scores.get(username, capital), capital)
+        if ranks.standing("nobody") is not None:
+            problems.append(f"{name}: a player without a round has a standing")
+    return problems
+
+
+def _brute_standing(scores, username):
+    from rank_index import Standing
+
+    capital = scores[username]
+    ordered = sorted(scores.items(), key=lambda e: (-e[1], e[0]))
+    i = ordered.index((username, capital))
+    higher = sum(c > capital for c in scores.values())
+    lower = sum(c < capital for c in scores.values())
+    percentile = 100.0 * lower / (len(scores) - 1) if len(scores) > 1 else 100.0
+    return Standing(
+        higher + 1, len(scores), percentile, capital,
+        ordered[i - 1] if i > 0 else None,
+        ordered[i + 1] if i + 1 < len(ordered) else None,
+    )
+
+
+def check_catalog(seed, workdir):
+    """Problems of Catalog lookups, searches and pages against scanning every item."""
+    from game_data import compile_store_items
+    from store_catalog import Catalog
+
+    rng = random.Random(seed)
+    raw = {category: [] for category in ("Outfits", "Premium", "Gadgets")}
+    for category, items in raw.items():
+        for _ in range(CATALOG_ITEMS):
+            name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {sum(map(len, raw.values()))}"
+            items.append({"name": name, "price": rng.randrange(0, 10_000, 50), "emoji": "⭐"})
+    catalog = Catalog(item for items in compile_store_items(raw).values() for item in items)
+    items = catalog.items
+
+    problems = []
+    for item in items:
+        if catalog.get(item.name) is not item or catalog.get(item.id) is not item:
+            problems.append(f"get() does not find {item.name!r} by name and id")
+    prices = [item.price for item in items]
+    if catalog.price_range() != (min(prices), max(prices)):
+        problems.append(f"price_range() is {catalog.price_range()}, not {(min(prices), max(prices))}")
+
+    for _ in range(SEARCHES):
+        query = " ".join(rng.choice(WORDS)[:rng.randrange(1, 6)] for _ in range(rng.randrange(0, 3)))
+        category = rng.choice([None, *raw, "Nope"])
+        low = rng.choice([None, rng.randrange(0, 10_000)])
+        high = rng.choice([None, rng.randrange(0, 10_000)])
+        # An item matches if some word of its name or category starts with each query word
+        expected = tuple(
+            item for item in items
+            if (category is None or item.category == category)
+            and (low is None or item.price >= low) and (high is None or item.price <= high)
+            and all(any(w.startswith(q) for w in _words(f"{item.name} {item.category}")) for q in _words(query))
+        )
+        found = catalog.search(query, category, low, high)
+        if found != expected:
+            problems.append(f"search({query!r}, {category!r}, {low}, {high}) found {len(found)} items, "
+                            f"not {len(expected)}")
+            continue
+        size = rng.randrange(1, 30)
+        count = max(1, -(-len(found) // size))
+        pages = [catalog.page(found, number, size) for number in range(1, count + 1)]
+        if (tuple(i for page in pages for i in page.items) != found
+                or any(page.pages != count for page in pages)
+                or catalog.page(found, count + 1, size) != pages[-1]):
+            problems.append(f"pages of {size} do not split the {len(found)} results of {query!r} in order")
+    return problems
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+CHECKS = {
+    "redis": check_redis,
+    "ranks": check_ranks,
+    "catalog": check_catalog,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", help=f"comma-separated patterns of checks to run, of {', '.join(CHECKS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, APP_DIR)
+
+    names = [n for n in CHECKS if not args.only or any(fnmatch.fnmatch(n, p) for p in args.only.split(","))]
+    if not names:
+        print(f"error: --only {args.only!r} matches no check; checks are {', '.join(CHECKS)}", file=sys.stderr)
+        return 2
+    failed = False
+    for name in names:
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="checks-") as workdir:
+            try:
+                problems = CHECKS[name](args.seed, workdir)
+            except Skipped as e:
+                print(f"{name}: skipped, {e}")
+                continue
+        for problem in problems[:MAX_PROBLEMS]:
+            print(f"{name}: error: {problem}")
+        if len(problems) > MAX_PROBLEMS:
+            print(f"{name}: ... and {len(problems) - MAX_PROBLEMS} more")
+        failed = failed or bool(problems)
+        print(f"{name}: {'FAILED' if problems else 'ok'} in {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Append-only CSV logs shared by several processes.
+
+The leaderboard, answer and capital ledger logs are all CSV files that rows
+are only ever appended to. append_rows writes a batch under an inter-process
+file lock in one write and fsync; readers remember the byte offset they got
+to and only parse the complete rows appended since.
+"""
+import csv
+import io
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+READ_CHUNK = 1 << 20  # bytes of an append-only log read at a time
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive inter-process lock on path (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def append_rows(path, header, rows):
+    """Append CSV rows to path in one write and fsync; header first if the file is empty.
+
+    The file lock covers the header check too, so two processes writing at
+    the same moment cannot both write a header or interleave rows. A failed
+    write is cut off again, so retrying the rows never logs them twice.
+    """
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    data = buf.getvalue().encode("utf-8")
+    with file_lock(path + ".lock"):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            end = os.lseek(fd, 0, os.SEEK_END)
+            if end == 0:
+                head = io.StringIO()
+                csv.writer(head).writerow(header)
+                data = head.getvalue().encode("utf-8") + data
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            except BaseException:
+                os.ftruncate(fd, end)
+                raise
+        finally:
+            os.close(fd)
+
+
+def read_lines(path, offset=0, chunk_bytes=READ_CHUNK):
+    """Yield (end offset, lines) of the complete lines of path from offset on, a chunk at a time."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if lines and not lines[-1].endswith(b"\n"):
+                lines.pop()  # a writer is halfway through this row
+            if not lines:
+                return
+            offset += sum(map(len, lines))
+            f.seek(offset)
+            yield offset, lines
+
+
+def read_rows(path, offset=0):
+    """Yield (end offset, fields) for every complete, non-blank CSV row of path from offset on."""
+    for _, lines in read_lines(path, offset):
+        for line in lines:
+            offset += len(line)
+            fields = next(csv.reader([line.decode("utf-8")]), None)
+            if fields:
+                yield offset, fields
@@ -0,0 +1,464 @@
+"""JSON API over the game engine, for lightweight web and mobile clients.
+
+A small HTTP/1.1 server on asyncio streams (standard library only) with
+keep-alive connections, so a client pays one request per move instead of a
+full Streamlit rerun and a websocket round trip. The rules are the ones
+the Streamlit app plays by: both go through one GameEngine per process.
+
+A player's requests are handled one at a time, behind a per-player lock,
+so a PlayerState is never changed by two requests at once. Moves that only
+touch memory run on the event loop. Anything that may wait runs on a
+thread pool: reading a store (login, resuming a player, leaderboard views)
+or the rank index (standing, saving a round).
+
+Players authenticate with the X-Player and X-Token headers, the same name
+and resume code the app shows, so a game started in the app can be
+continued over the API. Bodies and responses are JSON; errors are
+{"error": message} with 400 (bad request), 401 (unknown player or token),
+404, 405, 409 (a move the rules do not allow right now) or 413 (body too
+large).
+
+    POST /login     {"name": "Ann"}                   -> username and token
+    GET  /me                                          -> capital, items, round, rank
+    GET  /categories                                  -> categories and difficulties
+    POST /round     {"category": "...", "difficulty": [100, 300]}
+    GET  /question                                    -> current question; starts its timer
+    POST /answer    {"choice": "option text"}         -> result and explanation
+    POST /next                                        -> next question, or the round's rank
+    GET  /store?q=suit&category=Outfits&min_price=0&max_price=1000&page=1&size=12
+    POST /buy       {"item": "classic-suit"}              (an item's id or name)
+    POST /equip     {"item": "classic-suit"}
+    GET  /top?view=all_time|players|category&category=...&n=10
+
+Run from the app directory:
+
+    python game_api.py --host 0.0.0.0 --port 8600
+"""
+import argparse
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from game_data import get_game_data
+from game_engine import MAX_TIME, VIEWS, WRONG_PENALTY_FACTOR, GameEngine, GameError
+from metrics import metrics
+from session_store import SESSION_TTL
+from store_catalog import PAGE_SIZE
+from warmup import warm_up
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", 8600))
+MAX_BODY = 16 * 1024  # bytes of JSON accepted per request
+MAX_HEADERS = 64
+IDLE_TIMEOUT = 60.0  # seconds a keep-alive connection may wait for its next request
+TOP_MAX = 100  # most rows /top and items /store return
+
+logger = logging.getLogger(__name__)
+
+# blocking handlers may wait on a store or a lock, so they run
+# on the thread pool instead of the event loop
+Route = namedtuple("Route", ["method", "handler", "auth", "blocking"])
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Client:
+    __slots__ = ("player", "last_seen", "lock")
+
+    def __init__(self, player, last_seen):
+        self.player = player
+        self.last_seen = last_seen
+        self.lock = asyncio.Lock()  # held for the whole of each of the player's requests
+
+
+def _int(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise HttpError(400, f"{name} must be an integer")
+
+
+def _text(params, name):
+    value = params.get(name)
+    if not isinstance(value, str) or not value:
+        raise HttpError(400, f"{name} is required")
+    return value
+
+
+def _optional_text(params, name, default=None):
+    value = params.get(name, default)
+    if value is not None and not isinstance(value, str):
+        raise HttpError(400, f"{name} must be a string")
+    return value
+
+
+class GameAPI:
+    """Routes requests to the engine and keeps the players of open API sessions in memory."""
+
+    def __init__(self, engine, ttl=SESSION_TTL):
+        self.engine = engine
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._clients = {}  # username -> _Client
+        self._next_prune = 0.0
+        self.routes = {
+            "/login": Route("POST", self.login, False, True),
+            "/me": Route("GET", self.me, True, True),
+            "/categories": Route("GET", self.categories, False, False),
+            "/round": Route("POST", self.start_round, True, False),
+            "/question": Route("GET", self.question, True, False),
+            "/answer": Route("POST", self.answer, True, False),
+            "/next": Route("POST", self.next_question, True, True),
+            "/store": Route("GET", self.store, True, False),
+            "/buy": Route("POST", self.buy, True, False),
+            "/equip": Route("POST", self.equip, True, False),
+            "/top": Route("GET", self.top, False, True),
+        }
+
+    async def handle(self, method, target, headers, body):
+        """(status, JSON-able payload) for one request."""
+        url = urlsplit(target)
+        route = self.routes.get(url.path)
+        if route is None:
+            raise HttpError(404, f"no such endpoint {url.path}")
+        if method != route.method:
+            raise HttpError(405, f"{url.path} takes {route.method}")
+        params = dict(parse_qsl(url.query))
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise HttpError(400, "body is not valid JSON")
+            if not isinstance(payload, dict):
+                raise HttpError(400, "body must be a JSON object")
+            params.update(payload)
+
+        with metrics.timer(f"api{url.path.replace('/', '.')}"):
+            client = await self._authenticate(headers) if route.auth else None
+            async with client.lock if client else contextlib.nullcontext():
+                player = client.player if client else None
+                try:
+                    if route.blocking:
+                        loop = asyncio.get_running_loop()
+                        result = await loop.run_in_executor(None, route.handler, player, params)
+                    else:
+                        result = route.handler(player, params)
+                except GameError as e:
+                    raise HttpError(409, str(e))
+        return 200, result
+
+    async def _authenticate(self, headers):
+        username, token = headers.get("x-player"), headers.get("x-token")
+        if not username or not token:
+            raise HttpError(401, "send the X-Player and X-Token headers")
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            client = self._clients.get(username)
+        if client is None:
+            # A player from the app or an earlier API process: resume the saved game
+            loop = asyncio.get_running_loop()
+            player = await loop.run_in_executor(None, self.engine.resume, username, token)
+            if player is None:
+                raise HttpError(401, "no saved game matches that player and token")
+            # Another request may have resumed the same player meanwhile
+            with self._lock:
+                client = self._clients.setdefault(username, _Client(player, now))
+        if not hmac.compare_digest(client.player.resume_token.encode(), token.encode()):
+            raise HttpError(401, "no saved game matches that player and token")
+        client.last_seen = now
+        return client
+
+    def _prune(self, now):
+        """Forget players idle for longer than the session store keeps them."""
+        if now < self._next_prune:
+            return
+        cutoff = now - self.ttl
+        self._clients = {u: c for u, c in self._clients.items() if c.last_seen >= cutoff}
+        self._next_prune = now + self.ttl / 4
+
+    # -------------------------
+    # VIEWS
+    # -------------------------
+    def _player(self, player):
+        return {
+            "username": player.username,
+            "money": player.money,
+            "inventory": sorted(player.inventory),
+            "equipped": player.equipped,
+            "category": player.category,
+            "question": player.index + 1 if player.index < len(player.round_ids) else None,
+            "round_size": len(player.round_ids),
+            "finished": self.engine.finished(player),
+        }
+
+    def _question(self, player, q):
+        view = {
+            "category": player.category,
+            "number": player.index + 1,
+            "of": len(player.round_ids),
+            "question": q.question,
+            "options": list(q.options),
+            "value": q.value,
+            "penalty": int(q.value * WRONG_PENALTY_FACTOR),
+            "max_time": MAX_TIME,
+            "time_left": round(self.engine.time_left(player), 3),
+            "answered": player.has_answered,
+        }
+        if player.has_answered:
+            view.update(
+                correct=player.last_correct,
+                reward=player.last_reward,
+                answer=q.options[q.answer],
+                explanation=q.explanation,
+                money=player.money,
+            )
+        return view
+
+    def _standing(self, player):
+        standing = self.engine.standing(player)
+        return standing._asdict() if standing else None
+
+    # -------------------------
+    # HANDLERS
+    # -------------------------
+    def login(self, _, params):
+        player = self.engine.login(_text(params, "name"))
+        with self._lock:
+            self._clients[player.username] = _Client(player, time.monotonic())
+        return {"username": player.username, "token": player.resume_token}
+
+    def me(self, player, _):
+        return {**self._player(player), "standing": self._standing(player)}
+
+    def categories(self, _, __):
+        questions = get_game_data().questions
+        return {
+            "categories": [
+                {"name": name, "questions": len(c), "difficulties": list(c.difficulties)}
+                for name, c in questions.items()
+            ]
+        }
+
+    def start_round(self, player, params):
+        difficulty = params.get("difficulty")
+        if difficulty is not None and not (
+            isinstance(difficulty, list) and len(difficulty) == 2
+            and all(isinstance(v, int) for v in difficulty)
+        ):
+            raise HttpError(400, "difficulty must be [min, max] question values")
+        self.engine.start_round(player, _text(params, "category"), difficulty)
+        return self._player(player)
+
+    def question(self, player, _):
+        if not self.engine.check_round(player):
+            raise GameError("Start a round first.")
+        q = self.engine.current_question(player)
+        if q is None:
+            return {"finished": True, "money": player.money}
+        self.engine.start_question(player)
+        return {"finished": False, **self._question(player, q)}
+
+    def answer(self, player, params):
+        if not self.engine.check_round(player):
+            raise GameError("Start a round first.")
+        self.engine.submit_answer(player, _optional_text(params, "choice"))
+        return self._question(player, self.engine.current_question(player))
+
+    def next_question(self, player, _):
+        if not self.engine.check_round(player):
+            raise GameError("Start a round first.")
+        if not self.engine.finished(player):
+            if not player.has_answered:
+                raise GameError("Answer the question first.")
+            self.engine.next_question(player)
+        if not self.engine.finished(player):
+            return {"finished": False, "number": player.index + 1}
+        self.engine.save_to_leaderboard(player)
+        return {"finished": True, "money": player.money, "standing": self._standing(player)}
+
+    def store(self, player, params):
+        catalog = get_game_data().catalog
+        min_price, max_price = params.get("min_price"), params.get("max_price")
+        results = catalog.search(
+            _optional_text(params, "q", "").strip(),
+            _optional_text(params, "category") or None,
+            None if min_price is None else _int(params, "min_price", 0),
+            None if max_price is None else _int(params, "max_price", 0),
+        )
+        shown = catalog.page(
+            results, _int(params, "page", 1), min(max(_int(params, "size", PAGE_SIZE), 1), TOP_MAX)
+        )
+        return {
+            "money": player.money,
+            "categories": list(catalog.categories),
+            "page": shown.number,
+            "pages": shown.pages,
+            "total": shown.total,
+            "items": [
+                {"id": i.id, "name": i.name, "category": i.category, "price": i.price,
+                 "emoji": i.emoji, "owned": player.owns(i.name)}
+                for i in shown.items
+            ],
+        }
+
+    def buy(self, player, params):
+        self.engine.purchase(player, _text(params, "item"))
+        return self._player(player)
+
+    def equip(self, player, params):
+        self.engine.equip(player, _text(params, "item"))
+        return self._player(player)
+
+    def top(self, _, params):
+        view = _optional_text(params, "view", VIEWS[0])
+        if view not in VIEWS:
+            raise HttpError(400, f"view must be one of {', '.join(VIEWS)}")
+        n = min(max(_int(params, "n", 10), 1), TOP_MAX)
+        rows = self.engine.top(view, n, _optional_text(params, "category"))
+        return {"view": view, "rows": rows or []}
+
+
+# -------------------------
+# HTTP
+# -------------------------
+async def _read_request(reader):
+    """(method, target, version, headers, body), or None once the client has closed the connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+    headers = {}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "too many headers")
+    if "chunked" in headers.get("transfer-encoding", ""):
+        raise HttpError(400, "send a Content-Length body")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "bad Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, f"body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method, target, version, headers, body
+
+
+def _response(status, payload, keep_alive):
+    body = b"" if payload is None else json.dumps(payload, separators=(",", ":")).encode()
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        # Browser clients may be served from another origin
+        "Access-Control-Allow-Origin: *",
+    ]
+    if status == 204:
+        head += [
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type, X-Player, X-Token",
+            "Access-Control-Max-Age: 86400",
+        ]
+    if not keep_alive:
+        head.append("Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve_connection(api, reader, writer, idle_timeout=IDLE_TIMEOUT):
+    """Answer the requests of one keep-alive connection until either side closes it."""
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(_read_request(reader), idle_timeout)
+            except HttpError as e:
+                # The rest of the stream cannot be trusted; answer and hang up
+                writer.write(_response(e.status, {"error": str(e)}, False))
+                await writer.drain()
+                return
+            if request is None:
+                return
+            method, target, version, headers, body = request
+            connection = headers.get("connection", "").lower()
+            if version == "HTTP/1.0":
+                keep_alive = connection == "keep-alive"
+            else:
+                keep_alive = connection != "close"
+
+            if method == "OPTIONS":
+                status, payload = 204, None
+            else:
+                try:
+                    status, payload = await api.handle(method, target, headers, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception:
+                    logger.exception("%s %s failed", method, target)
+                    status, payload = 500, {"error": "internal error"}
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, ConnectionError):
+        pass  # idle, truncated, overlong line or reset: just drop the connection
+    finally:
+        writer.close()
+
+
+async def serve(api, host=API_HOST, port=API_PORT, ready=None):
+    """Serve api until cancelled; ready(port) is called once the socket listens."""
+    server = await asyncio.start_server(
+        lambda r, w: serve_connection(api, r, w), host, port, backlog=1024
+    )
+    port = server.sockets[0].getsockname()[1]
+    logger.info("game API listening on http://%s:%d", host, port)
+    if ready is not None:
+        ready(port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    engine = GameEngine.create()
+    threading.Thread(
+        target=warm_up,
+        args=(engine.leaderboard.store, engine.registry, TOP_MAX, engine.ledger, engine.leaderboard.ranks),
+        name="warm-up",
+        daemon=True,
+    ).start()
+    try:
+        asyncio.run(serve(GameAPI(engine), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    # Queued rows and snapshots are written out by the writers' exit handlers
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
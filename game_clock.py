@@ -0,0 +1,35 @@
+"""Clock used for question timing.
+
+The app reads the time through now() so the load tester can swap in a
+SimulatedClock and play a 20-second round without waiting 20 seconds.
+"""
+import threading
+import time
+
+_clock = time.time
+
+
+def now():
+    """Current time in seconds, from whichever clock is installed."""
+    return _clock()
+
+
+def set_clock(clock):
+    """Install a zero-argument callable returning seconds; None restores time.time."""
+    global _clock
+    _clock = clock or time.time
+
+
+class SimulatedClock:
+    """Manually advanced clock, shared by every simulated player."""
+
+    def __init__(self, start=None):
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self._now
+
+    def advance_to(self, t):
+        with self._lock:
+            self._now = max(self._now, t)
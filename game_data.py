@@ -0,0 +1,306 @@
+"""Question bank and store catalog, loaded from the JSON files in data/.
+
+Both files are validated and compiled once into immutable structures that
+every session shares; the store items are also indexed for lookups, filters
+and search (store_catalog.py). get_game_data() hands out the current copy
+and reloads it when either file's mtime changes, so questions can be edited
+during an event without restarting the server.
+
+Questions are addressed by (category, position in the category). Every
+category keeps the value (difficulty) of its questions in a compact array
+and, per value, the positions that have it, so drawing a round filtered by
+difficulty never touches question text. Large banks can be kept as JSON
+Lines (QUESTIONS_FILE=....jsonl, one question with a "category" key per
+line): only those indexes and each question's byte offset stay in memory,
+and a question body is read from the file when a round shows it.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from itertools import chain
+from types import MappingProxyType
+
+from store_catalog import Catalog
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+QUESTIONS_FILE = os.environ.get("QUESTIONS_FILE", os.path.join(DATA_DIR, "questions.json"))
+STORE_ITEMS_FILE = os.path.join(DATA_DIR, "store_items.json")
+RELOAD_CHECK_INTERVAL = 1.0  # seconds between mtime checks
+BODY_CACHE_SIZE = 4096  # lazily read question bodies kept decoded
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Question:
+    question: str
+    options: tuple
+    answer: int
+    value: int
+    explanation: str
+    option_index: MappingProxyType  # option text -> position in options
+
+
+@dataclass(frozen=True)
+class StoreItem:
+    name: str
+    price: int
+    emoji: str
+    category: str
+    id: str  # short stable key, for URLs and widget keys
+
+
+@dataclass(frozen=True)
+class GameData:
+    questions: "QuestionBank"  # category -> Category (a sequence of Question)
+    store_items: MappingProxyType  # store category -> tuple of StoreItem
+    items_by_name: MappingProxyType  # item name -> StoreItem
+    catalog: Catalog  # indexed view of the same items for lookups, filters and search
+    mtimes: tuple
+
+
+def _require(cond, where, message):
+    if not cond:
+        raise ValueError(f"{where}: {message}")
+
+
+def compile_question(where, q):
+    """Validate one parsed question and return it as a Question."""
+    _require(isinstance(q, dict), where, "expected an object")
+    missing = {"question", "options", "answer", "value", "explanation"} - q.keys()
+    _require(not missing, where, f"missing {sorted(missing)}")
+    options = q["options"]
+    _require(
+        isinstance(options, list) and len(options) >= 2
+        and all(isinstance(o, str) for o in options),
+        where, "options must be a list of at least two strings",
+    )
+    _require(len(set(options)) == len(options), where, "options must be unique")
+    _require(
+        isinstance(q["answer"], int) and 0 <= q["answer"] < len(options),
+        where, "answer must be an index into options",
+    )
+    _require(isinstance(q["value"], int) and q["value"] > 0, where, "value must be a positive integer")
+    return Question(
+        question=q["question"],
+        options=tuple(options),
+        answer=q["answer"],
+        value=q["value"],
+        explanation=q["explanation"],
+        option_index=MappingProxyType({o: k for k, o in enumerate(options)}),
+    )
+
+
+def compile_questions(raw):
+    """Validate the parsed questions.json and return it as a QuestionBank."""
+    _require(isinstance(raw, dict) and raw, "questions", "expected a non-empty object of categories")
+    categories = {}
+    for category, questions in raw.items():
+        _require(isinstance(questions, list) and questions, category, "expected a non-empty list")
+        compiled = tuple(compile_question(f"{category}[{i}]", q) for i, q in enumerate(questions))
+        categories[category] = Category(
+            category, array("I", (q.value for q in compiled)), compiled.__getitem__
+        )
+    return QuestionBank(categories)
+
+
+def load_questions_jsonl(path):
+    """Index a JSON Lines question bank; bodies stay in the file until needed."""
+    values, offsets = {}, {}
+    with open(path, "rb") as f:
+        offset = 0
+        for line_no, line in enumerate(f, 1):
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            where = f"{os.path.basename(path)}:{line_no}"
+            try:
+                q = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}") from None
+            _require(isinstance(q, dict) and isinstance(q.get("category"), str), where, "missing category")
+            compile_question(where, q)  # validated now, decoded again when shown
+            values.setdefault(q["category"], array("I")).append(q["value"])
+            offsets.setdefault(q["category"], array("Q")).append(start)
+    _require(values, path, "no questions")
+
+    # The file is opened per read, so a replaced bank leaves no handle open
+    @functools.lru_cache(maxsize=BODY_CACHE_SIZE)
+    def read(category, position):
+        with open(path, "rb") as f:
+            f.seek(offsets[category][position])
+            line = f.readline()
+        return compile_question(f"{category}[{position}]", json.loads(line))
+
+    return QuestionBank({
+        category: Category(category, category_values, functools.partial(read, category))
+        for category, category_values in values.items()
+    })
+
+
+# -------------------------
+# QUESTION BANK
+# -------------------------
+class Category(Sequence):
+    """The questions of one category, indexed by value (difficulty)."""
+
+    def __init__(self, name, values, load):
+        self.name = name
+        self.values = values  # array of each question's value, by position
+        self._load = load  # position -> Question
+        by_value = {}
+        for position, value in enumerate(values):
+            by_value.setdefault(value, array("I")).append(position)
+        self.by_value = MappingProxyType(dict(sorted(by_value.items())))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self._load(position)
+
+    @property
+    def difficulties(self):
+        """The distinct question values in this category, lowest first."""
+        return tuple(self.by_value)
+
+    def _pools(self, min_value, max_value):
+        return [
+            positions for value, positions in self.by_value.items()
+            if (min_value is None or value >= min_value) and (max_value is None or value <= max_value)
+        ]
+
+    def count(self, min_value=None, max_value=None):
+        return sum(len(p) for p in self._pools(min_value, max_value))
+
+    def draw(self, n, rng, min_value=None, max_value=None):
+        """Positions of a random round of up to n questions with values in range.
+
+        If the range holds no more than n questions they all play, in bank
+        order. Otherwise n are sampled without building the candidate list,
+        so the cost depends on n and the number of values, not the bank size.
+        """
+        pools = self._pools(min_value, max_value)
+        total = sum(len(p) for p in pools)
+        if total <= n:
+            return array("I", sorted(chain.from_iterable(pools)))
+        ends = []
+        for pool in pools:
+            ends.append((ends[-1] if ends else 0) + len(pool))
+        round_ids = array("I")
+        for k in rng.sample(range(total), n):
+            i = bisect.bisect_right(ends, k)
+            round_ids.append(pools[i][k - (ends[i - 1] if i else 0)])
+        return round_ids
+
+
+class QuestionBank(Mapping):
+    """Category name -> Category, in file order."""
+
+    def __init__(self, categories):
+        self._categories = categories
+
+    def __getitem__(self, category):
+        return self._categories[category]
+
+    def __iter__(self):
+        return iter(self._categories)
+
+    def __len__(self):
+        return len(self._categories)
+
+
+def compile_store_items(raw):
+    """Validate the parsed store_items.json and return category -> tuple of StoreItem."""
+    _require(isinstance(raw, dict), "store_items", "expected an object of categories")
+    categories = {}
+    seen = set()
+    ids = set()
+    for category, items in raw.items():
+        _require(isinstance(items, list), category, "expected a list of items")
+        compiled = []
+        for i, item in enumerate(items):
+            where = f"{category}[{i}]"
+            _require(isinstance(item, dict), where, "expected an object")
+            missing = {"name", "price", "emoji"} - item.keys()
+            _require(not missing, where, f"missing {sorted(missing)}")
+            _require(
+                isinstance(item["name"], str) and isinstance(item["emoji"], str)
+                and isinstance(item.get("id", ""), str),
+                where, "name, emoji and id must be strings",
+            )
+            _require(item["name"] not in seen, where, f"duplicate item name {item['name']!r}")
+            _require(isinstance(item["price"], int) and item["price"] >= 0, where, "price must be a non-negative integer")
+            # Items without an "id" get a slug of their name
+            item_id = item.get("id") or re.sub(r"[^a-z0-9]+", "-", item["name"].lower()).strip("-")
+            _require(item_id and item_id not in ids, where, f"missing or duplicate id {item_id!r}")
+            seen.add(item["name"])
+            ids.add(item_id)
+            compiled.append(StoreItem(item["name"], item["price"], item["emoji"], category, item_id))
+        categories[category] = tuple(compiled)
+    return MappingProxyType(categories)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_game_data(questions_file=QUESTIONS_FILE, store_items_file=STORE_ITEMS_FILE):
+    """Read, validate and compile both data files."""
+    mtimes = (os.stat(questions_file).st_mtime_ns, os.stat(store_items_file).st_mtime_ns)
+    store_items = compile_store_items(_read_json(store_items_file))
+    catalog = Catalog(item for items in store_items.values() for item in items)
+    if questions_file.endswith(".jsonl"):
+        questions = load_questions_jsonl(questions_file)
+    else:
+        questions = compile_questions(_read_json(questions_file))
+    return GameData(
+        questions=questions,
+        store_items=store_items,
+        items_by_name=catalog.by_name,
+        catalog=catalog,
+        mtimes=mtimes,
+    )
+
+
+_lock = threading.Lock()
+_current = None
+_last_check = 0.0
+
+
+def get_game_data():
+    """Return the shared GameData, reloading it if a data file changed."""
+    global _current, _last_check
+    now = time.monotonic()
+    if _current is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _current
+    with _lock:
+        if _current is None:
+            # First load: a broken data file should stop the app from starting.
+            _current = load_game_data()
+        elif now - _last_check >= RELOAD_CHECK_INTERVAL:
+            try:
+                mtimes = (os.stat(QUESTIONS_FILE).st_mtime_ns, os.stat(STORE_ITEMS_FILE).st_mtime_ns)
+                if mtimes != _current.mtimes:
+                    _current = load_game_data()
+                    logger.info("Reloaded question bank and store items")
+            except (OSError, ValueError) as e:
+                # Keep serving the last good copy while the file is being edited.
+                logger.warning("Not reloading game data: %s", e)
+        _last_check = now
+        return _current
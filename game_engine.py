@@ -0,0 +1,293 @@
+"""The rules of the game, without any user interface.
+
+GameEngine applies every rule to a PlayerState: drawing a round, timing
+and scoring answers, moving on, saving a finished round to the
+leaderboard, buying and equipping items. Along the way it makes the
+side effects each move needs: the answer event, the capital ledger entry,
+the session snapshot and the leaderboard row. It never imports Streamlit
+and keeps no per-player state of its own, so one engine per process is
+shared by every client of that process: the Streamlit app (app.py) and the
+JSON API (game_api.py).
+
+A move the rules do not allow right now raises GameError with a message
+that can be shown to the player as is.
+"""
+import logging
+import random
+
+import game_clock
+from answer_analytics import AnswerEvent, AnswerLog
+from capital_ledger import ITEM_SEPARATOR, CapitalLedger, LedgerEvent
+from game_data import get_game_data
+from leaderboard_cache import LeaderboardCache
+from leaderboard_store import open_store
+from leaderboard_writer import BatchWriter, LeaderboardWriter
+from live_round import LiveRound
+from player_state import PlayerState
+from session_store import SessionStore, new_token
+from username_registry import UsernameRegistry
+
+MAX_TIME = 20  # seconds per question
+WRONG_PENALTY_FACTOR = 0.3  # lose 30% of base value on wrong answer
+ROUND_SIZE = 10  # questions drawn per round; smaller categories play in full
+RESUME_WAIT = 2.0  # seconds a resume waits for queued ledger events to be written
+VIEWS = ("all_time", "players", "category")  # leaderboard views for top()
+
+logger = logging.getLogger(__name__)
+
+
+class GameError(Exception):
+    """A move the rules do not allow right now; the message is for the player."""
+
+
+class GameEngine:
+    """Game rules over the process-wide resources; safe to share between sessions."""
+
+    def __init__(self, leaderboard, leaderboard_writer, answer_writer, ledger, ledger_writer,
+                 sessions, registry, live_round, rng=random):
+        self.leaderboard = leaderboard  # LeaderboardCache
+        self.leaderboard_writer = leaderboard_writer
+        self.answer_writer = answer_writer
+        self.ledger = ledger
+        self.ledger_writer = ledger_writer
+        self.sessions = sessions
+        self.registry = registry
+        self.live_round = live_round
+        self.rng = rng
+
+    @classmethod
+    def create(cls, store=None):
+        """An engine with its own resources, for a process that does not run the app."""
+        leaderboard = LeaderboardCache(store or open_store())
+        ledger = CapitalLedger()
+        return cls(
+            leaderboard,
+            LeaderboardWriter(leaderboard),
+            BatchWriter(AnswerLog(), name="answer-writer"),
+            ledger,
+            BatchWriter(ledger, name="ledger-writer", retries=None),
+            SessionStore(),
+            UsernameRegistry(leaderboard.store),
+            LiveRound(MAX_TIME, WRONG_PENALTY_FACTOR),
+        )
+
+    # -------------------------
+    # PLAYERS
+    # -------------------------
+    def login(self, name):
+        """A new player under a free variant of name, with a fresh resume token."""
+        name = (name or "").strip()
+        if not name:
+            raise GameError("Please enter a player name.")
+        player = PlayerState(username=self.registry.allocate(name), resume_token=new_token())
+        self.persist(player)
+        return player
+
+    def resume(self, username, token):
+        """The saved player for username and token, or None if nothing matched."""
+        state = self.sessions.load(username, token)
+        if state is None:
+            return None
+        player = PlayerState.from_dict(state)
+        player.username = username
+        player.resume_token = token
+        # Capital and items come from the ledger; the saved snapshot can be seconds older.
+        # A ledger that cannot catch up in time leaves the snapshot's balance.
+        if not self.ledger_writer.flush(RESUME_WAIT):
+            logger.warning("Ledger writes are behind; resuming %s from the saved snapshot", username)
+            return player
+        balance = self.ledger.balance(username)
+        if balance is not None:
+            player.money, player.inventory = balance.money, balance.inventory
+        elif player.money or player.inventory:
+            # Saved before the ledger existed: carry the balance over once
+            self.ledger_writer.put(LedgerEvent(
+                game_clock.now(), username, "opening", player.money,
+                ITEM_SEPARATOR.join(sorted(player.inventory)),
+            ))
+        return player
+
+    def persist(self, player):
+        """Snapshot the player's progress; the store writes it out in the background."""
+        if player.username and player.resume_token:
+            self.sessions.snapshot(player.username, player.resume_token, player.to_dict())
+
+    def _record_capital(self, player, kind, amount, detail):
+        self.ledger_writer.put(LedgerEvent(game_clock.now(), player.username, kind, amount, detail))
+
+    # -------------------------
+    # ROUNDS
+    # -------------------------
+    def start_round(self, player, category, difficulty=None):
+        """Draw a round of the category's questions (within difficulty) and start it."""
+        questions = get_game_data().questions
+        if category not in questions:
+            raise GameError(f"There is no category {category!r}.")
+        low, high = difficulty or (None, None)
+        round_ids = questions[category].draw(ROUND_SIZE, self.rng, low, high)
+        if not round_ids:
+            raise GameError("No questions of that difficulty in this category.")
+        player.start_category(category, round_ids, tuple(difficulty) if difficulty else None)
+        self.persist(player)
+
+    def reset_category(self, player):
+        """Leave the round and go back to category selection."""
+        player.reset_category()
+        self.persist(player)
+
+    def check_round(self, player):
+        """Reset a round the question bank can no longer serve; True if it is still playable.
+
+        A hot-reloaded bank may have dropped the category or shrunk under the
+        round, and a session saved before rounds were drawn has none.
+        """
+        if player.category is None:
+            return False
+        questions = get_game_data().questions
+        if (
+            player.category not in questions
+            or not player.round_ids
+            or max(player.round_ids) >= len(questions[player.category])
+        ):
+            self.reset_category(player)
+            return False
+        return True
+
+    def round_questions(self, player):
+        """The questions of the player's current round."""
+        if player.category is None:
+            return ()
+        category = get_game_data().questions[player.category]
+        return [category[i] for i in player.round_ids]
+
+    def current_question(self, player):
+        """The question being played, or None between rounds or once the round is over."""
+        if player.category is None or player.index >= len(player.round_ids):
+            return None
+        return get_game_data().questions[player.category][player.question_id()]
+
+    def start_question(self, player):
+        """Start the timer of the current question the first time it is shown."""
+        if player.start_question(game_clock.now()):
+            self.persist(player)
+
+    def time_left(self, player):
+        return player.time_left(game_clock.now(), MAX_TIME)
+
+    def submit_answer(self, player, choice):
+        """Score the answer to the current question against the server-side start time."""
+        q = self.current_question(player)
+        if q is None:
+            raise GameError("There is no question to answer.")
+        if player.has_answered:
+            raise GameError("This question was already answered.")
+        now = game_clock.now()
+        choice_index, time_passed = player.answer(q, choice, now, MAX_TIME, WRONG_PENALTY_FACTOR)
+
+        # Analytics event; written by a background thread
+        self.answer_writer.put(AnswerEvent(
+            player.username,
+            player.category,
+            player.question_id(),
+            choice_index,
+            player.last_correct,
+            time_passed,
+            player.last_reward,
+            now,
+            q.value,
+            MAX_TIME,
+        ))
+        self._record_capital(player, "answer", player.last_reward, f"{player.category}#{player.question_id()}")
+        self.persist(player)
+
+    def submit_live_answer(self, player, state, choice):
+        """Score an answer to the live question against the round's shared start time."""
+        answer = self.live_round.submit(state.round_id, player.username, choice)
+        if answer is None or not player.answer_live(state.round_id, answer.reward):
+            return
+
+        self.answer_writer.put(AnswerEvent(
+            player.username,
+            state.category,
+            state.index,
+            answer.choice,
+            answer.correct,
+            answer.time_passed,
+            answer.reward,
+            game_clock.now(),
+            state.question.value,
+            state.duration,
+        ))
+        self._record_capital(player, "live", answer.reward, state.round_id)
+        self.persist(player)
+
+    def next_question(self, player):
+        """Move to the next question and reset per-question state."""
+        player.next_question()
+        self.persist(player)
+
+    def finished(self, player):
+        return player.category is not None and player.index >= len(player.round_ids)
+
+    def save_to_leaderboard(self, player):
+        """Record the player's result on the leaderboard once per finished round."""
+        if player.saved_this_round:
+            return
+
+        # Ranked right away; the row itself is queued for the background writer
+        self.leaderboard.ranks.offer(player.username, player.money)
+        self.leaderboard_writer.submit(
+            player.username,
+            player.money,
+            player.category,
+            game_clock.now(),
+        )
+
+        player.mark_saved()
+        self.persist(player)
+
+    # -------------------------
+    # STORE
+    # -------------------------
+    def purchase(self, player, name):
+        """Buy a store item by name or id; returns the StoreItem."""
+        item = get_game_data().catalog.get(name)
+        if item is None:
+            raise GameError(f"There is no item {name!r}.")
+        if player.owns(item.name):
+            raise GameError(f"You already own {item.name}.")
+        if not player.purchase(item):
+            raise GameError("Not enough capital to buy this.")
+        self._record_capital(player, "purchase", -item.price, item.name)
+        self.persist(player)
+        return item
+
+    def equip(self, player, name):
+        """Wear an owned item, given by name or id."""
+        item = get_game_data().catalog.get(name)
+        if item is None or not player.owns(item.name):
+            raise GameError(f"You do not own {name!r}.")
+        player.equip(item.name)
+        self.persist(player)
+
+    # -------------------------
+    # LEADERBOARD
+    # -------------------------
+    def top(self, view="all_time", n=10, category=None):
+        """Top n leaderboard rows of a view; the store is only read after new scores land."""
+        store = self.leaderboard.store
+        if view == "all_time":
+            query = lambda: store.top(n)
+        elif view == "players":
+            query = lambda: store.top_players(n)
+        elif view == "category":
+            if category not in get_game_data().questions:
+                raise GameError(f"There is no category {category!r}.")
+            query = lambda: store.top_in_category(category, n)
+        else:
+            raise GameError(f"Unknown leaderboard view {view!r}; use one of {', '.join(VIEWS)}.")
+        return self.leaderboard.get(("rows", view, category, n), query)
+
+    def standing(self, player):
+        """The player's rank among all players, or None before their first finished round."""
+        return self.leaderboard.ranks.standing(player.username)
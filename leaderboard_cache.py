@@ -0,0 +1,96 @@
+"""Versioned, process-wide cache of leaderboard views.
+
+The cache sits between the background LeaderboardWriter and the store. Each
+committed batch bumps a version number; views built from the store (or any
+derived object such as a rendered table) are cached per key and rebuilt
+only when the version has moved on, so an idle leaderboard page costs no
+store reads no matter how often it reruns. Open leaderboard pages subscribe
+to be woken when new scores land; wake-ups are coalesced to at most one per
+NOTIFY_INTERVAL so a burst of finished rounds causes one refresh, not many.
+
+Stores that can watch for writes by other server processes (the shared
+Redis backend) bump the version for those too. Otherwise such rows bump
+nothing here, so cached views are also rebuilt once older than MAX_AGE.
+
+The cache also owns the process's RankIndex, which is offered every row
+written through it, so "your rank" never needs a store read.
+"""
+import logging
+import threading
+import time
+
+from notifications import Subscribers
+from rank_index import RankIndex
+
+NOTIFY_INTERVAL = 1.0  # seconds between wake-ups of open leaderboard pages
+MAX_AGE = 10.0  # seconds before a view is rebuilt even without a local write
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardCache:
+    """Caches views of a leaderboard store until the next committed write."""
+
+    def __init__(self, store, notify_interval=NOTIFY_INTERVAL, max_age=MAX_AGE):
+        self.store = store
+        self.notify_interval = notify_interval
+        self.max_age = max_age
+        self.subscribers = Subscribers()
+        self.ranks = RankIndex(store)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._views = {}  # key -> (version, built at, value)
+        self._last_notify = 0.0
+        self._notify_timer = None
+        store.watch(self._changed)
+
+    def add_many(self, rows):
+        """Write rows to the store, then invalidate the cached views."""
+        self.store.add_many(rows)
+        # The rows are stored by now, so a failure must not have the writer retry them
+        try:
+            self.ranks.offer_many(rows)
+        except Exception:
+            logger.exception("Could not offer %d stored rows to the rank index", len(rows))
+        self.bump()
+
+    def add(self, username, capital, category=None, timestamp=None):
+        self.add_many([(username, capital, category, timestamp)])
+
+    def bump(self):
+        """Mark every cached view stale and schedule a wake-up of the subscribers."""
+        with self._lock:
+            self.version += 1
+            if self._notify_timer is not None:
+                return  # a wake-up is already on its way and will see this version
+            delay = max(0.0, self._last_notify + self.notify_interval - time.monotonic())
+            self._notify_timer = threading.Timer(delay, self._notify)
+            self._notify_timer.daemon = True
+            self._notify_timer.start()
+
+    def get(self, key, build):
+        """Cached value for key, rebuilt with build() if the leaderboard changed since."""
+        with self._lock:
+            cached = self._views.get(key)
+            if (
+                cached is not None
+                and cached[0] == self.version
+                and time.monotonic() - cached[1] < self.max_age
+            ):
+                return cached[2]
+            # Built under the lock so a wave of woken pages queries the store once
+            version = self.version
+            value = build()
+            self._views[key] = (version, time.monotonic(), value)
+            return value
+
+    def _changed(self):
+        # Possibly by another process, whose rows were not offered to the ranks
+        self.ranks.mark_stale()
+        self.bump()
+
+    def _notify(self):
+        with self._lock:
+            self._notify_timer = None
+            self._last_notify = time.monotonic()
+        self.subscribers.notify()
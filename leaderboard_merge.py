@@ -0,0 +1,204 @@
+"""Merge leaderboards from several events into the app's leaderboard store.
+
+Every input file is one event: a leaderboard.csv from one machine, with the
+old ["username", "capital"] columns or the current ones. Events are merged
+in the order given, and names are resolved like on the login screen: the
+first event (or the store, if it already has the name) keeps "Alice", the
+next event's Alice becomes "Alice (1)", and so on. Within an event names are
+allocated in sorted order, so the same inputs always give the same result.
+
+Duplicates are dropped at two levels. An input whose bytes are the same as,
+or a prefix of, another input (a copy of a log taken before the event
+ended) is skipped. Rows with a timestamp are sorted in bounded runs on disk
+and merged, so a round logged twice by an event ends up on adjacent lines
+and is written once; rows without a timestamp cannot be told apart from a
+second round with the same score and are all kept.
+
+Memory holds one run of rows and every distinct username: the registry keeps
+the names already in the store and each one an event takes, so it grows
+with all players of every merged event, but never holds their rows. Rows
+reach the store through its bulk_load(): large add_many batches, or for
+SQLite one transaction that rebuilds the capital index once:
+
+    python leaderboard_merge.py events/room-a.csv events/room-b.csv --backend sqlite
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import os
+import sys
+import tempfile
+import time
+
+from leaderboard_store import BULK_BATCH, FIELDS, make_row, open_store
+from username_registry import UsernameRegistry
+
+CHUNK_ROWS = 500_000  # rows per sorted run on disk
+HASH_BLOCK = 1 << 20
+
+
+def _digest(path, size=None):
+    """sha256 of the file, or of its first size bytes."""
+    h = hashlib.sha256()
+    left = os.path.getsize(path) if size is None else size
+    with open(path, "rb") as f:
+        while left:
+            block = f.read(min(HASH_BLOCK, left))
+            if not block:
+                break
+            h.update(block)
+            left -= len(block)
+    return h.hexdigest()
+
+
+def distinct_inputs(paths):
+    """(kept paths in the given order, {skipped path: path that contains it})."""
+    sizes = {p: os.path.getsize(p) for p in paths}
+    kept, skipped = [], {}
+    # Largest first, so a partial copy is always compared with the full log
+    for path in sorted(paths, key=lambda p: -sizes[p]):
+        digest = _digest(path)
+        for other in kept:
+            if _digest(other, sizes[path]) == digest:
+                skipped[path] = other
+                break
+        else:
+            kept.append(path)
+    return [p for p in paths if p in kept], skipped
+
+
+def _records(path):
+    """Raw fields of every row of one event's file, header lines skipped."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for fields in csv.reader(f):
+            # Older files have only the username and capital columns
+            if fields and fields[:2] != FIELDS[:2]:
+                yield fields
+
+
+def event_rows(path):
+    return (make_row(*fields[:4]) for fields in _records(path))
+
+
+class _DryRun:
+    """Name source for --dry-run: sees the store's names, registers nothing."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def usernames(self):
+        return self._store.usernames()
+
+    def register_username(self, name):
+        return True
+
+
+def _write_run(rows, tmpdir):
+    rows.sort()
+    f = tempfile.NamedTemporaryFile("w", newline="", encoding="utf-8", dir=tmpdir,
+                                    prefix="merge-run-", suffix=".csv", delete=False)
+    with f:
+        csv.writer(f).writerows(rows)
+    return f.name
+
+
+def _read_run(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for ts, username, capital, category in csv.reader(f):
+            yield float(ts), username, int(capital), category
+
+
+def merge(paths, store, chunk_rows=CHUNK_ROWS, batch_rows=BULK_BATCH, tmpdir=None, dry_run=False):
+    """Merge the leaderboard files at paths into store; returns a stats dict."""
+    started = time.perf_counter()
+    paths, skipped = distinct_inputs(paths)
+    registry = UsernameRegistry(_DryRun(store) if dry_run else store)
+    stats = {"files": len(paths), "skipped_files": skipped, "read": 0,
+             "duplicates": 0, "written": 0, "renames": []}
+
+    def merged(workdir):
+        runs, buffer = [], []
+        for path in paths:
+            names = {}
+            for base in sorted({fields[0] for fields in _records(path)}):
+                names[base] = registry.allocate(base)
+                if names[base] != base:
+                    stats["renames"].append((path, base, names[base]))
+            for row in event_rows(path):
+                stats["read"] += 1
+                username = names[row["username"]]
+                if row["timestamp"] is None:
+                    yield username, row["capital"], row["category"], None
+                    continue
+                buffer.append((row["timestamp"], username, row["capital"], row["category"] or ""))
+                if len(buffer) >= chunk_rows:
+                    runs.append(_write_run(buffer, workdir))
+                    buffer = []
+        if buffer:
+            runs.append(_write_run(buffer, workdir))
+            buffer = []
+
+        # Runs are sorted by timestamp first, so the store receives the rounds
+        # in the order they were played and equal rows are neighbours.
+        previous = None
+        for entry in heapq.merge(*(_read_run(r) for r in runs)):
+            if entry == previous:
+                stats["duplicates"] += 1
+                continue
+            previous = entry
+            ts, username, capital, category = entry
+            yield username, capital, category or None, ts
+
+    def counted(rows):
+        for row in rows:
+            stats["written"] += 1
+            yield row
+
+    with tempfile.TemporaryDirectory(prefix="leaderboard-merge-", dir=tmpdir) as workdir:
+        rows = counted(merged(workdir))
+        if dry_run:
+            for _ in rows:
+                pass
+        else:
+            store.bulk_load(rows, batch_rows)
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("inputs", nargs="+", help="leaderboard CSV files, one per event, oldest first")
+    parser.add_argument("--backend", help="LEADERBOARD_BACKEND of the target store")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per sorted run on disk")
+    parser.add_argument("--batch-rows", type=int, default=BULK_BATCH,
+                        help="rows per store write (SQLite loads everything in one transaction)")
+    parser.add_argument("--tmpdir", help="directory for the sorted runs (default: system temp)")
+    parser.add_argument("--renames", help="write the renamed players to this CSV")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be merged, write nothing")
+    args = parser.parse_args(argv)
+
+    for path in args.inputs:
+        if not os.path.isfile(path):
+            parser.error(f"no such file: {path}")
+    store = open_store(args.backend)
+    stats = merge(args.inputs, store, args.chunk_rows, args.batch_rows, args.tmpdir, args.dry_run)
+
+    for path, other in stats["skipped_files"].items():
+        print(f"skipped {path}: contained in {other}")
+    if args.renames:
+        with open(args.renames, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "username", "merged_as"])
+            writer.writerows(stats["renames"])
+    verb = "would write" if args.dry_run else "wrote"
+    rate = stats["written"] / stats["seconds"] * 60 if stats["seconds"] else 0
+    print(f"{stats['files']} events, {stats['read']} rows read, {stats['duplicates']} duplicates, "
+          f"{len(stats['renames'])} players renamed")
+    print(f"{verb} {stats['written']} rows in {stats['seconds']:.1f}s ({rate:,.0f} rows/min)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""Compacted leaderboard snapshots for the CSV backend.
+
+leaderboard.csv is an append-only log. Compaction folds it into
+leaderboard.snap, a binary snapshot of every row sorted by capital (then
+arrival order), and truncates the CSV so it only holds rows added since:
+the delta. A reader maps the snapshot into memory, takes the top rows and
+the precomputed best-per-player / best-per-category entries straight from
+it, and parses only the delta as text.
+
+Snapshot layout (little-endian, every section 8-byte aligned):
+
+    header      magic, format version, generation and section lengths
+    capital     int64[rows]    sorted descending
+    seq         int64[rows]    arrival order, 0..rows-1
+    timestamp   float64[rows]  NaN when unknown
+    username    uint32[rows]   string table ids
+    category    uint32[rows]   string table ids, NO_STRING when none
+    player      uint32[...]    row of each player's best round, in rank order
+    best_cat    uint32[...]    row of each (category, player) best, in rank order
+    offsets     uint64[strings + 1] into the UTF-8 blob
+    blob        concatenated strings
+
+The generation increases with every compaction; readers notice the new
+file and rebuild their views from it. Run from the app directory:
+
+    python leaderboard_snapshot.py compact
+    python leaderboard_snapshot.py verify
+    python leaderboard_snapshot.py archive-season 2024-fall
+"""
+import argparse
+import csv
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from csv_log import file_lock
+from leaderboard_store import (
+    FIELDS,
+    LEADERBOARD_FILE,
+    SNAPSHOT_FILE,
+    USERNAMES_FILE,
+    CsvLeaderboardStore,
+    make_row,
+)
+
+ARCHIVE_DIR = "seasons"
+MAGIC = b"TIMLBSNP"
+VERSION = 1
+NO_STRING = 0xFFFFFFFF
+HEADER = struct.Struct("<8sIIQQQQ")  # magic, version, generation, rows, player, best_cat, strings
+
+
+def _pad(n):
+    return (n + 7) & ~7
+
+
+class Snapshot:
+    """Read-only view of a snapshot file through a memory map."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("leaderboard snapshots are little-endian")
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.generation, self.count, n_player, n_best_cat, n_strings = (
+            HEADER.unpack_from(self._mmap)
+        )
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} leaderboard snapshot")
+        view = memoryview(self._mmap)
+        pos = _pad(HEADER.size)
+
+        def section(fmt, n, size):
+            nonlocal pos
+            start = pos
+            pos += _pad(n * size)
+            if pos > len(view):
+                raise ValueError(f"{path} is truncated")
+            return view[start:start + n * size].cast(fmt)
+
+        n = self.count
+        self.capital = section("q", n, 8)
+        self.seq = section("q", n, 8)
+        self.timestamp = section("d", n, 8)
+        self.username = section("I", n, 4)
+        self.category = section("I", n, 4)
+        self.player_best = section("I", n_player, 4)
+        self.category_best = section("I", n_best_cat, 4)
+        self._offsets = section("Q", n_strings + 1, 8)
+        self._blob = view[pos:pos + self._offsets[n_strings]] if n_strings else view[pos:pos]
+        self._strings = {}
+
+    @classmethod
+    def open(cls, path=SNAPSHOT_FILE):
+        """The snapshot at path, or None if there is none."""
+        return cls(path) if os.path.exists(path) else None
+
+    def close(self):
+        for name in ("capital", "seq", "timestamp", "username", "category",
+                     "player_best", "category_best", "_offsets", "_blob"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, i):
+        if i == NO_STRING:
+            return None
+        s = self._strings.get(i)
+        if s is None:
+            s = self._strings[i] = bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+        return s
+
+    @property
+    def strings(self):
+        return len(self._offsets) - 1
+
+    def row(self, i):
+        ts = self.timestamp[i]
+        return make_row(
+            self.string(self.username[i]),
+            self.capital[i],
+            self.string(self.category[i]),
+            None if math.isnan(ts) else ts,
+        )
+
+    def entry(self, i):
+        """Row i as a view entry: (-capital, seq, row)."""
+        return -self.capital[i], self.seq[i], self.row(i)
+
+    def entries(self, rows=None):
+        """View entries in rank order, for every row or the given row numbers."""
+        for i in range(self.count) if rows is None else rows:
+            yield self.entry(i)
+
+
+def write_snapshot(path, entries, generation):
+    """Write entries, sorted (-capital, seq, row) tuples, as a snapshot at path."""
+    strings = {}
+    capital, seq, timestamp = array("q"), array("q"), array("d")
+    usernames, categories = array("I"), array("I")
+    player_best, category_best = array("I"), array("I")
+    seen_players, seen_categories = set(), set()
+
+    def intern(s):
+        if s is None:
+            return NO_STRING
+        i = strings.get(s)
+        if i is None:
+            i = strings[s] = len(strings)
+        return i
+
+    for i, (neg_capital, s, row) in enumerate(entries):
+        capital.append(-neg_capital)
+        seq.append(s)
+        timestamp.append(math.nan if row["timestamp"] is None else row["timestamp"])
+        usernames.append(intern(row["username"]))
+        categories.append(intern(row["category"]))
+        # Rank order with ties by arrival: the first row of a player is their best
+        if row["username"] not in seen_players:
+            seen_players.add(row["username"])
+            player_best.append(i)
+        if row["category"] and (row["category"], row["username"]) not in seen_categories:
+            seen_categories.add((row["category"], row["username"]))
+            category_best.append(i)
+
+    blob = bytearray()
+    offsets = array("Q", [0])
+    for s in strings:  # dicts keep insertion order, which is the id order
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, generation, len(capital),
+                            len(player_best), len(category_best), len(strings)))
+        for part in (capital, seq, timestamp, usernames, categories,
+                     player_best, category_best, offsets, blob):
+            f.write(b"\0" * (_pad(f.tell()) - f.tell()))
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# -------------------------
+# JOBS
+# -------------------------
+def compact(csv_path=LEADERBOARD_FILE, snapshot_path=SNAPSHOT_FILE):
+    """Fold the delta log into a new snapshot; returns (rows before, delta rows)."""
+    with file_lock(csv_path + ".lock"):
+        snapshot = Snapshot.open(snapshot_path)
+        try:
+            base = snapshot.count if snapshot else 0
+            generation = snapshot.generation + 1 if snapshot else 1
+            delta = sorted(
+                (-row["capital"], base + i, row)
+                for i, (_, row) in enumerate(CsvLeaderboardStore(csv_path).rows())
+            )
+            old = snapshot.entries() if snapshot else ()
+            write_snapshot(snapshot_path, heapq.merge(old, delta, key=lambda e: e[:2]), generation)
+        finally:
+            if snapshot:
+                snapshot.close()
+        # Every row is in the snapshot now; start an empty delta
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(FIELDS)
+            f.flush()
+            os.fsync(f.fileno())
+    return base, len(delta)
+
+
+def verify(snapshot_path=SNAPSHOT_FILE, csv_path=None):
+    """Check a snapshot's invariants (and that the delta parses); returns a list of problems."""
+    problems = []
+    try:
+        snapshot = Snapshot(snapshot_path)
+    except (OSError, ValueError, struct.error) as e:
+        return [f"cannot read {snapshot_path}: {e}"]
+    with snapshot:
+        n = snapshot.count
+        for i in range(1, n):
+            if (-snapshot.capital[i - 1], snapshot.seq[i - 1]) >= (-snapshot.capital[i], snapshot.seq[i]):
+                problems.append(f"rows {i - 1} and {i} are out of order")
+                break
+        if sorted(snapshot.seq) != list(range(n)):
+            problems.append("arrival numbers are not 0..rows-1")
+        bad = [i for i in range(n)
+               if snapshot.username[i] >= snapshot.strings
+               or (snapshot.category[i] != NO_STRING and snapshot.category[i] >= snapshot.strings)]
+        if bad:
+            problems.append(f"{len(bad)} rows point outside the string table, first at row {bad[0]}")
+        else:
+            players, categories, seen = [], [], set()
+            for i in range(n):
+                user, cat = snapshot.username[i], snapshot.category[i]
+                if user not in seen:
+                    seen.add(user)
+                    players.append(i)
+                if cat != NO_STRING and (cat, user) not in seen:
+                    seen.add((cat, user))
+                    categories.append(i)
+            if list(snapshot.player_best) != players:
+                problems.append("best-per-player index does not match the rows")
+            if list(snapshot.category_best) != categories:
+                problems.append("best-per-category index does not match the rows")
+    if csv_path and os.path.exists(csv_path):
+        try:
+            for _ in CsvLeaderboardStore(csv_path).rows():
+                pass
+        except (ValueError, UnicodeDecodeError) as e:
+            problems.append(f"delta log {csv_path} does not parse: {e}")
+    return problems
+
+
+def archive_season(name, csv_path=LEADERBOARD_FILE, snapshot_path=SNAPSHOT_FILE,
+                   archive_dir=ARCHIVE_DIR, usernames_path=USERNAMES_FILE):
+    """Compact, move the snapshot to archive_dir/name.snap and start an empty season."""
+    target = os.path.join(archive_dir, f"{name}.snap")
+    if os.path.exists(target):
+        raise FileExistsError(f"season {name!r} is already archived at {target}")
+    os.makedirs(archive_dir, exist_ok=True)
+    compact(csv_path, snapshot_path)
+    with file_lock(csv_path + ".lock"):
+        with Snapshot(snapshot_path) as snapshot:
+            generation = snapshot.generation
+            names = {snapshot.string(snapshot.username[i]) for i in snapshot.player_best}
+        # Past players keep their names in the new season
+        with open(usernames_path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([n] for n in sorted(names))
+        os.replace(snapshot_path, target)
+        write_snapshot(snapshot_path, (), generation + 1)
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv", default=LEADERBOARD_FILE, help="delta log (leaderboard CSV)")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("compact", help="fold the delta log into the snapshot")
+    commands.add_parser("verify", help="check the snapshot and the delta log")
+    archive = commands.add_parser("archive-season", help="archive the current season and start a new one")
+    archive.add_argument("name", help="season name, used as the archive file name")
+    archive.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "compact":
+        base, delta = compact(args.csv, args.snapshot)
+        print(f"compacted {delta} new rows into {args.snapshot} ({base + delta} rows)")
+    elif args.command == "verify":
+        problems = verify(args.snapshot, args.csv)
+        for p in problems:
+            print(f"error: {p}")
+        if problems:
+            return 1
+        with Snapshot(args.snapshot) as snapshot:
+            print(f"{args.snapshot}: generation {snapshot.generation}, {snapshot.count} rows, "
+                  f"{len(snapshot.player_best)} players, {snapshot.strings} strings: ok")
+    else:
+        target = archive_season(args.name, args.csv, args.snapshot, args.archive_dir)
+        print(f"archived season {args.name!r} to {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,696 @@
+"""Leaderboard storage backends.
+
+The app only talks to a LeaderboardStore. Which backend is used is chosen with
+the LEADERBOARD_BACKEND environment variable:
+
+- "sqlite" (default): SQLite in WAL mode with an index on capital, so reading
+  the top N rows only touches N index entries.
+- "redis": sorted sets on a Redis server (LEADERBOARD_REDIS_URL) shared by
+  every app replica behind a load balancer, so they all see one ranking and
+  one username namespace. Needs the optional redis package.
+- "csv": the original append-only leaderboard.csv. The file is parsed once
+  per process; after that only rows appended since the last read are. Once
+  compacted (see leaderboard_snapshot.py) the CSV only holds the rows added
+  since, and the rest is read from a memory-mapped binary snapshot.
+
+Besides the raw rows, every backend maintains three views, updated on each
+write rather than recomputed on read: all-time top rows, each player's best
+round, and each player's best round per category.
+"""
+import bisect
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from csv_log import append_rows, file_lock, read_rows
+
+LEADERBOARD_FILE = "leaderboard.csv"
+LEADERBOARD_DB = "leaderboard.db"
+USERNAMES_FILE = "usernames.csv"
+SNAPSHOT_FILE = "leaderboard.snap"
+FIELDS = ["username", "capital", "category", "timestamp"]
+VIEW_SIZE = 1000  # entries the CSV backend keeps per in-memory view
+BULK_BATCH = 50_000  # rows per add_many call of a bulk load
+
+
+class LeaderboardStore:
+    """Interface implemented by every leaderboard backend."""
+
+    def add(self, username, capital, category=None, timestamp=None):
+        """Record one finished round."""
+        self.add_many([(username, capital, category, timestamp)])
+
+    def add_many(self, rows):
+        """Record several (username, capital, category, timestamp) rows in one write."""
+        raise NotImplementedError
+
+    def bulk_load(self, rows, batch_size=BULK_BATCH):
+        """Record an iterable of rows of any length, e.g. a merge of past events."""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.add_many(batch)
+                batch = []
+        if batch:
+            self.add_many(batch)
+
+    def top(self, n):
+        """Return the n best rows as dicts, highest capital first."""
+        raise NotImplementedError
+
+    def top_players(self, n):
+        """Return the best row of each of the n best players."""
+        raise NotImplementedError
+
+    def top_in_category(self, category, n):
+        """Return each player's best row in category, for the n best players."""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of rows on the leaderboard."""
+        raise NotImplementedError
+
+    def player_scores(self):
+        """Return (username, best capital) for every player on the leaderboard."""
+        raise NotImplementedError
+
+    def all_rows(self):
+        """Yield every row as a dict, in arrival order."""
+        raise NotImplementedError
+
+    def usernames(self):
+        """Return the set of every username on the leaderboard or registered."""
+        raise NotImplementedError
+
+    def register_username(self, name):
+        """Reserve a username; return False if it was already taken."""
+        raise NotImplementedError
+
+    def watch(self, callback):
+        """Call callback() when another process changes the leaderboard; False if unsupported."""
+        return False
+
+
+def snapshot_stamp(path):
+    """Cheap identity of a snapshot file, to notice a new compaction."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def make_row(username, capital, category=None, timestamp=None):
+    return {"username": username, "capital": int(float(capital)), "category": category or None,
+            "timestamp": float(timestamp) if timestamp not in (None, "") else None}
+
+
+# -------------------------
+# IN-MEMORY VIEWS
+# -------------------------
+class TopN:
+    """The size best rows, sorted by capital and then arrival order."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = []  # sorted (-capital, seq, row)
+
+    def insert(self, entry):
+        if len(self.entries) >= self.size and entry >= self.entries[-1]:
+            return
+        bisect.insort(self.entries, entry)
+        if len(self.entries) > self.size:
+            self.entries.pop()
+
+    def remove(self, entry):
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i][1] == entry[1]:
+            del self.entries[i]
+
+    def top(self, n):
+        return [row for _, _, row in self.entries[:n]]
+
+
+class LeaderboardViews:
+    """Materialized views over a stream of rows, updated one row at a time."""
+
+    def __init__(self, size=VIEW_SIZE):
+        self.size = size
+        self.count = 0
+        self.all_time = TopN(size)
+        self.players = TopN(size)
+        self.player_best = {}  # username -> entry
+        self.categories = {}  # category -> TopN
+        self.category_best = {}  # (category, username) -> entry
+
+    @classmethod
+    def from_snapshot(cls, snapshot, size=VIEW_SIZE):
+        """Views seeded from a compacted snapshot without reading all of its rows."""
+        views = cls(size)
+        views.count = snapshot.count
+        views.all_time.entries = list(snapshot.entries(range(min(size, snapshot.count))))
+        # Both indexes are in rank order, so each view is filled best first
+        for entry in snapshot.entries(snapshot.player_best):
+            views.player_best[entry[2]["username"]] = entry
+            if len(views.players.entries) < size:
+                views.players.entries.append(entry)
+        for entry in snapshot.entries(snapshot.category_best):
+            row = entry[2]
+            views.category_best[(row["category"], row["username"])] = entry
+            view = views.categories.get(row["category"])
+            if view is None:
+                view = views.categories[row["category"]] = TopN(size)
+            if len(view.entries) < size:
+                view.entries.append(entry)
+        return views
+
+    def add(self, row):
+        entry = (-row["capital"], self.count, row)
+        self.count += 1
+        self.all_time.insert(entry)
+        self._offer(self.players, self.player_best, row["username"], entry)
+        if row["category"]:
+            view = self.categories.get(row["category"])
+            if view is None:
+                view = self.categories[row["category"]] = TopN(self.size)
+            self._offer(view, self.category_best, (row["category"], row["username"]), entry)
+
+    @staticmethod
+    def _offer(view, best, key, entry):
+        old = best.get(key)
+        if old is None or entry[0] < old[0]:
+            if old is not None:
+                view.remove(old)
+            view.insert(entry)
+            best[key] = entry
+
+
+# -------------------------
+# CSV BACKEND
+# -------------------------
+class CsvLeaderboardStore(LeaderboardStore):
+    """The original append-only CSV file, with views kept in memory."""
+
+    def __init__(self, path=LEADERBOARD_FILE, usernames_path=USERNAMES_FILE, snapshot_path=SNAPSHOT_FILE):
+        self.path = path
+        self.usernames_path = usernames_path
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._views = LeaderboardViews()
+        self._offset = 0  # bytes of the file already folded into the views
+        self._snapshot_stamp = None  # which snapshot the views were seeded from
+
+    def add_many(self, rows):
+        append_rows(
+            self.path, FIELDS, ([u, int(c), cat or "", "" if ts is None else ts] for u, c, cat, ts in rows)
+        )
+
+    def rows(self, offset=0):
+        """Yield (end offset, row) for every complete row from offset on."""
+        for offset, fields in read_rows(self.path, offset):
+            # Older files have only the username and capital columns
+            if fields[:2] != FIELDS[:2]:
+                yield offset, make_row(*fields[:4])
+
+    def all_rows(self):
+        """Every row in arrival order, compacted or not."""
+        from leaderboard_snapshot import Snapshot
+        snapshot = Snapshot.open(self.snapshot_path)
+        if snapshot is not None:
+            with snapshot:
+                for _, _, row in sorted(snapshot.entries(), key=lambda e: e[1]):
+                    yield row
+        for _, row in self.rows():
+            yield row
+
+    def _catch_up(self):
+        """Fold rows appended since the last read (by any process) into the views."""
+        with self._lock:
+            if self._stamp() != self._snapshot_stamp:
+                self._reload()
+            rows = list(self.rows(self._offset))
+            # A compaction between the two checks truncated the log under us
+            if rows and self._stamp() != self._snapshot_stamp:
+                self._reload()
+                rows = []
+            for offset, row in rows:
+                self._views.add(row)
+                self._offset = offset
+            return self._views
+
+    def _stamp(self):
+        return snapshot_stamp(self.snapshot_path)
+
+    def _reload(self):
+        """Rebuild the views from the snapshot and the whole delta log."""
+        from leaderboard_snapshot import Snapshot  # builds on this module
+        # Compaction holds this lock while it swaps the snapshot and truncates the log
+        with file_lock(self.path + ".lock"):
+            self._snapshot_stamp = self._stamp()
+            snapshot = Snapshot.open(self.snapshot_path)
+            if snapshot is None:
+                self._views = LeaderboardViews()
+            else:
+                with snapshot:
+                    self._views = LeaderboardViews.from_snapshot(snapshot)
+            self._offset = 0
+            for offset, row in self.rows():
+                self._views.add(row)
+                self._offset = offset
+
+    def top(self, n):
+        if n > VIEW_SIZE:
+            raise ValueError(f"the CSV backend keeps only the top {VIEW_SIZE} rows")
+        return self._catch_up().all_time.top(n)
+
+    def top_players(self, n):
+        return self._catch_up().players.top(n)
+
+    def top_in_category(self, category, n):
+        view = self._catch_up().categories.get(category)
+        return view.top(n) if view else []
+
+    def count(self):
+        return self._catch_up().count
+
+    def player_scores(self):
+        return [(username, -entry[0]) for username, entry in self._catch_up().player_best.items()]
+
+    def usernames(self):
+        names = set(self._catch_up().player_best)
+        if os.path.exists(self.usernames_path):
+            with open(self.usernames_path, newline="", encoding="utf-8") as f:
+                names.update(row[0] for row in csv.reader(f) if row)
+        return names
+
+    def register_username(self, name):
+        # No cross-process check here; the registry's lock covers one process.
+        with open(self.usernames_path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow([name])
+        return True
+
+
+# -------------------------
+# SQLITE BACKEND
+# -------------------------
+ROW_COLUMNS = "username, capital, category, timestamp"
+CAPITAL_INDEX = "CREATE INDEX IF NOT EXISTS leaderboard_capital ON leaderboard (capital DESC)"
+
+
+class SqliteLeaderboardStore(LeaderboardStore):
+    """SQLite tables with indexes on capital; every top-N read is an index range scan."""
+
+    def __init__(self, path=LEADERBOARD_DB, import_csv=LEADERBOARD_FILE):
+        self.path = path
+        # Streamlit runs each session's script on its own thread, and sqlite3
+        # connections must stay on the thread that opened them.
+        self._local = threading.local()
+        self._create_schema()
+        if import_csv:
+            self._import_csv(import_csv)
+        self._build_views()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leaderboard ("
+                " id INTEGER PRIMARY KEY,"
+                " username TEXT NOT NULL,"
+                " capital INTEGER NOT NULL,"
+                " category TEXT,"
+                " timestamp REAL)"
+            )
+            # Databases created before categories were recorded
+            columns = {c[1] for c in conn.execute("PRAGMA table_info(leaderboard)")}
+            for column, kind in (("category", "TEXT"), ("timestamp", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE leaderboard ADD COLUMN {column} {kind}")
+            conn.execute(CAPITAL_INDEX)
+            # Materialized views, kept up to date by add_many()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS player_best ("
+                " username TEXT PRIMARY KEY,"
+                " capital INTEGER NOT NULL, category TEXT, timestamp REAL, id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS player_best_capital"
+                " ON player_best (capital DESC, id)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS category_best ("
+                " category TEXT NOT NULL, username TEXT NOT NULL,"
+                " capital INTEGER NOT NULL, timestamp REAL, id INTEGER NOT NULL,"
+                " PRIMARY KEY (category, username))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS category_best_capital"
+                " ON category_best (category, capital DESC, id)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usernames (name TEXT PRIMARY KEY)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def _import_csv(self, csv_path):
+        """One-time migration of an existing leaderboard.csv into the table."""
+        if not os.path.exists(csv_path):
+            return
+        conn = self._connect()
+        with conn:
+            done = conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'imported_csv'"
+            ).fetchone()
+            if done:
+                return
+            rows = CsvLeaderboardStore(csv_path).all_rows()
+            conn.executemany(
+                f"INSERT INTO leaderboard ({ROW_COLUMNS}) VALUES (?, ?, ?, ?)",
+                ((r["username"], r["capital"], r["category"], r["timestamp"]) for r in rows),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO usernames (name) SELECT username FROM leaderboard"
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('imported_csv', ?)", (csv_path,))
+
+    def _build_views(self):
+        """Fill the view tables from existing rows, once per database."""
+        conn = self._connect()
+        with conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'views_built'").fetchone():
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO player_best (username, capital, category, timestamp, id)"
+                " SELECT username, capital, category, timestamp, id FROM ("
+                "  SELECT *, ROW_NUMBER() OVER"
+                "   (PARTITION BY username ORDER BY capital DESC, id) AS rn"
+                "  FROM leaderboard) WHERE rn = 1"
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO category_best (category, username, capital, timestamp, id)"
+                " SELECT category, username, capital, timestamp, id FROM ("
+                "  SELECT *, ROW_NUMBER() OVER"
+                "   (PARTITION BY category, username ORDER BY capital DESC, id) AS rn"
+                "  FROM leaderboard WHERE category IS NOT NULL) WHERE rn = 1"
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('views_built', '1')")
+
+    def add_many(self, rows):
+        conn = self._connect()
+        with conn:
+            (last_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM leaderboard").fetchone()
+            self._insert(conn, rows, last_id)
+
+    def bulk_load(self, rows, batch_size=None):
+        """Record any number of rows in one transaction.
+
+        The capital index is dropped for the load and rebuilt at the end,
+        which is several times faster than updating it row by row. Other
+        writers wait until the load commits; readers keep seeing the old rows.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            (last_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM leaderboard").fetchone()
+            conn.execute("DROP INDEX IF EXISTS leaderboard_capital")
+            self._insert(conn, rows, last_id)
+            conn.execute(CAPITAL_INDEX)
+
+    @staticmethod
+    def _insert(conn, rows, last_id):
+        """Insert rows and offer them to the views.
+
+        Rows get ids above last_id, the largest id before the insert, and the
+        views are updated set-wise from that id range: three statements for
+        any number of rows. Offering a row twice is harmless.
+        """
+        conn.executemany(
+            f"INSERT INTO leaderboard ({ROW_COLUMNS}) VALUES (?, ?, ?, ?)",
+            ((u, int(c), cat or None, ts) for u, c, cat, ts in rows),
+        )
+        conn.execute(
+            "INSERT INTO player_best (username, capital, category, timestamp, id)"
+            " SELECT username, capital, category, timestamp, id FROM ("
+            "  SELECT *, ROW_NUMBER() OVER"
+            "   (PARTITION BY username ORDER BY capital DESC, id) AS rn"
+            "  FROM leaderboard WHERE id > ?) WHERE rn = 1"
+            " ON CONFLICT (username) DO UPDATE SET"
+            "  capital = excluded.capital, category = excluded.category,"
+            "  timestamp = excluded.timestamp, id = excluded.id"
+            " WHERE excluded.capital > player_best.capital",
+            (last_id,),
+        )
+        conn.execute(
+            "INSERT INTO category_best (category, username, capital, timestamp, id)"
+            " SELECT category, username, capital, timestamp, id FROM ("
+            "  SELECT *, ROW_NUMBER() OVER"
+            "   (PARTITION BY category, username ORDER BY capital DESC, id) AS rn"
+            "  FROM leaderboard WHERE id > ? AND category IS NOT NULL) WHERE rn = 1"
+            " ON CONFLICT (category, username) DO UPDATE SET"
+            "  capital = excluded.capital, timestamp = excluded.timestamp,"
+            "  id = excluded.id"
+            " WHERE excluded.capital > category_best.capital",
+            (last_id,),
+        )
+
+    def _rows(self, sql, params):
+        cur = self._connect().execute(sql, params)
+        return [make_row(*r) for r in cur]
+
+    def top(self, n):
+        # Ties are broken by insertion order; the index already stores rowids
+        # in ascending order within each capital value.
+        return self._rows(
+            f"SELECT {ROW_COLUMNS} FROM leaderboard ORDER BY capital DESC, id LIMIT ?", (n,)
+        )
+
+    def top_players(self, n):
+        return self._rows(
+            f"SELECT {ROW_COLUMNS} FROM player_best ORDER BY capital DESC, id LIMIT ?", (n,)
+        )
+
+    def top_in_category(self, category, n):
+        return self._rows(
+            f"SELECT {ROW_COLUMNS} FROM category_best WHERE category = ?"
+            " ORDER BY capital DESC, id LIMIT ?",
+            (category, n),
+        )
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+
+    def player_scores(self):
+        return self._connect().execute("SELECT username, capital FROM player_best").fetchall()
+
+    def all_rows(self):
+        for r in self._connect().execute(f"SELECT {ROW_COLUMNS} FROM leaderboard ORDER BY id"):
+            yield make_row(*r)
+
+    def usernames(self):
+        cur = self._connect().execute(
+            "SELECT username FROM player_best UNION SELECT name FROM usernames"
+        )
+        return {u for (u,) in cur}
+
+    def register_username(self, name):
+        # The primary key makes this atomic across processes sharing the file.
+        conn = self._connect()
+        with conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO usernames (name) VALUES (?)", (name,)
+            )
+        return cur.rowcount == 1
+
+
+# -------------------------
+# REDIS BACKEND
+# -------------------------
+REDIS_URL = os.environ.get("LEADERBOARD_REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = "tim:"
+REDIS_MAX_CONNECTIONS = 20  # per process; callers wait for a free one
+REDIS_CACHE_TTL = 5.0  # seconds a read is reused if no change message arrives
+MAX_ROW_ID = 10**13 - 1
+
+# Keep the member with the higher score in a "best of" sorted set. Atomic on
+# the server, so replicas offering rows for the same player cannot race.
+OFFER_BEST = """
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if old then
+    local old_capital = tonumber(redis.call('ZSCORE', KEYS[1], old))
+    if old_capital and old_capital >= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('ZREM', KEYS[1], old)
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+return 1
+"""
+
+
+class RedisLeaderboardStore(LeaderboardStore):
+    """Sorted sets on a Redis server shared by every app replica.
+
+    Each row is a sorted-set member scored by capital, so a top-N read is one
+    ZREVRANGE. The member carries the row itself behind an inverted, zero
+    padded id, which makes equal scores come back in arrival order. Writes
+    are pipelined: one INCRBY to number a batch, then one MULTI/EXEC with all
+    of its rows. Reads are cached per process and dropped when any replica
+    publishes a change.
+    """
+
+    def __init__(self, url=REDIS_URL, prefix=REDIS_PREFIX, max_connections=REDIS_MAX_CONNECTIONS,
+                 cache_ttl=REDIS_CACHE_TTL):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "The redis leaderboard backend needs the redis package (pip install redis)"
+            ) from None
+        self.prefix = prefix
+        self.cache_ttl = cache_ttl
+        self._redis = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+            url, max_connections=max_connections, decode_responses=True,
+        ))
+        self._offer = self._redis.register_script(OFFER_BEST)
+        self._lock = threading.Lock()
+        self._cache = {}  # key -> (fetched at, value)
+        self._generation = 0  # bumped on every change, so in-flight reads are not cached
+        self._watchers = []
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self._key("changes"): self._on_change})
+        self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _key(self, name):
+        return self.prefix + name
+
+    @staticmethod
+    def _member(row_id, username, capital, category, timestamp):
+        return f"{MAX_ROW_ID - row_id:013d}|" + json.dumps([username, capital, category, timestamp])
+
+    def add_many(self, rows):
+        rows = [(u, int(c), cat or None, ts) for u, c, cat, ts in rows]
+        if not rows:
+            return
+        last = self._redis.incrby(self._key("rows"), len(rows))
+        with self._redis.pipeline() as pipe:
+            for row_id, (username, capital, category, timestamp) in enumerate(rows, last - len(rows) + 1):
+                member = self._member(row_id, username, capital, category, timestamp)
+                pipe.zadd(self._key("top"), {member: capital})
+                pipe.sadd(self._key("usernames"), username)
+                self._offer(
+                    keys=[self._key("players"), self._key("player_best")],
+                    args=[username, capital, member], client=pipe,
+                )
+                if category:
+                    self._offer(
+                        keys=[self._key(f"category:{category}"), self._key(f"category_best:{category}")],
+                        args=[username, capital, member], client=pipe,
+                    )
+            pipe.publish(self._key("changes"), last)
+            pipe.execute()
+        self._invalidate()
+
+    def _cached(self, key, fetch):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and now - hit[0] < self.cache_ttl:
+                return hit[1]
+            generation = self._generation
+        value = fetch()
+        with self._lock:
+            if generation == self._generation:
+                self._cache[key] = (now, value)
+        return value
+
+    def _invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _on_change(self, message):
+        self._invalidate()
+        for callback in list(self._watchers):
+            callback()
+
+    def _range(self, key, n):
+        return [make_row(*json.loads(m.split("|", 1)[1])) for m in self._redis.zrevrange(key, 0, n - 1)]
+
+    def top(self, n):
+        return self._cached(("top", n), lambda: self._range(self._key("top"), n))
+
+    def top_players(self, n):
+        return self._cached(("players", n), lambda: self._range(self._key("players"), n))
+
+    def top_in_category(self, category, n):
+        return self._cached(
+            ("category", category, n),
+            lambda: self._range(self._key(f"category:{category}"), n),
+        )
+
+    def count(self):
+        return self._cached(("count",), lambda: self._redis.zcard(self._key("top")))
+
+    def player_scores(self):
+        return [
+            (json.loads(member.split("|", 1)[1])[0], int(capital))
+            for member, capital in self._redis.zrange(self._key("players"), 0, -1, withscores=True)
+        ]
+
+    def all_rows(self):
+        # Members start with the inverted row id, so the earliest sort last
+        members = sorted((m for m, _ in self._redis.zscan_iter(self._key("top"))), reverse=True)
+        for member in members:
+            yield make_row(*json.loads(member.split("|", 1)[1]))
+
+    def usernames(self):
+        return set(self._redis.smembers(self._key("usernames")))
+
+    def register_username(self, name):
+        # SADD is atomic on the server, so two replicas cannot both get a name
+        return self._redis.sadd(self._key("usernames"), name) == 1
+
+    def watch(self, callback):
+        self._watchers.append(callback)
+        return True
+
+    def close(self):
+        """Stop listening for changes and drop the pooled connections."""
+        self._listener.stop()
+        self._listener.join()
+        self._redis.connection_pool.disconnect()
+
+
+BACKENDS = {
+    "csv": CsvLeaderboardStore,
+    "sqlite": SqliteLeaderboardStore,
+    "redis": RedisLeaderboardStore,
+}
+
+
+def open_store(backend=None):
+    """Create the leaderboard store selected by LEADERBOARD_BACKEND."""
+    backend = backend or os.environ.get("LEADERBOARD_BACKEND", "sqlite")
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown leaderboard backend {backend!r}; choose one of {sorted(BACKENDS)}"
+        ) from None
+    return cls()
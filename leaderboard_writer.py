@@ -0,0 +1,124 @@
+"""Write-behind leaderboard writer.
+
+Sessions hand finished rounds to a bounded queue and return immediately. One
+background thread per process drains the queue and commits the rows to the
+leaderboard store in batches, one store write (and one fsync) per batch.
+Anything still queued is flushed when the process exits.
+
+BatchWriter is the generic part: it feeds any sink with an add_many(rows)
+method, which is how other append-only logs reuse the same thread design.
+A failed batch is dropped unless the writer is given retries: it is then
+kept and written again with exponential backoff, and rows queued behind it
+wait. put() never blocks the caller: once the queue is full a row is
+logged as an error, with its contents, and dropped. Sinks must leave
+nothing behind from a failed add_many so a retry cannot record rows twice.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+MAX_RETRY_DELAY = 5.0  # seconds between retries of a failed batch, at most
+
+
+class BatchWriter:
+    """Background thread that group-commits rows to sink.add_many()."""
+
+    def __init__(self, sink, max_queue=10_000, batch_size=500, linger=0.05, name="batch-writer",
+                 retries=0, retry_delay=0.1):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.linger = linger  # how long to wait for more rows before committing
+        self.retries = retries  # extra attempts at a failed batch; None keeps trying until closed
+        self.retry_delay = retry_delay  # first wait before a retry, doubled each time
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, row):
+        """Queue one row; False (and an error in the log) if the queue is full and it was dropped."""
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            logger.error("%s queue is full; dropping %r", self._thread.name, row)
+            return False
+
+    def flush(self, timeout=None):
+        """Wait until the queue is drained and committed; False if timeout ran out first."""
+        done = self._queue.all_tasks_done
+        with done:
+            return done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self):
+        """Commit what is queued and stop the thread."""
+        if self._thread.is_alive():
+            self._closing.set()
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=max(0, timeout)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            rows = batch[:-1] if stop else batch
+            try:
+                if rows:
+                    self._commit(rows)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _commit(self, rows):
+        delay = self.retry_delay
+        attempt = 0
+        while True:
+            try:
+                self.sink.add_many(rows)
+                return
+            except Exception:
+                # Once closing, the process is exiting: one last try, no waiting
+                if self._closing.is_set() or (self.retries is not None and attempt >= self.retries):
+                    logger.exception("%s failed to write %d rows; dropping them", self._thread.name, len(rows))
+                    return
+                logger.exception("%s failed to write %d rows; retrying in %.1fs",
+                                 self._thread.name, len(rows), delay)
+            self._closing.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+            attempt += 1
+
+
+class LeaderboardWriter(BatchWriter):
+    """BatchWriter for leaderboard rows; retries a failed batch until it is written.
+
+    The rank index counts a round as soon as it is saved, so a dropped batch
+    would leave standings and stored rows apart.
+    """
+
+    def __init__(self, store, **kwargs):
+        kwargs.setdefault("retries", None)
+        super().__init__(store, name="leaderboard-writer", **kwargs)
+        self.store = store
+
+    def submit(self, username, capital, category=None, timestamp=None):
+        """Queue one finished round."""
+        self.put((username, capital, category, timestamp))
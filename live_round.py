@@ -0,0 +1,120 @@
+"""Host-driven live rounds for the classroom.
+
+One LiveRound per server process holds the question the host is running,
+its start time on the shared game clock, its deadline and the buffer of
+answers collected so far. Every player is scored against that one start
+time with the usual reward formula, and one timer thread per process
+closes the round at the deadline; players never run a timer of their own.
+Starting, closing and ending a round notify the subscribed sessions so they
+rerun right away instead of polling.
+"""
+import threading
+import uuid
+from collections import namedtuple
+
+import game_clock
+from notifications import Subscribers
+from player_state import score_answer
+
+# What a player session needs to render the round; round_id is None when idle
+LiveState = namedtuple(
+    "LiveState", ["round_id", "category", "index", "question", "started", "duration", "deadline", "closed"]
+)
+LiveAnswer = namedtuple("LiveAnswer", ["choice", "correct", "reward", "time_passed"])
+
+IDLE = LiveState(None, None, None, None, None, None, None, True)
+
+
+class LiveRound:
+    """Shared clock, deadline and answer buffer of the current live question."""
+
+    def __init__(self, max_time, penalty_factor):
+        self.max_time = max_time
+        self.penalty_factor = penalty_factor
+        self.subscribers = Subscribers()
+        self._lock = threading.Lock()
+        self._state = IDLE
+        self._answers = {}  # username -> LiveAnswer
+        self._timer = None
+
+    def current(self):
+        return self._state
+
+    def start(self, category, index, question, duration=None):
+        """Open a new question for everyone, replacing any running one."""
+        duration = self.max_time if duration is None else duration
+        started = game_clock.now()
+        with self._lock:
+            self._cancel_timer()
+            self._state = LiveState(
+                uuid.uuid4().hex[:12], category, index, question, started, duration, started + duration, False
+            )
+            self._answers = {}
+            self._timer = threading.Timer(duration, self._expire, (self._state.round_id,))
+            self._timer.daemon = True
+            self._timer.start()
+        self.subscribers.notify()
+
+    def close(self):
+        """Stop accepting on-time answers and show everyone the result."""
+        with self._lock:
+            if self._state.closed:
+                return
+            self._cancel_timer()
+            self._state = self._state._replace(closed=True)
+        self.subscribers.notify()
+
+    def end(self):
+        """Leave live mode; players go back to waiting."""
+        with self._lock:
+            self._cancel_timer()
+            self._state = IDLE
+            self._answers = {}
+        self.subscribers.notify()
+
+    def submit(self, round_id, username, choice, now=None):
+        """Score and record one answer; None if the round moved on or the player already answered.
+
+        Answers are scored against the duration the host picked. Answers
+        that arrive once the round is closed or past its deadline (the
+        auto-submit of a player whose time ran out) are still recorded,
+        scored with no time left.
+        """
+        now = game_clock.now() if now is None else now
+        with self._lock:
+            state = self._state
+            if state.round_id is None or state.round_id != round_id or username in self._answers:
+                return None
+            time_passed = now - state.started
+            if state.closed or now >= state.deadline:
+                time_passed = max(time_passed, state.duration)
+            choice_index, correct, reward = score_answer(
+                state.question, choice, time_passed, state.duration, self.penalty_factor
+            )
+            answer = self._answers[username] = LiveAnswer(choice_index, correct, reward, time_passed)
+        return answer
+
+    def answer_of(self, username):
+        return self._answers.get(username)
+
+    def results(self):
+        """(answers, correct, option index -> count) for the current round."""
+        with self._lock:
+            answers = list(self._answers.values())
+        choices = {}
+        for a in answers:
+            choices[a.choice] = choices.get(a.choice, 0) + 1
+        return len(answers), sum(a.correct for a in answers), choices
+
+    def _expire(self, round_id):
+        with self._lock:
+            if self._state.round_id != round_id or self._state.closed:
+                return
+            self._state = self._state._replace(closed=True)
+            self._timer = None
+        self.subscribers.notify()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,71 @@
+"""Server load tracking for adaptive refresh.
+
+Every rerun reports its latency and session id. LoadMonitor keeps a moving
+average of rerun latency and the number of sessions that reran recently,
+and turns them into a pressure factor: 1.0 while the server keeps up, more
+when reruns get slow or when periodic refreshes of all active sessions would
+exceed REFRESH_BUDGET reruns per second. Pages stretch their refresh
+intervals by that factor, so an overloaded server sheds refresh work
+instead of falling further behind.
+
+Rewards never depend on refresh timing: answers are always scored against
+the server-side question start time, so a slower refresh only makes the
+countdown update less often.
+"""
+import os
+import threading
+import time
+
+TARGET_LATENCY = 0.1  # seconds per rerun the server should stay under
+REFRESH_BUDGET = float(os.environ.get("REFRESH_BUDGET", 100))  # periodic reruns/s per process
+ACTIVE_WINDOW = 30.0  # seconds since its last rerun for a session to count as active
+DEGRADED_PRESSURE = 1.5  # pressure from which players are told the server is busy
+SMOOTHING = 0.1  # weight of the newest rerun in the latency average
+
+
+class LoadMonitor:
+    """Process-wide rerun latency and active-session count."""
+
+    def __init__(self, target_latency=TARGET_LATENCY, refresh_budget=REFRESH_BUDGET,
+                 active_window=ACTIVE_WINDOW):
+        self.target_latency = target_latency
+        self.refresh_budget = refresh_budget
+        self.active_window = active_window
+        self.latency = 0.0  # moving average, seconds
+        self._lock = threading.Lock()
+        self._last_seen = {}  # session id -> time of its last rerun
+        self._next_prune = 0.0
+
+    def record(self, session_id, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self.latency += SMOOTHING * (seconds - self.latency)
+            self._last_seen[session_id] = now
+            if now >= self._next_prune:
+                cutoff = now - self.active_window
+                self._last_seen = {s: t for s, t in self._last_seen.items() if t >= cutoff}
+                self._next_prune = now + self.active_window / 4
+
+    def active_sessions(self):
+        cutoff = time.monotonic() - self.active_window
+        with self._lock:
+            return sum(1 for t in self._last_seen.values() if t >= cutoff)
+
+    def pressure(self, base_ms=None):
+        """How far over capacity the server is; at least 1.0.
+
+        With base_ms, also counts what refreshing every active session at
+        that interval would cost against the refresh budget.
+        """
+        pressure = self.latency / self.target_latency
+        if base_ms:
+            pressure = max(pressure, self.active_sessions() * (1000 / base_ms) / self.refresh_budget)
+        return max(1.0, pressure)
+
+    def interval(self, base_ms, max_ms):
+        """Refresh interval for base_ms under the current load, in 100 ms steps."""
+        stretched = min(max_ms, base_ms * self.pressure(base_ms))
+        return int(max(base_ms, round(stretched / 100) * 100))
+
+    def degraded(self, base_ms=None):
+        return self.pressure(base_ms) >= DEGRADED_PRESSURE
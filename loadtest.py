@@ -0,0 +1,214 @@
+"""Headless load test: simulate a classroom of players against app.py.
+
+Every player is a Streamlit AppTest session running the real script. Players
+log in, pick random categories, answer with a configurable accuracy and think
+time, visit the store and the leaderboard, and finish rounds. By default all
+players share a SimulatedClock, so a MAX_TIME round costs only as long as the
+reruns themselves take.
+
+    python loadtest.py --players 200 --rounds 2 --accuracy 0.7 --think-time 6
+
+Reported: rerun latency percentiles, reruns per second, leaderboard write
+throughput and per-session state size.
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def deep_size(obj, seen=None):
+    """Approximate memory held by obj and everything it references."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    return size
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.rounds = 0
+
+    def timed_run(self, widget_or_app):
+        start = time.perf_counter()
+        result = widget_or_app.run()
+        self.latencies.append(time.perf_counter() - start)
+        if result.exception:
+            raise RuntimeError(f"app raised: {result.exception[0].message}")
+        return result
+
+
+def _button(at, label):
+    for b in at.button:
+        if b.label == label:
+            return b
+    raise LookupError(f"no button {label!r} on the page")
+
+
+def player(at, name, args, stats, rng):
+    """Generator driving one player; yields think time before each action."""
+    from game_data import get_game_data
+
+    stats.timed_run(at)
+    at.text_input[0].input(name)
+    stats.timed_run(_button(at, "Continue").click())
+    yield rng.uniform(0.5, 2.0)
+
+    for round_no in range(args.rounds):
+        questions = get_game_data().questions
+        category = rng.choice(list(questions))
+        at.radio[0].set_value(category)
+        stats.timed_run(_button(at, "Start Category").click())
+        stats.timed_run(at)  # the start button only takes effect on the next rerun
+
+        for _ in range(len(at.session_state["player"].round_ids)):
+            q = questions[category][at.session_state["player"].question_id()]
+            think = rng.uniform(0, 2 * args.think_time)
+            yield think
+            if think >= args.max_time:
+                # Browser deadline wake-up; the app auto-submits
+                stats.timed_run(at)
+            else:
+                if rng.random() < args.accuracy:
+                    answer = q.options[q.answer]
+                else:
+                    answer = rng.choice([o for i, o in enumerate(q.options) if i != q.answer])
+                at.radio(key=f"q_{category}_{at.session_state['player'].index}").set_value(answer)
+                stats.timed_run(_button(at, "Submit Answer").click())
+            yield rng.uniform(0.5, 2.0)
+            stats.timed_run(_button(at, "Next Question").click())
+
+        stats.rounds += 1
+        yield rng.uniform(1.0, 3.0)
+
+        if rng.random() < args.store_visit_rate:
+            stats.timed_run(at.sidebar.radio[0].set_value("store"))
+            buys = [b for b in at.button if b.label.startswith("Buy ")]
+            if buys:
+                yield rng.uniform(1.0, 3.0)
+                stats.timed_run(rng.choice(buys).click())
+            yield rng.uniform(1.0, 3.0)
+        if rng.random() < args.leaderboard_visit_rate:
+            stats.timed_run(at.sidebar.radio[0].set_value("leaderboard"))
+            yield rng.uniform(1.0, 3.0)
+
+        stats.timed_run(at.sidebar.radio[0].set_value("quiz"))
+        if round_no < args.rounds - 1:
+            stats.timed_run(_button(at, "Choose Another Category").click())
+            stats.timed_run(at)
+        yield rng.uniform(0.5, 2.0)
+
+
+def run(args):
+    from streamlit.testing.v1 import AppTest
+
+    import game_clock
+    from leaderboard_store import open_store
+
+    rng = random.Random(args.seed)
+    if args.clock == "simulated":
+        clock = game_clock.SimulatedClock()
+        game_clock.set_clock(clock)
+        advance = clock.advance_to
+    else:
+        clock = time.time
+        advance = lambda t: time.sleep(max(0, t - time.time()))
+
+    stats = Stats()
+    rows_before = open_store().count()
+    events = []
+    sessions = []
+    start_at = clock()
+    for i in range(args.players):
+        at = AppTest.from_file(APP_FILE, default_timeout=args.timeout)
+        sessions.append(at)
+        gen = player(at, f"{args.name_prefix}{i}", args, stats, random.Random(rng.random()))
+        # Stagger arrivals over the first few seconds like a real class
+        heapq.heappush(events, (start_at + rng.uniform(0, args.ramp_up), i, gen))
+
+    wall_start = time.perf_counter()
+    while events:
+        t, i, gen = heapq.heappop(events)
+        advance(t)
+        try:
+            delay = next(gen)
+        except StopIteration:
+            continue
+        heapq.heappush(events, (clock() + delay, i, gen))
+    wall = time.perf_counter() - wall_start
+
+    # Rows are written behind the sessions' backs; wait for the writer.
+    store = open_store()
+    flush_start = time.perf_counter()
+    while store.count() - rows_before < stats.rounds and time.perf_counter() - flush_start < 10:
+        time.sleep(0.05)
+    written = store.count() - rows_before
+    write_wall = wall + (time.perf_counter() - flush_start)
+
+    sizes = [deep_size(at.session_state.to_dict()) for at in sessions]
+    lat = sorted(stats.latencies)
+    print(f"players:            {args.players} ({args.clock} clock)")
+    print(f"rounds finished:    {stats.rounds}")
+    print(f"reruns:             {len(lat)} in {wall:.1f}s wall ({len(lat) / wall:.1f}/s)")
+    for p in (50, 90, 99):
+        print(f"rerun latency p{p}:  {percentile(lat, p) * 1000:.1f} ms")
+    print(f"rerun latency max:  {lat[-1] * 1000:.1f} ms" if lat else "")
+    print(f"leaderboard writes: {written} rows ({written / write_wall:.1f} rows/s)")
+    print(f"session state size: {sum(sizes) / len(sizes) / 1024:.1f} KiB avg, {max(sizes) / 1024:.1f} KiB max")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=1, help="categories each player finishes")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="chance of answering correctly")
+    parser.add_argument("--think-time", type=float, default=6.0, help="mean seconds per question")
+    parser.add_argument("--max-time", type=float, default=20.0, help="must match MAX_TIME in app.py")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which players join")
+    parser.add_argument("--store-visit-rate", type=float, default=0.5)
+    parser.add_argument("--leaderboard-visit-rate", type=float, default=0.5)
+    parser.add_argument("--clock", choices=("simulated", "real"), default="simulated")
+    parser.add_argument("--backend", help="LEADERBOARD_BACKEND for the run")
+    parser.add_argument("--timer-mode", choices=("client", "server"), help="TIMER_MODE for the run")
+    parser.add_argument("--workdir", help="where leaderboard files go (default: a temp dir)")
+    parser.add_argument("--name-prefix", default="loadtest-")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-rerun timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        os.environ["LEADERBOARD_BACKEND"] = args.backend
+    if args.timer_mode:
+        os.environ["TIMER_MODE"] = args.timer_mode
+    sys.path.insert(0, APP_DIR)
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="loadtest-"))
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Opt-in per-rerun timing metrics.
+
+Set METRICS_ENABLED=1 to time each section of a rerun, plus the game
+functions decorated with @metrics.timed. Timings go into fixed-bucket
+histograms shared by the whole process. Rerun counts are kept per session
+until it has been idle for SESSION_IDLE seconds, then only in a histogram,
+so memory does not grow with every visitor. When enabled they can be read:
+
+- from METRICS_FILE (default metrics.json), rewritten every
+  METRICS_FLUSH_INTERVAL seconds;
+- over HTTP at http://127.0.0.1:METRICS_PORT/metrics when METRICS_PORT is set;
+- in the admin debug panel of the app.
+
+When disabled, timer() hands back a shared no-op context manager.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+SESSION_IDLE = 30 * 60  # seconds without a rerun before a session's count is folded away
+
+logger = logging.getLogger(__name__)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Count of observations per fixed bucket, plus total and max."""
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def copy(self):
+        other = Histogram()
+        other.counts = list(self.counts)
+        other.total = self.total
+        other.max = self.max
+        return other
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (capped at max)."""
+        n = self.count
+        if n == 0:
+            return 0.0
+        rank = q * n
+        seen = 0
+        for bound, c in zip(BUCKETS_MS, self.counts):
+            seen += c
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        n = self.count
+        return {
+            "count": n,
+            "mean_ms": round(self.total / n, 3) if n else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 3),
+            "buckets": dict(zip(map(str, BUCKETS_MS), self.counts)),
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        # Also records sections that end in st.stop() or st.rerun()
+        self.metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class Metrics:
+    """Process-wide registry of timing histograms and rerun counts."""
+
+    def __init__(self, enabled=False, session_idle=SESSION_IDLE):
+        self.enabled = enabled
+        self.session_idle = session_idle
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._reruns = {}  # session id -> [reruns, time of the last one]
+        self._ended = Histogram()  # reruns of sessions gone idle, no longer kept by id
+        self._next_prune = 0.0
+        self._started = False
+
+    def timer(self, name):
+        """Context manager timing one section; a no-op when disabled."""
+        return _Timer(self, name) if self.enabled else _NOOP
+
+    def timed(self, name=None):
+        """Decorator form of timer(); defaults to the function's name."""
+        def decorate(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def count_rerun(self, session_id):
+        """Record one script run for a session; returns that session's total."""
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            entry = self._reruns.get(session_id)
+            if entry is None:
+                entry = self._reruns[session_id] = [0, now]
+            entry[0] += 1
+            entry[1] = now
+            if now >= self._next_prune:
+                self._prune(now)
+            return entry[0]
+
+    def session_reruns(self, session_id):
+        with self._lock:
+            entry = self._reruns.get(session_id)
+            return entry[0] if entry else 0
+
+    def _prune(self, now):
+        """Fold the counts of sessions idle for session_idle into the ended histogram."""
+        cutoff = now - self.session_idle
+        for session_id in [s for s, (_, last) in self._reruns.items() if last < cutoff]:
+            self._ended.observe(self._reruns.pop(session_id)[0])
+        self._next_prune = now + self.session_idle / 4
+
+    def snapshot(self):
+        """All current numbers as a JSON-friendly dict."""
+        with self._lock:
+            sections = {name: h.summary() for name, h in sorted(self._histograms.items())}
+            per_session = self._ended.copy()
+            for n, _ in self._reruns.values():
+                per_session.observe(n)
+        return {
+            "time": time.time(),
+            "sections": sections,
+            "reruns": {
+                "total": int(per_session.total),
+                "sessions": per_session.count,
+                # Bucket bounds are rerun counts here, not milliseconds
+                "per_session": per_session.summary(),
+            },
+        }
+
+    def start_exporters(self, path=None, interval=10.0, port=None):
+        """Start the file flusher and/or HTTP endpoint (once per process)."""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+        if path:
+            threading.Thread(
+                target=self._flush_loop, args=(path, interval), name="metrics-flush", daemon=True
+            ).start()
+        if port:
+            server = ThreadingHTTPServer(("127.0.0.1", port), _handler_for(self))
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def write(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def _flush_loop(self, path, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.write(path)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", path, e)
+
+
+def _handler_for(metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "") not in ("", "0"))
+METRICS_FILE = os.environ.get("METRICS_FILE", "metrics.json")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "10"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0")) or None
@@ -0,0 +1,48 @@
+"""Process-wide change notification.
+
+A Subscribers set maps a key (one per browser session) to a callback that
+wakes that session up. Whoever changes shared state calls notify() once and
+every subscriber is told, instead of each session polling on a timer. A
+callback that returns False is treated as gone and dropped.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Subscribers:
+    """Thread-safe set of wake-up callbacks, keyed by session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = {}  # key -> callback
+
+    def add(self, key, callback):
+        with self._lock:
+            self._callbacks[key] = callback
+
+    def discard(self, key):
+        with self._lock:
+            self._callbacks.pop(key, None)
+
+    def __len__(self):
+        return len(self._callbacks)
+
+    def notify(self):
+        """Call every callback (outside the lock); returns how many were reached."""
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        gone = []
+        for key, callback in callbacks:
+            try:
+                if callback() is False:
+                    gone.append(key)
+            except Exception:
+                logger.exception("subscriber %s failed", key)
+                gone.append(key)
+        if gone:
+            with self._lock:
+                for key in gone:
+                    self._callbacks.pop(key, None)
+        return len(callbacks) - len(gone)
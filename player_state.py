@@ -0,0 +1,162 @@
+"""Per-session game state.
+
+One PlayerState lives in st.session_state.player for the whole session and
+replaces the dozen loose session_state keys the app used to set up on every
+rerun. All changes go through the transition methods below, so the rules
+for moving between questions, categories and purchases sit in one place.
+"""
+import sys
+from array import array
+from dataclasses import dataclass, field, fields
+
+
+def score_answer(question, choice, time_passed, max_time, penalty_factor):
+    """The reward formula; returns (choice index or -1, correct, reward)."""
+    # Determine correctness safely (unknown or missing choice is wrong)
+    choice_index = question.option_index.get(choice, -1)
+    correct = choice_index == question.answer
+    time_left = max(0, max_time - time_passed)
+
+    if correct:
+        # Gain time-scaled reward
+        reward = int(question.value * (time_left / max_time))
+    else:
+        # Lose money on wrong answer (fixed fraction of base value)
+        reward = -int(question.value * penalty_factor)
+    return choice_index, correct, reward
+
+
+@dataclass(slots=True)
+class PlayerState:
+    username: str = None
+    resume_token: str = None
+    money: int = 0
+    inventory: set = field(default_factory=set)  # owned item names
+    equipped: str = None
+    category: str = None  # quiz category
+    round_ids: array = field(default_factory=lambda: array("I"))  # question positions in the category
+    difficulty: tuple = None  # (min, max) question value the round was drawn from
+    index: int = 0  # position in round_ids
+    show_result: bool = False
+    last_correct: bool = False
+    last_reward: int = 0
+    question_start_time: float = None
+    has_answered: bool = False
+    saved_this_round: bool = False
+    live_round: str = None  # id of the last live round answered
+
+    # -------------------------
+    # TRANSITIONS
+    # -------------------------
+    def start_category(self, category, round_ids=(), difficulty=None):
+        """Begin a round of the given questions of a category."""
+        self.category = category
+        self.round_ids = array("I", round_ids)
+        self.difficulty = difficulty
+        self.index = 0
+        self.show_result = False
+        self.has_answered = False
+        self.question_start_time = None
+        self.saved_this_round = False
+
+    def reset_category(self):
+        """Leave the category and go back to category selection."""
+        self.start_category(None)
+
+    def start_question(self, now):
+        """Start the timer the first time a question is shown; True if it started."""
+        if self.question_start_time is not None:
+            return False
+        self.question_start_time = now
+        return True
+
+    def time_left(self, now, max_time):
+        if self.question_start_time is None:
+            return 0
+        return max(0, max_time - (now - self.question_start_time))
+
+    def answer(self, question, choice, now, max_time, penalty_factor):
+        """Score an answer; returns (choice index or -1, seconds taken)."""
+        # Time-based reward, always from the server-side start time (never the client timer)
+        if self.question_start_time is None:
+            time_passed = max_time
+        else:
+            time_passed = now - self.question_start_time
+        choice_index, correct, reward = score_answer(
+            question, choice, time_passed, max_time, penalty_factor
+        )
+
+        self.money += reward
+        self.last_reward = reward
+        self.last_correct = correct
+        self.show_result = True
+        self.has_answered = True
+        return choice_index, time_passed
+
+    def answer_live(self, round_id, reward):
+        """Book the reward of a live-round answer; False if this round was already answered."""
+        if self.live_round == round_id:
+            return False
+        self.live_round = round_id
+        self.money += reward
+        return True
+
+    def question_id(self):
+        """Position in the category of the current question."""
+        return self.round_ids[self.index]
+
+    def next_question(self):
+        """Move to the next question and reset per-question state."""
+        self.index += 1
+        self.show_result = False
+        self.has_answered = False
+        self.question_start_time = None
+
+        if self.index >= len(self.round_ids):
+            self.index = len(self.round_ids)
+            self.show_result = True
+
+    def purchase(self, item):
+        """Buy a store item; False if the player cannot afford it."""
+        if self.money < item.price:
+            return False
+        self.money -= item.price
+        self.inventory.add(item.name)
+        return True
+
+    def owns(self, name):
+        return name in self.inventory
+
+    def equip(self, name):
+        self.equipped = name
+
+    def mark_saved(self):
+        self.saved_this_round = True
+
+    # -------------------------
+    # SNAPSHOTS
+    # -------------------------
+    def to_dict(self):
+        """JSON-friendly copy for the session store."""
+        state = {f.name: getattr(self, f.name) for f in fields(self)}
+        state["inventory"] = sorted(self.inventory)
+        state["round_ids"] = self.round_ids.tolist()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        known = {f.name for f in fields(cls)}
+        player = cls(**{k: v for k, v in state.items() if k in known})
+        player.inventory = set(player.inventory)
+        player.round_ids = array("I", player.round_ids)
+        if player.difficulty is not None:
+            player.difficulty = tuple(player.difficulty)
+        return player
+
+    def nbytes(self):
+        """Approximate memory held by this session's game state."""
+        size = sys.getsizeof(self)
+        for f in fields(self):
+            value = getattr(self, f.name)
+            size += sys.getsizeof(value)
+        return size + sum(sys.getsizeof(name) for name in self.inventory)
@@ -0,0 +1,127 @@
+"""Order-statistic index of every player's best score, for "your rank" queries.
+
+RankIndex keeps one (-capital, username) entry per player in a sorted list,
+so a player's rank, percentile and the players just above and below are
+found with a few binary searches: O(log n) per query however many players
+there are, and no store read at all. A new best score costs one search and
+a list insert (a memmove, even for a million players well under a ms).
+
+The index is loaded from the store's best-per-player view once per process.
+Scores written through this process are offered as they are saved. Scores
+written by other server processes are picked up by a background reload,
+started by a query once the index is older than MAX_AGE, or RELOAD_INTERVAL
+after a change notification from stores that send them.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import namedtuple
+
+MAX_AGE = 60.0  # seconds before the index is reloaded to pick up other processes' scores
+RELOAD_INTERVAL = 5.0  # minimum seconds between reloads after change notifications
+
+logger = logging.getLogger(__name__)
+
+# rank is shared by players with the same capital; percentile is the share of
+# the other players with less capital; above and below are the neighbouring
+# (username, capital) pairs, None at either end
+Standing = namedtuple("Standing", ["rank", "players", "percentile", "capital", "above", "below"])
+
+
+class RankIndex:
+    """Players sorted by best capital; safe to share between sessions."""
+
+    def __init__(self, store, max_age=MAX_AGE, reload_interval=RELOAD_INTERVAL):
+        self._store = store
+        self.max_age = max_age
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._entries = None  # sorted (-capital, username), loaded on first use
+        self._best = {}  # username -> capital
+        self._loaded = 0.0
+        self._stale = False
+        self._reloading = False
+        self._pending = []  # offers made while a reload reads the store
+
+    def load(self):
+        """Read every player's best score from the store, if not done yet."""
+        with self._lock:
+            self._load()
+
+    def offer(self, username, capital):
+        """Record a finished round; only a player's best capital counts."""
+        capital = int(capital)
+        with self._lock:
+            self._load()
+            if self._reloading:
+                self._pending.append((username, capital))
+            self._offer(username, capital)
+
+    def offer_many(self, rows):
+        for username, capital, _, _ in rows:
+            self.offer(username, capital)
+
+    def mark_stale(self):
+        """Another process changed the leaderboard; reload soon."""
+        self._stale = True
+
+    def standing(self, username):
+        """The player's Standing, or None if they are not on the leaderboard."""
+        with self._lock:
+            self._load()
+            self._maybe_reload()
+            capital = self._best.get(username)
+            if capital is None:
+                return None
+            entries = self._entries
+            n = len(entries)
+            i = bisect.bisect_left(entries, (-capital, username))
+            higher = bisect.bisect_left(entries, (-capital,))
+            lower = n - bisect.bisect_left(entries, (1 - capital,))
+            above = (entries[i - 1][1], -entries[i - 1][0]) if i > 0 else None
+            below = (entries[i + 1][1], -entries[i + 1][0]) if i + 1 < n else None
+        percentile = 100.0 * lower / (n - 1) if n > 1 else 100.0
+        return Standing(higher + 1, n, percentile, capital, above, below)
+
+    def _load(self):
+        if self._entries is None:
+            self._best, self._entries = self._read()
+            self._loaded = time.monotonic()
+
+    def _read(self):
+        best = dict(self._store.player_scores())
+        return best, sorted((-capital, username) for username, capital in best.items())
+
+    def _offer(self, username, capital):
+        old = self._best.get(username)
+        if old is not None:
+            if capital <= old:
+                return
+            del self._entries[bisect.bisect_left(self._entries, (-old, username))]
+        self._best[username] = capital
+        bisect.insort(self._entries, (-capital, username))
+
+    def _maybe_reload(self):
+        age = time.monotonic() - self._loaded
+        if self._reloading or (age < self.max_age and not (self._stale and age >= self.reload_interval)):
+            return
+        self._reloading = True
+        self._stale = False
+        threading.Thread(target=self._reload, name="rank-index-reload", daemon=True).start()
+
+    def _reload(self):
+        try:
+            best, entries = self._read()
+        except Exception:
+            logger.exception("reloading the rank index failed")
+            best = None
+        with self._lock:
+            if best is not None:
+                self._best, self._entries = best, entries
+                # Saved during the read, maybe after the store was read
+                for username, capital in self._pending:
+                    self._offer(username, capital)
+            self._pending = []
+            self._loaded = time.monotonic()
+            self._reloading = False
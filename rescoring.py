@@ -0,0 +1,308 @@
+"""Columnar answer history and bulk rescoring under other scoring rules.
+
+answers.csv keeps the inputs of every reward: response time, time limit,
+correctness and the question's base value. `compact` folds the rows
+appended since its last run into answers.columns/, as .npz parts of NumPy
+columns (players and categories as ids into the name lists of meta.json),
+so a rescoring job loads millions of answers as a few arrays instead of
+parsing text.
+
+Rules are a timer, a wrong-answer penalty factor and optionally a question
+bank whose values replace the recorded ones. rescore() replays every
+answer under them in one vectorized pass of the reward formula. The timer
+scales each answer's recorded time limit, so a live question the host ran
+for 60 s keeps three times the quiz timer. A rescored leaderboard shifts
+each row by the player's reward difference up to the moment the round was
+saved, so purchases and other capital changes carry over unchanged. Rules
+are written "current" or as overrides of it, "max_time=15,penalty=0.4" or
+"questions=data/next.json". Run from the app directory:
+
+    python rescoring.py compact
+    python rescoring.py compare current max_time=15,penalty=0.4
+    python rescoring.py rescore max_time=15,penalty=0.4 --output rescored.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from answer_analytics import ANSWERS_FILE, FIELDS as ANSWER_FIELDS
+from game_data import load_game_data
+from game_engine import MAX_TIME, WRONG_PENALTY_FACTOR
+from csv_log import file_lock, read_lines
+from leaderboard_store import FIELDS as LEADERBOARD_FIELDS, open_store
+
+COLUMNS_DIR = "answers.columns"
+CHUNK_ROWS = 1_000_000  # answers per .npz part, and per parse in memory
+TOP_OVERLAP = 10  # size of the top list compared between rules
+PERCENTILES = (10, 25, 50, 75, 90)
+
+Rules = namedtuple("Rules", ["max_time", "penalty", "questions"])
+CURRENT = Rules(MAX_TIME, WRONG_PENALTY_FACTOR, None)
+
+
+def parse_rules(text):
+    """Rules from "current" or comma-separated overrides of it."""
+    rules = CURRENT
+    if text == "current":
+        return rules
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key == "max_time":
+            rules = rules._replace(max_time=float(value))
+        elif key == "penalty":
+            rules = rules._replace(penalty=float(value))
+        elif key == "questions":
+            rules = rules._replace(questions=value.strip())
+        else:
+            raise ValueError(f"unknown rule {key!r}; use max_time, penalty or questions")
+    if rules.max_time <= 0:
+        raise ValueError("max_time must be positive")
+    return rules
+
+
+# -------------------------
+# COLUMNS
+# -------------------------
+class AnswerColumns:
+    """answers.columns/: the answer log as NumPy columns, extended by compact()."""
+
+    def __init__(self, path=COLUMNS_DIR, log_path=ANSWERS_FILE):
+        self.path = path
+        self.log_path = log_path
+        self.meta_path = os.path.join(path, "meta.json")
+
+    def meta(self):
+        if not os.path.exists(self.meta_path):
+            return {"offset": 0, "parts": 0, "rows": 0, "players": [], "categories": []}
+        with open(self.meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def compact(self, chunk_rows=CHUNK_ROWS):
+        """Fold log rows appended since the last run into new parts; returns the rows added."""
+        os.makedirs(self.path, exist_ok=True)
+        with file_lock(self.path + ".lock"):
+            meta = self.meta()
+            players = {name: i for i, name in enumerate(meta["players"])}
+            categories = {name: i for i, name in enumerate(meta["categories"])}
+            added = 0
+            for offset, rows in self._chunks(meta["offset"], chunk_rows):
+                cols = _columns(rows, players, categories)
+                np.savez(os.path.join(self.path, f"part-{meta['parts']:05d}.npz"), **cols)
+                meta.update(
+                    offset=offset, parts=meta["parts"] + 1, rows=meta["rows"] + len(rows),
+                    players=list(players), categories=list(categories),
+                )
+                # The parts a reader loads are the ones meta.json lists
+                tmp = self.meta_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(tmp, self.meta_path)
+                added += len(rows)
+            return added
+
+    def _chunks(self, offset, chunk_rows):
+        """(end offset, list of field lists) of about chunk_rows complete log rows at a time."""
+        for offset, lines in read_lines(self.log_path, offset, chunk_rows * 64):
+            rows = [
+                fields for fields in csv.reader(b"".join(lines).decode("utf-8").splitlines())
+                if fields and fields != ANSWER_FIELDS
+            ]
+            yield offset, rows
+
+    def load(self):
+        """(columns dict, meta) of every compacted answer."""
+        meta = self.meta()
+        parts = [np.load(os.path.join(self.path, f"part-{i:05d}.npz")) for i in range(meta["parts"])]
+        if not parts:
+            return {name: np.zeros(0, dtype) for name, dtype in DTYPES.items()}, meta
+        return {name: np.concatenate([p[name] for p in parts]) for name in DTYPES}, meta
+
+
+DTYPES = {
+    "player": np.int32,
+    "category": np.int32,
+    "question": np.int32,
+    "correct": np.bool_,
+    "response_time": np.float64,
+    "reward": np.int64,
+    "value": np.int32,
+    "max_time": np.float64,
+    "timestamp": np.float64,
+}
+
+
+def _columns(rows, players, categories):
+    def name_id(ids, name):
+        i = ids.get(name)
+        if i is None:
+            i = ids[name] = len(ids)
+        return i
+
+    cols = {
+        "player": [name_id(players, r[0]) for r in rows],
+        "category": [name_id(categories, r[1]) for r in rows],
+        "question": [int(r[2]) for r in rows],
+        "correct": [r[4] == "1" for r in rows],
+        "response_time": [float(r[5]) for r in rows],
+        "reward": [int(r[6]) for r in rows],
+        "value": [int(r[8]) for r in rows],
+        "max_time": [float(r[9]) for r in rows],
+        "timestamp": [float(r[7]) for r in rows],
+    }
+    return {name: np.array(values, DTYPES[name]) for name, values in cols.items()}
+
+
+# -------------------------
+# RESCORING
+# -------------------------
+def bank_values(cols, categories, questions_file):
+    """The value of every answered question in another question bank; recorded value where it has none."""
+    bank = load_game_data(questions_file).questions
+    lengths = np.array([len(bank[c]) if c in bank else 0 for c in categories], np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    flat = np.concatenate(
+        [np.asarray(bank[c].values, np.int32) for c in categories if c in bank] or [np.zeros(0, np.int32)]
+    )
+    cat, question = cols["category"], cols["question"]
+    found = question < lengths[cat]
+    values = cols["value"].copy()
+    values[found] = flat[starts[cat[found]] + question[found]]
+    return values
+
+
+def rescore(cols, meta, rules):
+    """Every answer's reward under rules, by the formula of player_state.score_answer."""
+    values = cols["value"] if rules.questions is None else bank_values(cols, meta["categories"], rules.questions)
+    max_time = cols["max_time"] * (rules.max_time / MAX_TIME)
+    time_left = np.maximum(0.0, max_time - cols["response_time"])
+    gain = (values * (time_left / max_time)).astype(np.int64)
+    loss = -(values * rules.penalty).astype(np.int64)
+    return np.where(cols["correct"], gain, loss)
+
+
+def player_totals(cols, meta, rewards):
+    """Sum of rewards per player id."""
+    return np.bincount(cols["player"], weights=rewards, minlength=len(meta["players"])).astype(np.int64)
+
+
+def rescored_rows(cols, meta, rewards, rows):
+    """Leaderboard rows with capital shifted by the player's reward difference up to the row's time."""
+    rows = list(rows)
+    ids = {name: i for i, name in enumerate(meta["players"])}
+    n_answers, n_rows = len(rewards), len(rows)
+    # Rows without a timestamp predate the answer log: no answer counts before them
+    row_player = np.array([ids.get(r["username"], -1) for r in rows], np.int64)
+    row_time = np.array([r["timestamp"] if r["timestamp"] is not None else -np.inf for r in rows], np.float64)
+
+    # One pass over answers and rows sorted by (player, time), answers first on
+    # equal times; a row's shift is its player's running difference at its place
+    player = np.concatenate([cols["player"].astype(np.int64), row_player])
+    when = np.concatenate([cols["timestamp"], row_time])
+    is_row = np.concatenate([np.zeros(n_answers, np.int8), np.ones(n_rows, np.int8)])
+    delta = np.concatenate([rewards - cols["reward"], np.zeros(n_rows, np.int64)])
+    order = np.lexsort((is_row, when, player))
+    running = np.cumsum(delta[order])
+    sorted_player = player[order]
+    group_start = np.searchsorted(sorted_player, sorted_player, side="left")
+    before_group = np.where(group_start > 0, running[group_start - 1], 0)
+    shift = np.empty(n_rows, np.int64)
+    at_rows = is_row[order] == 1
+    shift[order[at_rows] - n_answers] = (running - before_group)[at_rows]
+
+    for row, change in zip(rows, shift.tolist()):
+        yield {**row, "capital": row["capital"] + change}
+
+
+def distribution(cols, meta, rewards, baseline=None):
+    """Summary of the rewards and player totals; with baseline rewards, how the ranking moves."""
+    totals = player_totals(cols, meta, rewards)
+    summary = {
+        "answers": len(rewards),
+        "mean reward": float(rewards.mean()) if len(rewards) else 0.0,
+        "negative rewards %": 100.0 * float((rewards < 0).mean()) if len(rewards) else 0.0,
+        "total": int(totals.sum()),
+        "players below 0 %": 100.0 * float((totals < 0).mean()) if len(totals) else 0.0,
+    }
+    for p, v in zip(PERCENTILES, np.percentile(totals, PERCENTILES) if len(totals) else [0] * len(PERCENTILES)):
+        summary[f"player p{p}"] = float(v)
+    summary["player max"] = int(totals.max()) if len(totals) else 0
+    if baseline is not None and len(totals) > 1:
+        base = player_totals(cols, meta, baseline)
+        summary["rank correlation"] = _spearman(base, totals)
+        top = min(TOP_OVERLAP, len(totals))
+        summary[f"same top {top}"] = len(set(np.argsort(-base, kind="stable")[:top])
+                                         & set(np.argsort(-totals, kind="stable")[:top]))
+    return summary
+
+
+def _spearman(a, b):
+    ra = np.argsort(np.argsort(a, kind="stable"), kind="stable").astype(np.float64)
+    rb = np.argsort(np.argsort(b, kind="stable"), kind="stable").astype(np.float64)
+    if ra.std() == 0 or rb.std() == 0:
+        return 1.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--columns", default=COLUMNS_DIR)
+    parser.add_argument("--answers", default=ANSWERS_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("compact", help="fold new answers.csv rows into the columns")
+    compare = commands.add_parser("compare", help="compare score distributions under several rules")
+    compare.add_argument("rules", nargs="+", type=parse_rules, help='"current" or overrides; the first is the baseline')
+    score = commands.add_parser("rescore", help="write the leaderboard rescored under other rules")
+    score.add_argument("rules", type=parse_rules)
+    score.add_argument("--backend", help="LEADERBOARD_BACKEND of the leaderboard to rescore")
+    score.add_argument("--output", required=True, help="CSV to write, in the leaderboard.csv format")
+    args = parser.parse_args(argv)
+
+    columns = AnswerColumns(args.columns, args.answers)
+    started = time.perf_counter()
+    if args.command == "compact":
+        added = columns.compact()
+        print(f"added {added} answers ({columns.meta()['rows']} in total) "
+              f"in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    cols, meta = columns.load()
+    if args.command == "compare":
+        baseline = rescore(cols, meta, args.rules[0])
+        summaries = [distribution(cols, meta, baseline)]
+        summaries += [distribution(cols, meta, rescore(cols, meta, r), baseline) for r in args.rules[1:]]
+        print(f"{meta['rows']} answers of {len(meta['players'])} players")
+        for i, rules in enumerate(args.rules):
+            print(f"[{i}] max_time={rules.max_time:g} penalty={rules.penalty:g}"
+                  + (f" questions={rules.questions}" if rules.questions else ""))
+        keys = list(summaries[-1])
+        print(f"{'':<22}" + "".join(f"{f'[{i}]':>14}" for i in range(len(summaries))))
+        for key in keys:
+            cells = (s.get(key) for s in summaries)
+            print(f"{key:<22}" + "".join(
+                f"{'':>14}" if v is None else f"{v:>14,.2f}" if isinstance(v, float) else f"{v:>14,}"
+                for v in cells
+            ))
+    else:
+        rewards = rescore(cols, meta, args.rules)
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(LEADERBOARD_FIELDS)
+            n = 0
+            for row in rescored_rows(cols, meta, rewards, open_store(args.backend).all_rows()):
+                writer.writerow([row["username"], row["capital"], row["category"] or "",
+                                 row["timestamp"] if row["timestamp"] is not None else ""])
+                n += 1
+        print(f"wrote {n} rescored rows to {args.output}; load them into a fresh store with leaderboard_merge.py")
+    print(f"done in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Persistent player sessions, so a dropped connection or server restart can resume.
+
+Each player's progress is kept as a compact JSON snapshot keyed by username
+and guarded by a random resume token. snapshot() only updates an in-memory
+copy and marks it dirty; a background thread writes dirty snapshots to
+SQLite every SESSION_FLUSH_INTERVAL seconds in one transaction. A failed
+write leaves the snapshots dirty for the next attempt. In-memory copies
+idle for longer than SESSION_TTL are dropped after they are written.
+"""
+import atexit
+import hmac
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+
+SESSIONS_DB = "sessions.db"
+SESSION_FLUSH_INTERVAL = 2.0  # seconds between writes of changed snapshots
+SESSION_TTL = 30 * 60  # seconds before an idle snapshot leaves memory
+
+logger = logging.getLogger(__name__)
+
+
+def new_token():
+    """Short random resume code to hand to the player."""
+    return secrets.token_urlsafe(6)
+
+
+class _Entry:
+    __slots__ = ("token", "blob", "last_seen", "dirty")
+
+    def __init__(self, token, blob, last_seen, dirty):
+        self.token = token
+        self.blob = blob  # compact JSON of the state
+        self.last_seen = last_seen
+        self.dirty = dirty
+
+
+class SessionStore:
+    """Debounced snapshot store shared by every session of a process."""
+
+    def __init__(self, path=SESSIONS_DB, flush_interval=SESSION_FLUSH_INTERVAL, ttl=SESSION_TTL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # username -> _Entry
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        with self._conn_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " username TEXT PRIMARY KEY, token TEXT NOT NULL,"
+                " state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def snapshot(self, username, token, state):
+        """Remember the latest state of a player; nothing is written if it is unchanged."""
+        blob = json.dumps(state, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self._entries[username] = _Entry(token, blob, now, True)
+            else:
+                entry.last_seen = now
+                if entry.blob != blob or entry.token != token:
+                    entry.token = token
+                    entry.blob = blob
+                    entry.dirty = True
+
+    def load(self, username, token):
+        """Return the saved state for username if token matches, else None."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry.last_seen = time.time()
+                return json.loads(entry.blob) if hmac.compare_digest(entry.token, token) else None
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT token, state FROM sessions WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None or not hmac.compare_digest(row[0], token):
+            return None
+        with self._lock:
+            self._entries.setdefault(username, _Entry(row[0], row[1], time.time(), False))
+        return json.loads(row[1])
+
+    def flush(self):
+        """Write every changed snapshot now and evict idle ones."""
+        now = time.time()
+        with self._lock:
+            dirty = [
+                (name, e.token, e.blob, now)
+                for name, e in self._entries.items() if e.dirty
+            ]
+            for e in self._entries.values():
+                e.dirty = False
+        if dirty:
+            try:
+                with self._conn_lock, self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO sessions (username, token, state, updated)"
+                        " VALUES (?, ?, ?, ?)",
+                        dirty,
+                    )
+            except Exception:
+                # Entries changed since are dirty already; the rest must be written again
+                with self._lock:
+                    for name, *_ in dirty:
+                        entry = self._entries.get(name)
+                        if entry is not None:
+                            entry.dirty = True
+                raise
+        with self._lock:
+            for name in [n for n, e in self._entries.items()
+                         if not e.dirty and now - e.last_seen > self.ttl]:
+                del self._entries[name]
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("session-flush failed; retrying in %.1fs", self.flush_interval)
@@ -0,0 +1,109 @@
+"""Cold-start benchmark: time to first render of the login screen and the quiz.
+
+Every run starts a fresh Python process in an empty working directory, so
+imports, data loading and store creation are paid exactly as by a newly
+started server. The child renders app.py with Streamlit's AppTest and
+reports how long it took until:
+
+- login:    the login screen is rendered (first script run of the process)
+- quiz:     a player has logged in and sees the category selection
+- question: the first question of a category is on screen
+
+Times are measured from the child's first line, imports included. The
+median over all runs is checked against a budget; the exit status is 1 if
+any phase is over it.
+
+    python startup_bench.py --runs 5 --budget-login 1200 --budget-quiz 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+START = time.perf_counter()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+PHASES = ("login", "quiz", "question")
+BUDGET_MS = {"login": 1200, "quiz": 1500, "question": 1800}
+
+
+def _ms():
+    return (time.perf_counter() - START) * 1000
+
+
+def child():
+    """One cold start; prints the phase times as JSON."""
+    from streamlit.testing.v1 import AppTest
+
+    times = {"import": _ms()}
+    at = AppTest.from_file(APP_FILE, default_timeout=60).run()
+    times["login"] = _ms()
+
+    at.text_input[0].input("bench")
+    next(b for b in at.button if b.label == "Continue").click().run()
+    times["quiz"] = _ms()
+
+    next(b for b in at.button if b.label == "Start Category").click().run()
+    at.run()  # the start button only takes effect on the next rerun
+    times["question"] = _ms()
+
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].message}")
+    if not any(b.label == "Submit Answer" for b in at.button):
+        raise RuntimeError("the first question was not rendered")
+    print(json.dumps(times))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    for phase in PHASES:
+        parser.add_argument(f"--budget-{phase}", type=float, default=BUDGET_MS[phase],
+                            help=f"ms allowed until the {phase} render (median)")
+    parser.add_argument("--backend", help="LEADERBOARD_BACKEND for the runs")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        sys.path.insert(0, APP_DIR)
+        child()
+        return 0
+
+    env = dict(os.environ)
+    if args.backend:
+        env["LEADERBOARD_BACKEND"] = args.backend
+    runs = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child"],
+                cwd=workdir, env=env, capture_output=True, text=True, check=False,
+            )
+        if out.returncode:
+            sys.stderr.write(out.stderr)
+            return 2
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    over = False
+    print(f"cold starts: {len(runs)}")
+    print(f"{'phase':<10}{'median':>10}{'max':>10}{'budget':>10}")
+    for phase in ("import", *PHASES):
+        values = [r[phase] for r in runs]
+        median = statistics.median(values)
+        budget = getattr(args, f"budget_{phase}", None)
+        flag = ""
+        if budget is not None and median > budget:
+            over = True
+            flag = "  OVER BUDGET"
+        budget_text = f"{budget:.0f}ms" if budget is not None else "-"
+        print(f"{phase:<10}{median:>8.0f}ms{max(values):>8.0f}ms{budget_text:>10}{flag}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
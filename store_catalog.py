@@ -0,0 +1,107 @@
+"""Indexed store catalog: item lookups, filters, text search and pages.
+
+Catalog is compiled once per load of store_items.json, next to the question
+bank, and shared by every session. Items are found by name or id in one
+dict lookup. Each category, and the whole catalog, keeps its items sorted
+by price, so a price range is two binary searches. Every word of an item's
+name and category is indexed, and a query matches the items that have a
+word starting with each of its words. Results keep catalog order and are
+cached per filter, so a store rerun costs a dict lookup plus rendering the
+one page it shows.
+"""
+import bisect
+import functools
+import re
+from collections import namedtuple
+from types import MappingProxyType
+
+PAGE_SIZE = 12  # items per store page
+SEARCH_CACHE_SIZE = 256  # filter combinations kept per catalog
+
+# number counts from 1; pages is at least 1 so an empty result still has a page
+Page = namedtuple("Page", ["items", "number", "pages", "total"])
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+class _PriceIndex:
+    """Catalog positions sorted by price."""
+
+    __slots__ = ("prices", "positions")
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.prices = [price for price, _ in entries]
+        self.positions = [position for _, position in entries]
+
+    def between(self, min_price, max_price):
+        lo = 0 if min_price is None else bisect.bisect_left(self.prices, min_price)
+        hi = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, max_price)
+        return self.positions[lo:hi]
+
+
+class Catalog:
+    """The store items in file order, with their indexes; immutable."""
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        self.by_name = MappingProxyType({item.name: item for item in self.items})
+        self.by_id = MappingProxyType({item.id: item for item in self.items})
+        by_category = {}
+        for position, item in enumerate(self.items):
+            by_category.setdefault(item.category, []).append(position)
+        self.categories = tuple(by_category)
+        self._by_price = _PriceIndex((item.price, p) for p, item in enumerate(self.items))
+        self._category_by_price = {
+            category: _PriceIndex((self.items[p].price, p) for p in positions)
+            for category, positions in by_category.items()
+        }
+        words = {}
+        for position, item in enumerate(self.items):
+            for word in _words(f"{item.name} {item.category}"):
+                words.setdefault(word, set()).add(position)
+        self._words = sorted(words)
+        self._word_positions = [frozenset(words[w]) for w in self._words]
+        self.search = functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._search)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        """The item with this name or id, or None."""
+        return self.by_name.get(key) or self.by_id.get(key)
+
+    def price_range(self):
+        """(lowest, highest) price in the catalog; (0, 0) when empty."""
+        prices = self._by_price.prices
+        return (prices[0], prices[-1]) if prices else (0, 0)
+
+    def _search(self, query="", category=None, min_price=None, max_price=None):
+        """Items matching every given filter, in catalog order (a tuple; cached)."""
+        index = self._by_price if category is None else self._category_by_price.get(category)
+        if index is None:
+            return ()
+        positions = index.between(min_price, max_price)
+        for word in _words(query or ""):
+            matches = self._prefix(word)
+            positions = [p for p in positions if p in matches]
+        return tuple(self.items[p] for p in sorted(positions))
+
+    def _prefix(self, word):
+        """Positions of the items with a word starting with word."""
+        i = bisect.bisect_left(self._words, word)
+        matches = set()
+        while i < len(self._words) and self._words[i].startswith(word):
+            matches |= self._word_positions[i]
+            i += 1
+        return matches
+
+    @staticmethod
+    def page(items, number=1, size=PAGE_SIZE):
+        """One Page of items; number is clamped to the pages there are."""
+        pages = max(1, -(-len(items) // size))
+        number = min(max(1, number), pages)
+        start = (number - 1) * size
+        return Page(items[start:start + size], number, pages, len(items))
@@ -0,0 +1,50 @@
+"""In-memory username registry used by the login screen.
+
+Taken names are loaded from the leaderboard store once per process, on first
+use or when the server warms its caches at boot, and kept in a set. For
+every base name the next "name (k)" suffix to try is remembered, so a class
+of students all typing "Student" gets "Student (1)", "Student (2)", ...
+without rescanning anything.
+"""
+import threading
+
+
+class UsernameRegistry:
+    """Allocates unique player names; safe to share between sessions."""
+
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self._taken = None
+        self._next_suffix = {}
+
+    def load(self):
+        """Read the taken names from the store, if not done yet."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._taken is None:
+            self._taken = self._store.usernames()
+
+    def __contains__(self, name):
+        self.load()
+        return name in self._taken
+
+    def allocate(self, base):
+        """Reserve and return base, or the first free "base (k)"."""
+        with self._lock:
+            self._load()
+            chosen = base
+            suffix = self._next_suffix.get(base, 1)
+            while True:
+                if chosen not in self._taken:
+                    self._taken.add(chosen)
+                    # Another process may have claimed it since we loaded.
+                    if self._store.register_username(chosen):
+                        break
+                chosen = f"{base} ({suffix})"
+                suffix += 1
+            if chosen != base:
+                self._next_suffix[base] = suffix
+            return chosen
@@ -0,0 +1,38 @@
+"""Background warm-up of the shared caches at server boot.
+
+The first player to open a page should not pay for parsing the question
+bank, folding the leaderboard log into its views, loading the taken
+usernames, ranking the players, replaying the capital ledger or importing
+pandas. warm_up() does all of that on a background thread as soon as a
+server process runs its first script, while that first script goes on to
+render the login screen.
+"""
+import importlib
+import logging
+import time
+
+from game_data import get_game_data
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(store, registry, leaderboard_size, ledger, ranks):
+    """Fill the process-wide caches; failures are logged and left for first use."""
+    steps = (
+        ("game_data", get_game_data),
+        ("leaderboard", lambda: (store.top(leaderboard_size), store.top_players(leaderboard_size))),
+        ("usernames", registry.load),
+        ("ranks", ranks.load),
+        ("ledger", ledger.balances),
+        # Only the leaderboard, instructor and host pages draw tables or charts
+        ("pandas", lambda: importlib.import_module("pandas")),
+    )
+    start = time.perf_counter()
+    for name, step in steps:
+        try:
+            with metrics.timer(f"warmup.{name}"):
+                step()
+        except Exception:
+            logger.exception("warm-up step %s failed", name)
+    logger.info("caches warmed in %.0f ms", (time.perf_counter() - start) * 1000)